@@ -0,0 +1,138 @@
+"""
+Benchmarks the unified board renderer (chat/render.py) against the per-call string
+building implementations it replaced, and checks that both produce identical text.
+
+Run from the repo root:
+    python benchmarks/bench_render.py [--repeats 50]
+
+The FENs of data/chess_challenges_test_2k.csv are tiled `repeats` times and shuffled,
+which mimics dataset building where the same placements show up many times.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from collections import defaultdict
+
+import pandas as pd
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+
+from chat import render  # noqa: E402
+
+
+# ====================================================
+# Reference implementations (as they were before chat/render.py)
+# ====================================================
+def legacy_fen_to_description(fen: str) -> str:
+    piece_map = {
+        "K": "King", "Q": "Queen", "R": "Rook", "B": "Bishop", "N": "Knight", "P": "Pawn",
+        "k": "King", "q": "Queen", "r": "Rook", "b": "Bishop", "n": "Knight", "p": "Pawn",
+    }
+    fen_parts = fen.split()
+    ranks = fen_parts[0].split("/")
+    turn = "White to move." if fen_parts[1] == "w" else "Black to move."
+    board = []
+    for r, rank in enumerate(ranks):
+        row = []
+        file = 0
+        for char in rank:
+            if char.isdigit():
+                file += int(char)
+            elif char in piece_map:
+                row.append((char, file, 8 - r))
+                file += 1
+        board.extend(row)
+    piece_positions = defaultdict(list)
+    for piece, file, rank in board:
+        color = "White" if piece.isupper() else "Black"
+        piece_positions[(color, piece_map[piece])].append(f"{chr(file + 97)}{rank}")
+    description = [turn]
+    for (color, piece_type), positions in sorted(piece_positions.items(), key=lambda x: (x[0][0], x[0][1])):
+        description.append(f"{color} {piece_type}{'s' if len(positions) > 1 else ''} on {', '.join(positions)}.")
+    return "\n".join(description)
+
+
+def legacy_fen_to_grid(fen: str) -> str:
+    board_grid = []
+    for rank in fen.split()[0].split('/'):
+        row = []
+        for char in rank:
+            if char.isdigit():
+                row.extend(['.'] * int(char))
+            elif char.isalpha():
+                row.append(char)
+        board_grid.append(" ".join(row))
+    return "\n".join(board_grid)
+
+
+def legacy_fen_to_natural(fen: str) -> str:
+    piece_map = {
+        'K': 'White King', 'Q': 'White Queen', 'R': 'White Rook', 'B': 'White Bishop', 'N': 'White Knight', 'P': 'White Pawn',
+        'k': 'Black King', 'q': 'Black Queen', 'r': 'Black Rook', 'b': 'Black Bishop', 'n': 'Black Knight', 'p': 'Black Pawn'
+    }
+    board_fen, turn, castling, en_passant, halfmove, fullmove = fen.split()[:6]
+    board = []
+    for row in board_fen.split('/'):
+        expanded_row = ''
+        for char in row:
+            expanded_row += '.' * int(char) if char.isdigit() else char
+        board.append(expanded_row)
+    natural_description = [f"{'White' if turn == 'w' else 'Black'} to move."]
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece != '.':
+                natural_description.append(f"{piece_map[piece]} on {chr(97 + c)}{8 - r}.")
+    if castling != '-':
+        castling_rights = ' '.join([f"{('White' if c.isupper() else 'Black')} {'King-side' if c in 'Kk' else 'Queen-side'} castling" for c in castling])
+        natural_description.append(f"Castling rights: {castling_rights}.")
+    if en_passant != '-':
+        natural_description.append(f"En Passant available on {en_passant}.")
+    natural_description.append(f"Move number: {fullmove}.")
+    return ' '.join(natural_description)
+
+
+LEGACY = {
+    "desc": legacy_fen_to_description,
+    "grid": legacy_fen_to_grid,
+    "natural": legacy_fen_to_natural,
+}
+
+
+def _time(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", default=os.path.join(REPO_ROOT, "data", "chess_challenges_test_2k.csv"))
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    unique_fens = pd.read_csv(args.csv)["FEN"].tolist()
+    fens = unique_fens * args.repeats
+    random.Random(0).shuffle(fens)
+    column = pd.Series(fens, name="FEN")
+    print(f"{len(fens)} FENs ({len(unique_fens)} unique)\n")
+    print(f"{'style':<8} | {'legacy (s)':>10} | {'render (s)':>10} | {'render_many (s)':>15} | {'speedup':>8}")
+    print("-" * 66)
+
+    for style, legacy in LEGACY.items():
+        expected = [legacy(fen) for fen in unique_fens]
+        assert [render.render(fen, style) for fen in unique_fens] == expected, f"{style} output mismatch"
+
+        legacy_s = _time(lambda: [legacy(fen) for fen in fens])
+        render.clear_cache()
+        render_s = _time(lambda: [render.render(fen, style) for fen in fens])
+        render.clear_cache()
+        many_s = _time(render.render_many, column, style)
+        print(f"{style:<8} | {legacy_s:>10.3f} | {render_s:>10.3f} | {many_s:>15.3f} | {legacy_s / many_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
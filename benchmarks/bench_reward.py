@@ -0,0 +1,110 @@
+"""
+Benchmarks the batched reward scorer (chat/reward.py) against the naive per-sample path
+(json.loads of the stored reward model and an uncompiled answer regex for every rollout),
+and checks that both give the same rewards.
+
+Run from the repo root:
+    python benchmarks/bench_reward.py [--rollouts-per-prompt 16] [--num-workers 4]
+
+Rollouts are synthesized from data/chess_challenges_test_2k.csv: per prompt a mix of best,
+random legal, illegal and unformatted answers, grouped by prompt as in a veRL batch.
+"""
+import os
+import re
+import ast
+import sys
+import json
+import time
+import random
+import argparse
+
+import pandas as pd
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+
+from chat import reward  # noqa: E402
+from chat.utility import ExtractionError  # noqa: E402
+
+
+# ====================================================
+# Reference implementation (per sample, no caching)
+# ====================================================
+def legacy_extract_answer(text: str) -> str:
+    match = re.search(r"<answer>(.*?)</answer>", text, re.DOTALL)
+    if not match:
+        raise ExtractionError("No <answer> tags found.")
+    extracted = re.sub(r'^["\']|["\']$', "", match.group(1).strip())
+    if not re.fullmatch(r"[A-Za-z0-9 *#]+", extracted):
+        raise ExtractionError("Extracted text contains invalid characters.")
+    return extracted
+
+
+def naive_score(response: str, reward_model: str) -> float:
+    ground_truth = json.loads(reward_model)["ground_truth"]
+    try:
+        move = legacy_extract_answer(response)
+    except ExtractionError:
+        return reward.FORMAT_ERROR_REWARD
+    return ground_truth.get(move, reward.ILLEGAL_MOVE_REWARD)
+
+
+def make_rollouts(csv: str, rollouts_per_prompt: int):
+    rng = random.Random(0)
+    responses, json_truths, struct_truths = [], [], []
+    df = pd.read_csv(csv)
+    for moves_text, probs_text in zip(df["Move"], df["Win Probability"]):
+        moves = ast.literal_eval(moves_text)
+        probs = ast.literal_eval(probs_text)
+        reward_model = {"style": "rule", "ground_truth": dict(zip(moves, probs))}
+        struct_truth = {"moves": moves, "rewards": probs}
+        best = moves[max(range(len(moves)), key=probs.__getitem__)]
+        for _ in range(rollouts_per_prompt):
+            kind = rng.random()
+            move = rng.choice(moves) if kind < 0.6 else best if kind < 0.8 else "a1a1"
+            if kind < 0.9:
+                responses.append(f"<think> {'hmm ' * 50}</think> <answer> {move} </answer>")
+            else:
+                responses.append(f"<think> {'hmm ' * 50}</think> I would play {move}")
+            # veRL decodes the reward model per row, so every rollout gets its own text
+            json_truths.append(json.dumps(reward_model))
+            struct_truths.append(struct_truth)
+    return responses, json_truths, struct_truths
+
+
+def _time(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", default=os.path.join(REPO_ROOT, "data", "chess_challenges_test_2k.csv"))
+    parser.add_argument("--rollouts-per-prompt", type=int, default=16)
+    parser.add_argument("--num-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    responses, json_truths, struct_truths = make_rollouts(args.csv, args.rollouts_per_prompt)
+    n = len(responses)
+    print(f"{n} rollouts ({n // args.rollouts_per_prompt} prompts)\n")
+    print(f"{'path':<28} | {'time (s)':>8} | {'rollouts/s':>11} | {'speedup':>8}")
+    print("-" * 65)
+
+    naive_s, expected = _time(lambda: [naive_score(r, g) for r, g in zip(responses, json_truths)])
+    print(f"{'naive per-sample (JSON)':<28} | {naive_s:>8.3f} | {n / naive_s:>11,.0f} | {1:>7.1f}x")
+
+    runs = [("batched (JSON)", json_truths, 0), ("batched (struct)", struct_truths, 0)]
+    if args.num_workers > 0:
+        runs.append((f"batched (JSON, {args.num_workers} procs)", json_truths, args.num_workers))
+    for name, truths, num_workers in runs:
+        with reward.RewardScorer(num_workers=num_workers) as scorer:
+            scorer.score(responses, truths)  # start the workers
+            reward.clear_cache()
+            seconds, scores = _time(scorer.score, responses, truths)
+        assert scores.tolist() == expected, f"{name} rewards mismatch"
+        print(f"{name:<28} | {seconds:>8.3f} | {n / seconds:>11,.0f} | {naive_s / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
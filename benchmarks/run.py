@@ -0,0 +1,375 @@
+"""
+Offline micro-benchmark suite for the hot paths of the repo, with regression baselines.
+
+Every benchmark uses checked-in or synthetic inputs only: data/chess_challenges_test_2k.csv,
+a small synthetic Bagz file written to a temporary directory, and MockEngine players instead
+of Stockfish. Each benchmark is run `--repeats` times and the fastest run is kept.
+
+Run from the repo root:
+    python benchmarks/run.py                     # run all, write results, compare to the baseline
+    python benchmarks/run.py --only bagz chat    # run benchmarks whose name contains a filter
+    python benchmarks/run.py --update-baseline   # store this run as benchmarks/baseline.json
+
+Results are written as JSON ({name: {"seconds", "ops", "ops_per_sec", "relative", "noise"}}
+plus machine info). Absolute timings drift by tens of percent between runs on a shared
+machine, so the regression check compares relative timings instead: before every repeat of
+a benchmark a fixed pure-Python calibration loop is timed, and "relative" is the fastest
+benchmark run divided by the fastest calibration run. "noise" is the spread of the repeats
+((median - fastest) / fastest). The run fails (exit code 1) if a benchmark's relative timing
+is above its baseline by more than `--threshold` (a fraction, default 0.3) plus three times
+the larger noise of the two runs, the noise allowance being capped at `--threshold` so a 2x
+slowdown always fails. Benchmarks that mostly sleep (simulated engine latency)
+are not normalized.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import tempfile
+import subprocess
+import contextlib
+from typing import Callable, Dict, Tuple
+
+import pandas as pd
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(1, os.path.join(REPO_ROOT, "elo_evaluator"))
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(REPO_ROOT, "data", "chess_challenges_test_2k.csv")
+
+# name -> setup function returning (callable to time, number of operations per call)
+BENCHMARKS: Dict[str, Callable[["Fixtures"], Tuple[Callable[[], object], int]]] = {}
+# Benchmarks whose timing is dominated by sleeping rather than by the CPU
+UNNORMALIZED = set()
+
+
+def benchmark(name: str, normalize: bool = True):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        if not normalize:
+            UNNORMALIZED.add(name)
+        return setup
+    return register
+
+
+def calibration_loop():
+    """A fixed CPU-bound workload (interpreter, dicts, strings) that benchmark timings are divided by."""
+    counts = {}
+    for i in range(20_000):
+        key = str(i % 97)
+        counts[key] = counts.get(key, 0) + i
+    return sum(counts.values())
+
+
+class Fixtures:
+    """Shared inputs, built on first use."""
+
+    def __init__(self, tmp_dir: str):
+        self.tmp_dir = tmp_dir
+        self._df = None
+        self._bag_path = None
+        self._long_games = None
+
+    @property
+    def df(self) -> pd.DataFrame:
+        if self._df is None:
+            from data.loader import load_challenge_moves_csv
+
+            self._df = load_challenge_moves_csv(CSV_PATH, shuffle=False)
+        return self._df
+
+    @property
+    def bag_path(self) -> str:
+        """A 20k-record Bagz file of action-value-like records."""
+        if self._bag_path is None:
+            from data.data_preparation.utils import bagz
+
+            path = os.path.join(self.tmp_dir, "synthetic.bag")
+            rng = random.Random(0)
+            fens = self.df["FEN"].tolist()
+            with bagz.BagWriter(path) as writer:
+                for i in range(20_000):
+                    record = f"{fens[i % len(fens)]}|e2e4|{rng.random():.6f}".encode()
+                    writer.write(record)
+            self._bag_path = path
+        return self._bag_path
+
+    @property
+    def long_games(self):
+        """Move lists of 20 MockEngine self-play games, played until python-chess ends them (75-move rule, ...)."""
+        if self._long_games is None:
+            import chess
+            from engine.mock import MockEngine
+
+            self._long_games = []
+            for seed in range(20):
+                engines = (MockEngine("white", seed), MockEngine("black", seed + 20))
+                board = chess.Board()
+                while not board.is_game_over():
+                    board.push(engines[len(board.move_stack) % 2].play(board))
+                self._long_games.append(board.move_stack)
+        return self._long_games
+
+
+# ====================================================
+# Benchmarks
+# ====================================================
+@benchmark("chat.fen_to_description")
+def _fen_to_description(fixtures: Fixtures):
+    from chat import render
+    from chat.utility import fen_to_description
+
+    fens = fixtures.df["FEN"].tolist()
+
+    def run():
+        render.clear_cache()
+        return [fen_to_description(fen) for fen in fens]
+    return run, len(fens)
+
+
+@benchmark("chat.format_prompt[desc]")
+def _format_prompt(fixtures: Fixtures):
+    from chat import render
+    from chat.utility import format_prompt
+
+    rows = list(zip(fixtures.df["FEN"], fixtures.df["Move"]))
+
+    def run():
+        random.seed(0)
+        render.clear_cache()
+        return [format_prompt(fen, moves, "desc") for fen, moves in rows]
+    return run, len(rows)
+
+
+@benchmark("chat.extract_answer")
+def _extract_answer(fixtures: Fixtures):
+    from chat.utility import ExtractionError, extract_answer
+
+    rng = random.Random(0)
+    responses = [
+        f"<think> {'let me think ' * 40}</think> <answer> {moves[0]} </answer>"
+        if rng.random() < 0.9 else f"<think> {'hmm ' * 40}</think> {moves[0]}"
+        for moves in fixtures.df["Move"]
+    ] * 10
+
+    def run():
+        answers = []
+        for response in responses:
+            try:
+                answers.append(extract_answer(response))
+            except ExtractionError:
+                answers.append(None)
+        return answers
+    return run, len(responses)
+
+
+@benchmark("data.load_challenge_moves_csv[UCI]")
+def _load_csv_uci(fixtures: Fixtures):
+    from data.loader import load_challenge_moves_csv
+
+    return (lambda: load_challenge_moves_csv(CSV_PATH, move_notation="UCI")), 2000
+
+
+@benchmark("data.load_challenge_moves_csv[PGN]")
+def _load_csv_pgn(fixtures: Fixtures):
+    from data.loader import load_challenge_moves_csv
+
+    return (lambda: load_challenge_moves_csv(CSV_PATH, move_notation="PGN")), 2000
+
+
+@benchmark("bagz.read_sequential")
+def _bag_sequential(fixtures: Fixtures):
+    from data.data_preparation.utils import bagz
+
+    reader = bagz.BagFileReader(fixtures.bag_path)
+    return (lambda: [reader[i] for i in range(len(reader))]), len(reader)
+
+
+@benchmark("bagz.read_random")
+def _bag_random(fixtures: Fixtures):
+    from data.data_preparation.utils import bagz
+
+    reader = bagz.BagFileReader(fixtures.bag_path)
+    indices = list(range(len(reader)))
+    random.Random(0).shuffle(indices)
+    return (lambda: [reader[i] for i in indices]), len(indices)
+
+
+@benchmark("elo.play_game[mock]")
+def _play_game(fixtures: Fixtures):
+    import chess
+    from engine.mock import MockEngine
+    from game import _play_game
+
+    num_games = 20
+
+    def run():
+        games = []
+        # _play_game prints the start / end FEN of every game
+        with contextlib.redirect_stdout(io.StringIO()):
+            for seed in range(num_games):
+                engines = (MockEngine("white", seed), MockEngine("black", seed + num_games))
+                games.append(_play_game(engines, ("white", "black"), "white", chess.Board(), MockEngine("eval")))
+        return games
+    return run, num_games
+
+
+def _play_timed_games(pipeline: bool):
+    import chess
+    from engine.mock import MockEngine
+    from game import _play_game
+
+    num_games = 3
+    # Every search and adjudication takes 2 ms, as a stand-in for engine latency
+    think_time = 0.002
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for seed in range(num_games):
+                engines = (MockEngine("white", seed, think_time), MockEngine("black", seed + num_games, think_time))
+                _play_game(engines, ("white", "black"), "white", chess.Board(), MockEngine("eval", think_time=think_time), pipeline=pipeline)
+    return run, num_games
+
+
+@benchmark("elo.play_game[sequential, 2ms]", normalize=False)
+def _play_game_sequential(fixtures: Fixtures):
+    return _play_timed_games(pipeline=False)
+
+
+@benchmark("elo.play_game[pipelined, 2ms]", normalize=False)
+def _play_game_pipelined(fixtures: Fixtures):
+    return _play_timed_games(pipeline=True)
+
+
+@benchmark("elo.termination[board]")
+def _termination_board(fixtures: Fixtures):
+    import chess
+
+    games = fixtures.long_games
+
+    def run():
+        # The loop condition _play_game used before TerminationTracker, checked after every ply
+        for moves in games:
+            board = chess.Board()
+            for move in moves:
+                board.push(move)
+                board.is_game_over() or board.can_claim_fifty_moves() or board.is_repetition()
+    return run, sum(map(len, games))
+
+
+@benchmark("elo.termination[tracker]")
+def _termination_tracker(fixtures: Fixtures):
+    import chess
+    from game import TerminationTracker
+
+    games = fixtures.long_games
+
+    def run():
+        for moves in games:
+            tracker = TerminationTracker(chess.Board())
+            for move in moves:
+                tracker.push(move)
+                tracker.is_over()
+    return run, sum(map(len, games))
+
+
+@benchmark("cli.startup[--help]")
+def _cli_startup(fixtures: Fixtures):
+    command = [sys.executable, os.path.join(REPO_ROOT, "cli.py"), "--help"]
+    return (lambda: subprocess.run(command, check=True, stdout=subprocess.DEVNULL)), 1
+
+
+# ====================================================
+# Runner
+# ====================================================
+def _time(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run_benchmarks(names, repeats: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixtures = Fixtures(tmp_dir)
+        for name in names:
+            fn, ops = BENCHMARKS[name](fixtures)
+            fn()  # warm up (imports, page cache)
+            times, calibration = [], []
+            # Interleaved, so the calibration sees the same machine load as the benchmark
+            for _ in range(repeats):
+                calibration.append(_time(calibration_loop))
+                times.append(_time(fn))
+            seconds = min(times)
+            relative = seconds if name in UNNORMALIZED else seconds / min(calibration)
+            noise = statistics.median(times) / seconds - 1
+            results[name] = {"seconds": seconds, "ops": ops, "ops_per_sec": ops / seconds, "relative": relative, "noise": noise}
+            print(f"{name:<36} {seconds * 1e3:>10.2f} ms {ops / seconds:>14,.0f} ops/s {relative:>10.3f} rel {noise:>+7.1%} noise")
+    return results
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> bool:
+    """Prints the change of the relative timings against the baseline and returns whether every benchmark passed."""
+    print(f"\n{'benchmark':<36} {'baseline (ms)':>14} {'now (ms)':>10} {'change':>8} {'allowed':>8}")
+    print("-" * 81)
+    passed = True
+    for name, result in results.items():
+        if name not in baseline or "relative" not in baseline[name]:
+            print(f"{name:<36} {'-':>14} {result['seconds'] * 1e3:>10.2f} {'new':>8}")
+            continue
+        before = baseline[name]
+        change = result["relative"] / before["relative"] - 1
+        allowed = threshold + min(3 * max(result["noise"], before["noise"]), threshold)
+        status = ""
+        if change > allowed:
+            status, passed = "  REGRESSION", False
+        print(f"{name:<36} {before['seconds'] * 1e3:>14.2f} {result['seconds'] * 1e3:>10.2f} {change:>+8.1%} {allowed:>+8.0%}{status}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", nargs="+", default=None, help="Run benchmarks whose name contains any of these.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join(BENCHMARK_DIR, "results.json"))
+    parser.add_argument("--baseline", default=os.path.join(BENCHMARK_DIR, "baseline.json"))
+    parser.add_argument("--threshold", type=float, default=0.3, help="Allowed slowdown of the relative timing as a fraction of the baseline, plus up to as much again for measured noise.")
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run to the baseline file.")
+    args = parser.parse_args()
+
+    names = [n for n in BENCHMARKS if args.only is None or any(f in n for f in args.only)]
+    results = run_benchmarks(names, args.repeats)
+    report = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor()},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        # Keep the baselines of benchmarks that were not run this time
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r") as f:
+                report["results"] = {**json.load(f)["results"], **results}
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one.")
+        return
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)["results"]
+    if not compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,9 @@
-from .ollama import OllamaSession
-from .utility import *
\ No newline at end of file
+from .utility import *
+
+
+def __getattr__(name):
+    # ollama (and its HTTP client) is only imported once a session is needed
+    if name == "OllamaSession":
+        from .ollama import OllamaSession
+        return OllamaSession
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,199 @@
+"""
+Legal-move constrained sampling for Hugging Face causal LMs (replaces `generate_move_samples`
+in chess_sft_qwen_base.ipynb).
+
+The legal UCI moves of the position are tokenized into a trie, the prompt is run through the
+model once and its KV cache is shared by all `k` samples, which are then decoded as one
+batch, one token per step, with the logits of every sample masked to the children of its
+trie node. Every sample is therefore a legal move, and a move costs one prompt forward pass
+plus (move length in tokens) single-token batched passes.
+
+Self check on CPU with a tiny randomly initialised model (from the repo root):
+    python -m chat.decoding --tokenizer gpt2
+or, without downloading a tokenizer, `python -m pytest tests/test_decoding.py`.
+"""
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional
+
+import chess
+import torch
+
+from .render import render_description
+
+
+# ====================================================
+# Move trie
+# ====================================================
+class _TrieNode:
+    __slots__ = ("children", "move")
+
+    def __init__(self):
+        self.children: Dict[int, "_TrieNode"] = {}
+        self.move: Optional[str] = None
+
+
+class MoveTrie:
+    def __init__(self, tokenizer, moves: List[str], prefix: str = " "):
+        """
+        Token trie over a set of moves.
+
+        Args:
+            tokenizer: A Hugging Face tokenizer.
+            moves (List[str]): The legal moves (UCI moves are prefix-free, so every leaf is
+                exactly one move).
+            prefix (str): Text before the move in the training data, e.g. the space in
+                "<answer> e2e4", so the move is tokenized as it was during training.
+        """
+        self.root = _TrieNode()
+        self.depth = 0
+        for move in moves:
+            # BPE tokenizers merge the prefix into the first token (" e2"), others give it its
+            # own token, which is then simply shared by all moves
+            ids = tokenizer.encode(prefix + move, add_special_tokens=False)
+            node = self.root
+            for token in ids:
+                node = node.children.setdefault(token, _TrieNode())
+            node.move = move
+            self.depth = max(self.depth, len(ids))
+
+
+# ====================================================
+# Sampling
+# ====================================================
+def _expand_cache(past_key_values, k: int):
+    """Repeats a batch-1 KV cache k times along the batch dimension."""
+    if hasattr(past_key_values, "batch_repeat_interleave"):
+        past_key_values.batch_repeat_interleave(k)
+        return past_key_values
+    return tuple(tuple(t.repeat_interleave(k, dim=0) for t in layer) for layer in past_key_values)
+
+
+@torch.no_grad()
+def sample_moves(
+    model,
+    tokenizer,
+    prompt: str,
+    legal_moves: List[str],
+    k: int = 5,
+    temperature: float = 1.0,
+    generator: Optional[torch.Generator] = None,
+) -> List[str]:
+    """
+    Samples k legal moves for a prompt in one batch.
+
+    Args:
+        model: A Hugging Face causal LM.
+        tokenizer: Its tokenizer.
+        prompt (str): The full prompt, ending right before the move (e.g. "...\\n<answer>").
+        legal_moves (List[str]): The legal UCI moves of the position.
+        k (int): Number of samples.
+        temperature (float): Sampling temperature (0 for greedy, all samples then agree).
+        generator (Optional[torch.Generator]): RNG for reproducible sampling.
+
+    Returns:
+        List[str]: k legal moves.
+    """
+    if not legal_moves:
+        return []
+    trie = MoveTrie(tokenizer, legal_moves)
+    device = next(model.parameters()).device
+    input_ids = tokenizer(prompt, return_tensors="pt").input_ids.to(device)
+
+    outputs = model(input_ids=input_ids, use_cache=True)
+    past_key_values = _expand_cache(outputs.past_key_values, k)
+    logits = outputs.logits[:, -1, :].float().expand(k, -1)
+
+    nodes = [trie.root] * k
+    for _ in range(trie.depth):
+        # Mask every sample to the children of its trie node (finished samples take any token)
+        mask = torch.full_like(logits, float("-inf"))
+        for i, node in enumerate(nodes):
+            if node.children:
+                mask[i, list(node.children)] = 0.0
+            else:
+                mask[i, 0] = 0.0
+        masked = logits + mask
+        if temperature > 0:
+            probs = torch.softmax(masked / temperature, dim=-1)
+            next_tokens = torch.multinomial(probs, num_samples=1, generator=generator).squeeze(1)
+        else:
+            next_tokens = masked.argmax(dim=-1)
+
+        nodes = [node.children.get(token, node) for node, token in zip(nodes, next_tokens.tolist())]
+        if all(not node.children for node in nodes):
+            break
+        outputs = model(input_ids=next_tokens[:, None], past_key_values=past_key_values, use_cache=True)
+        past_key_values = outputs.past_key_values
+        logits = outputs.logits[:, -1, :].float()
+
+    return [node.move for node in nodes]
+
+
+def predict_move(model, tokenizer, fen: str, k: int = 5, temperature: float = 1.0) -> str:
+    """
+    Predicts a move for a position as the most common of k constrained samples, with the
+    prompt template of the SFT notebook.
+
+    Args:
+        model: A Hugging Face causal LM fine-tuned on board descriptions.
+        tokenizer: Its tokenizer.
+        fen (str): The position.
+        k (int): Number of samples.
+        temperature (float): Sampling temperature.
+
+    Returns:
+        str: The predicted UCI move.
+    """
+    legal_moves = [move.uci() for move in chess.Board(fen).legal_moves]
+    prompt = f"{render_description(fen)}\nThe best move is: \n<answer>"
+    samples = sample_moves(model, tokenizer, prompt, legal_moves, k=k, temperature=temperature)
+    return Counter(samples).most_common(1)[0][0]
+
+
+# ====================================================
+# Self check
+# ====================================================
+@torch.no_grad()
+def _reference_greedy(model, tokenizer, prompt: str, legal_moves: List[str]) -> str:
+    """Greedy constrained decoding without a KV cache (full forward pass per token)."""
+    trie = MoveTrie(tokenizer, legal_moves)
+    ids = tokenizer(prompt, return_tensors="pt").input_ids
+    node = trie.root
+    while node.children:
+        logits = model(input_ids=ids).logits[0, -1, :]
+        allowed = list(node.children)
+        token = allowed[int(logits[allowed].argmax())]
+        node = node.children[token]
+        ids = torch.cat([ids, torch.tensor([[token]])], dim=-1)
+    return node.move
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check constrained decoding with a tiny random model.")
+    parser.add_argument("--tokenizer", default="gpt2")
+    parser.add_argument("--csv", default="data/chess_challenges_test_2k.csv")
+    parser.add_argument("--positions", type=int, default=20)
+    parser.add_argument("--k", type=int, default=16)
+    args = parser.parse_args()
+
+    import pandas as pd
+    from transformers import AutoTokenizer, GPT2Config, GPT2LMHeadModel
+
+    torch.manual_seed(0)
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    config = GPT2Config(vocab_size=len(tokenizer), n_positions=1024, n_embd=64, n_layer=2, n_head=2)
+    model = GPT2LMHeadModel(config).eval()
+
+    for fen in pd.read_csv(args.csv)["FEN"][:args.positions]:
+        legal_moves = [move.uci() for move in chess.Board(fen).legal_moves]
+        prompt = f"{render_description(fen)}\nThe best move is: \n<answer>"
+        samples = sample_moves(model, tokenizer, prompt, legal_moves, k=args.k)
+        assert all(move in legal_moves for move in samples), f"Illegal sample in {samples}"
+        greedy = sample_moves(model, tokenizer, prompt, legal_moves, k=2, temperature=0)
+        assert greedy == [_reference_greedy(model, tokenizer, prompt, legal_moves)] * 2, "KV-cached greedy mismatch"
+    print(f"OK: {args.positions} positions, {args.k} legal samples each, cached greedy == uncached greedy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Legal-move / move-rank evaluation of chat models served by ollama (moved out of
+eval_models.ipynb so it can be run from the CLI).
+
+Positions are preprocessed once (moves sorted by win probability, a move -> rank dict), so
+an attempt only formats the prompt, chats and looks the answer up. Every attempt is
+accounted for in `EvaluationStats`: the outcome (legal move or error type), the wall time
+and the runtime numbers ollama returns (tokens, prompt / generation durations), including
+for failed attempts. The summary (move quality, error breakdown and cost: tokens/sec, prompt
+vs generation time, time and tokens per legal move) is appended as one JSON line to a
+summary file, so runs of different models and prompts can be compared.
+
+Usage (from the repo root, with `ollama serve` running):
+    python cli.py evaluate --model deepseek-r1:1.5b --board-representation desc --max-iters 50
+    python cli.py evaluate --model deepseek-r1:7b --max-iters 50 --summary-file evaluations.jsonl --label 7b-fen
+"""
+import json
+import time
+import hashlib
+import argparse
+import datetime
+import itertools
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from .utility import (
+    ExtractionError,
+    GenerationError,
+    IllegalMoveError,
+    TimeoutError,
+    extract_answer,
+    format_prompt,
+)
+
+DEFAULT_SUMMARY_FILE = "evaluation_summaries.jsonl"
+
+# Outcome of an attempt that failed with each exception type
+_ERROR_KINDS = {
+    IllegalMoveError: "illegal_move",
+    TimeoutError: "timeout",
+    GenerationError: "generation",
+    ExtractionError: "extraction",
+}
+ERROR_KINDS = (*_ERROR_KINDS.values(), "other")
+
+
+# ====================================================
+# Preprocessing
+# ====================================================
+class EvalPosition(NamedTuple):
+    """A position with its legal moves sorted by decreasing win probability."""
+    fen: str
+    moves: List[str]
+    win_probs: List[float]
+    ranks: Dict[str, int]  # move -> index in moves
+
+
+def prepare_position(fen: str, moves, win_probs) -> EvalPosition:
+    ranked = sorted(zip(moves, win_probs), key=lambda x: x[1], reverse=True)
+    sorted_moves = [move for move, _ in ranked]
+    return EvalPosition(fen, sorted_moves, [float(win_prob) for _, win_prob in ranked],
+                        {move: i for i, move in enumerate(sorted_moves)})
+
+
+def prepare_positions(df) -> List[EvalPosition]:
+    """Preprocesses the rows (FEN, Move, Win Probability) of a challenge dataframe."""
+    return [
+        prepare_position(fen, moves, win_probs)
+        for fen, moves, win_probs in zip(df["FEN"], df["Move"], df["Win Probability"])
+        if len(moves)
+    ]
+
+
+# ====================================================
+# Telemetry
+# ====================================================
+_RUNTIME_KEYS = ("prompt_tokens", "generated_tokens", "total_duration", "prompt_eval_duration", "generation_duration")
+
+
+class EvaluationStats:
+    """Outcomes, move ranks and runtime totals of the attempts of an evaluation."""
+
+    def __init__(self):
+        self.num_attempts = 0
+        self.legal_move_ranks = []  # rank / number of legal moves
+        self.win_prob_losses = []  # best win probability - chosen move's
+        self.outcomes = Counter()  # "legal" or an error kind
+        self.wall_seconds = Counter()  # per outcome
+        self.runtime = {outcome: Counter() for outcome in ("legal", *ERROR_KINDS)}  # per outcome, _RUNTIME_KEYS sums
+        self.num_responses = Counter()  # per outcome, attempts with runtime results
+        self.completion_reasons = Counter()
+
+    def record(self, outcome: str, wall_seconds: float, runtime_results: Optional[dict] = None,
+               rank_fraction: Optional[float] = None, win_prob_loss: Optional[float] = None):
+        """
+        Accounts for one attempt.
+
+        Args:
+            outcome (str): "legal" or one of ERROR_KINDS.
+            wall_seconds (float): Time of the attempt, prompt formatting to answer lookup.
+            runtime_results (dict | None): As returned by OllamaSession.chat (None if it failed).
+            rank_fraction (float | None): Rank / number of legal moves of a legal answer.
+            win_prob_loss (float | None): Win probability lost by a legal answer.
+        """
+        self.num_attempts += 1
+        self.outcomes[outcome] += 1
+        self.wall_seconds[outcome] += wall_seconds
+        if runtime_results is not None:
+            self.num_responses[outcome] += 1
+            self.runtime[outcome].update({key: runtime_results.get(key, 0) for key in _RUNTIME_KEYS})
+            self.completion_reasons[str(runtime_results.get("completion_reason"))] += 1
+        if rank_fraction is not None:
+            self.legal_move_ranks.append(rank_fraction)
+        if win_prob_loss is not None:
+            self.win_prob_losses.append(win_prob_loss)
+
+    def summary(self) -> dict:
+        """Move quality, error breakdown and runtime telemetry (durations in seconds)."""
+        num_legal = self.outcomes["legal"]
+        total = Counter()
+        for runtime in self.runtime.values():
+            total.update(runtime)
+        wall_seconds = sum(self.wall_seconds.values())
+        errors = {}
+        for kind in ERROR_KINDS:
+            errors[kind] = {
+                "count": self.outcomes[kind],
+                "rate": _ratio(self.outcomes[kind], self.num_attempts),
+                "wall_seconds": self.wall_seconds[kind],
+                "generated_tokens": self.runtime[kind]["generated_tokens"],
+            }
+        return {
+            "num_attempts": self.num_attempts,
+            "num_legal_moves": num_legal,
+            "legal_move_rate": _ratio(num_legal, self.num_attempts),
+            "avg_legal_move_rank": _ratio(sum(self.legal_move_ranks), len(self.legal_move_ranks)),
+            "avg_win_prob_loss": _ratio(sum(self.win_prob_losses), len(self.win_prob_losses)),
+            "errors": errors,
+            "completion_reasons": dict(self.completion_reasons),
+            "telemetry": {
+                "num_responses": sum(self.num_responses.values()),
+                "prompt_tokens": total["prompt_tokens"],
+                "generated_tokens": total["generated_tokens"],
+                "prompt_seconds": total["prompt_eval_duration"],
+                "generation_seconds": total["generation_duration"],
+                "model_seconds": total["total_duration"],
+                "wall_seconds": wall_seconds,
+                "prompt_tokens_per_sec": _ratio(total["prompt_tokens"], total["prompt_eval_duration"]),
+                "generated_tokens_per_sec": _ratio(total["generated_tokens"], total["generation_duration"]),
+                "prompt_time_fraction": _ratio(total["prompt_eval_duration"], total["prompt_eval_duration"] + total["generation_duration"]),
+                "avg_generated_tokens": _ratio(total["generated_tokens"], sum(self.num_responses.values())),
+                "wall_seconds_per_legal_move": _ratio(wall_seconds, num_legal),
+                "generated_tokens_per_legal_move": _ratio(total["generated_tokens"], num_legal),
+            },
+        }
+
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    return numerator / denominator if denominator else None
+
+
+def print_summary(summary: dict):
+    telemetry = summary["telemetry"]
+    print(f"\n{'='*60}")
+    print(f"Legal moves: {summary['num_legal_moves']}/{summary['num_attempts']} | "
+          f"Average Legal Move Score (Rank / Total Moves): {_format(summary['avg_legal_move_rank'], '.4f')} | "
+          f"Average Win Prob Loss: {_format(summary['avg_win_prob_loss'], '.4f')}")
+    for kind, error in summary["errors"].items():
+        if error["count"]:
+            print(f"error_{kind}: {error['count']} ({error['wall_seconds']:.1f}s, {error['generated_tokens']} tokens)")
+    print(f"Tokens: {telemetry['prompt_tokens']} prompt @ {_format(telemetry['prompt_tokens_per_sec'], '.1f')} tok/s, "
+          f"{telemetry['generated_tokens']} generated @ {_format(telemetry['generated_tokens_per_sec'], '.1f')} tok/s")
+    print(f"Time: {telemetry['prompt_seconds']:.1f}s prompt, {telemetry['generation_seconds']:.1f}s generation, "
+          f"{telemetry['wall_seconds']:.1f}s wall | per legal move: {_format(telemetry['wall_seconds_per_legal_move'], '.1f')}s, "
+          f"{_format(telemetry['generated_tokens_per_legal_move'], '.0f')} tokens")
+
+
+def _format(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def write_summary(path: str, summary: dict, **metadata):
+    """Appends a summary (with run metadata such as the model and prompt) as one JSON line."""
+    record = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), **metadata, **summary}
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+# ====================================================
+# Evaluation
+# ====================================================
+def evaluate_positions(ollama_session, positions: Iterable[EvalPosition], board_representation, max_iters=None,
+                       max_timeout=30, verbose=False, stats: Optional[EvaluationStats] = None) -> EvaluationStats:
+    """
+    Prompts a model with preprocessed positions and accounts for every attempt.
+
+    Args:
+        ollama_session (OllamaSession): The session to chat with.
+        positions: Iterable of EvalPosition (e.g. itertools.cycle of prepare_positions' output).
+        board_representation (str): One of ["FEN", "desc", "grid"].
+        max_iters (int | None): Number of positions to evaluate (None: all of `positions`).
+        max_timeout (int): Seconds to wait for each response.
+        verbose (bool): Print prompts and responses (and draw the board in notebooks).
+        stats (EvaluationStats | None): Stats to add the attempts to.
+
+    Returns:
+        EvaluationStats: The stats of the attempts.
+    """
+    stats = EvaluationStats() if stats is None else stats
+    total = max_iters if max_iters is not None else "?"
+    for iter, position in enumerate(itertools.islice(positions, max_iters)):
+        start = time.perf_counter()
+        runtime_results = None
+        try:
+            prompt = format_prompt(position.fen, position.moves, board_representation)
+
+            # Generate a response from the model
+            response, runtime_results = ollama_session.chat(user_prompt=prompt, timeout=max_timeout)
+
+            if verbose:
+                print(f"{'-'*100}\nPrompt:\n{prompt}\n\nResponse:\n{response}\n\nRuntime Results:\n{runtime_results}\n{'-'*100}\n")
+                from utility import visualize_board_ipynb
+                visualize_board_ipynb(position.fen)
+
+            move = extract_answer(response)
+            move_idx = position.ranks.get(move)
+            if move_idx is None:
+                raise IllegalMoveError(f"Model predicted illegal move: {move}")
+        except Exception as e:
+            kind = _ERROR_KINDS.get(type(e), "other")
+            stats.record(kind, time.perf_counter() - start, runtime_results)
+            print(f"[{iter+1:<4}/{total:<4}] {type(e).__name__}: {e}")
+            if kind == "other":
+                print(f"Unknown Error: {e}")
+            continue
+
+        # If move in legal moves print probability / move ranking
+        num_moves = len(position.moves)
+        stats.record("legal", time.perf_counter() - start, runtime_results, (move_idx + 1) / num_moves,
+                     position.win_probs[0] - position.win_probs[move_idx])
+        tps = _ratio(runtime_results["generated_tokens"], runtime_results["generation_duration"])
+        print(f"[{iter+1:<4}/{total:<4}] Move: {move} | Win Prob: {position.win_probs[move_idx]:.4f} | "
+              f"Move Rank: {f'{move_idx+1}/{num_moves}':<5} | TPS: {_format(tps, '.2f')}")
+    return stats
+
+
+def evaluate_chess_model(ollama_session, train_iterator, board_representation, max_iters=None, max_timeout=30, verbose=False,
+                         summary_file: Optional[str] = None, label: Optional[str] = None):
+    """
+    Prompts a model with positions and records whether it answers with a legal move and how
+    that move ranks by win probability.
+
+    Args:
+        ollama_session (OllamaSession): The session to chat with.
+        train_iterator: Iterator over (index, row) pairs with FEN, Move and Win Probability
+            (rows are preprocessed once per index), or over EvalPosition.
+        board_representation (str): One of ["FEN", "desc", "grid"].
+        max_iters (int): Number of positions to evaluate.
+        max_timeout (int): Seconds to wait for each response.
+        verbose (bool): Print prompts and responses (and draw the board in notebooks).
+        summary_file (str | None): File to append the summary to (see write_summary).
+        label (str | None): Name of the run in the summary file.
+
+    Returns:
+        dict: Counts of legal moves / errors, the rank (as a fraction) of every legal move and
+        the full summary with the error breakdown and runtime telemetry ("summary").
+    """
+    stats = evaluate_positions(ollama_session, _as_positions(train_iterator), board_representation, max_iters, max_timeout, verbose)
+    summary = stats.summary()
+    print_summary(summary)
+    if summary_file is not None:
+        write_summary(summary_file, summary, **run_metadata(ollama_session, board_representation, label, max_timeout))
+        print(f"Summary appended to {summary_file}")
+
+    evaluation_results = {
+        "num_attempts": stats.num_attempts,
+        "legal_move_ranks": stats.legal_move_ranks,
+        "num_legal_moves": stats.outcomes["legal"],
+    }
+    for kind in ERROR_KINDS[:-1]:
+        evaluation_results[f"error_{kind}"] = stats.outcomes[kind]
+    evaluation_results["summary"] = summary
+    return evaluation_results
+
+
+def _as_positions(iterator):
+    prepared = {}
+    for item in iterator:
+        if isinstance(item, EvalPosition):
+            yield item
+            continue
+        index, row = item
+        if index not in prepared:
+            prepared[index] = prepare_position(row["FEN"], row["Move"], row["Win Probability"])
+        yield prepared[index]
+
+
+def run_metadata(ollama_session, board_representation, label=None, max_timeout=None) -> dict:
+    """Model, board representation and system prompt (by hash) of a run, for its summary."""
+    system_prompt = "".join(m["content"] for m in getattr(ollama_session, "cached_messages", []) if m.get("role") == "system")
+    return {
+        "label": label,
+        "model": getattr(ollama_session, "model", None),
+        "board_representation": board_representation,
+        "system_prompt_sha1": hashlib.sha1(system_prompt.encode()).hexdigest()[:12] if system_prompt else None,
+        "timeout": max_timeout,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate an ollama model on challenge positions.")
+    parser.add_argument("--csv", default="data/chess_challenges_test_2k.csv", help="Challenge CSV (FEN, Move, Win Probability).")
+    parser.add_argument("--model", default="deepseek-r1:1.5b", help="ollama model name.")
+    parser.add_argument("--board-representation", choices=["FEN", "desc", "grid"], default="FEN")
+    parser.add_argument("--max-iters", type=int, default=10)
+    parser.add_argument("--timeout", type=int, default=30, help="Seconds to wait for each response.")
+    parser.add_argument("--use-cuda", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--summary-file", default=DEFAULT_SUMMARY_FILE, help="JSON lines file the run summary is appended to.")
+    parser.add_argument("--label", default=None, help="Name of the run in the summary file.")
+    args = parser.parse_args(argv)
+
+    from data.loader import load_challenge_moves_csv
+    from .ollama import OllamaSession
+
+    positions = prepare_positions(load_challenge_moves_csv(args.csv, shuffle=True))
+    session = OllamaSession(model=args.model, use_cuda=args.use_cuda, board_representation=args.board_representation)
+    return evaluate_chess_model(
+        ollama_session=session,
+        train_iterator=itertools.cycle(positions),
+        board_representation=args.board_representation,
+        max_iters=args.max_iters,
+        max_timeout=args.timeout,
+        verbose=args.verbose,
+        summary_file=args.summary_file,
+        label=args.label,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+from functools import lru_cache
+from typing import List
+
+
+# ====================================================
+# Precomputed tables
+# ====================================================
+_PIECE_NAMES = {
+    "K": "King",
+    "Q": "Queen",
+    "R": "Rook",
+    "B": "Bishop",
+    "N": "Knight",
+    "P": "Pawn",
+    "k": "King",
+    "q": "Queen",
+    "r": "Rook",
+    "b": "Bishop",
+    "n": "Knight",
+    "p": "Pawn",
+}
+_PIECE_COLORS = {piece: "White" if piece.isupper() else "Black" for piece in _PIECE_NAMES}
+
+# Description lines are grouped by (color, piece name) in alphabetical order
+_DESCRIPTION_ORDER = sorted(_PIECE_NAMES, key=lambda p: (_PIECE_COLORS[p], _PIECE_NAMES[p]))
+_DESCRIPTION_PREFIXES = {
+    piece: (
+        f"{_PIECE_COLORS[piece]} {_PIECE_NAMES[piece]} on ",
+        f"{_PIECE_COLORS[piece]} {_PIECE_NAMES[piece]}s on ",
+    )
+    for piece in _PIECE_NAMES
+}
+_NATURAL_PIECES = {piece: f"{_PIECE_COLORS[piece]} {_PIECE_NAMES[piece]}" for piece in _PIECE_NAMES}
+_CASTLING_RIGHTS = {
+    "K": "White King-side castling",
+    "Q": "White Queen-side castling",
+    "k": "Black King-side castling",
+    "q": "Black Queen-side castling",
+}
+
+# _SQUARES[rank_index][file] -> square name, with rank_index 0 being rank 8 (FEN order)
+_SQUARES = [[f"{chr(97 + file)}{8 - rank}" for file in range(8)] for rank in range(8)]
+_GRID_EMPTY = {str(n): ["."] * n for n in range(10)}
+
+RENDER_STYLES = ("FEN", "desc", "grid", "natural")
+_CACHE_SIZE = 1 << 16
+
+
+# ====================================================
+# Placement-level renderers (cached, keyed by the FEN board field)
+# ====================================================
+def _iter_pieces(placement: str):
+    """Yields (piece, square) in FEN scan order (rank 8 to 1, file a to h)."""
+    ranks = placement.split("/")
+    if len(ranks) != 8:
+        raise ValueError("Invalid FEN format. The board should have 8 ranks.")
+    for rank_squares, rank in zip(_SQUARES, ranks):
+        file = 0
+        for char in rank:
+            if char.isdigit():
+                file += int(char)
+            elif char in _PIECE_NAMES:
+                yield char, rank_squares[file]
+                file += 1
+            else:
+                raise ValueError(f"Invalid character '{char}' in FEN notation.")
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _description_lines(placement: str) -> str:
+    """Renders the piece lines of a description, each prefixed with a newline."""
+    squares = {}
+    for piece, square in _iter_pieces(placement):
+        squares.setdefault(piece, []).append(square)
+
+    lines = []
+    for piece in _DESCRIPTION_ORDER:
+        if piece in squares:
+            positions = squares[piece]
+            prefix = _DESCRIPTION_PREFIXES[piece][len(positions) > 1]
+            lines.append(f"\n{prefix}{', '.join(positions)}.")
+    return "".join(lines)
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _grid_rank(rank: str) -> str:
+    row = []
+    for char in rank:
+        if char.isdigit():
+            row.extend(_GRID_EMPTY.get(char) or ["."] * int(char))
+        elif char.isalpha():
+            row.append(char)
+        else:
+            raise ValueError(f"Invalid character '{char}' in FEN notation.")
+    return " ".join(row)
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _grid(placement: str) -> str:
+    ranks = placement.split("/")
+    if len(ranks) != 8:
+        raise ValueError("Invalid FEN format. The board should have 8 ranks.")
+    return "\n".join(_grid_rank(rank) for rank in ranks)
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _natural_pieces(placement: str) -> str:
+    return " ".join(
+        f"{_NATURAL_PIECES[piece]} on {square}." for piece, square in _iter_pieces(placement)
+    )
+
+
+# ====================================================
+# Public renderers
+# ====================================================
+def render_description(fen: str) -> str:
+    """
+    Renders a FEN as a side-to-move line followed by one line per piece type, e.g.
+    "White to move.\\nBlack King on g8.\\nWhite Pawns on a2, b2."
+
+    Args:
+        fen (str): The FEN string representing the board state.
+
+    Returns:
+        str: The board description.
+
+    Raises:
+        ValueError: If the FEN is malformed.
+    """
+    fen_parts = fen.split()
+    if len(fen_parts) < 2:
+        raise ValueError(
+            "Invalid FEN format. Ensure it has at least a board position and turn information."
+        )
+    turn = "White to move." if fen_parts[1] == "w" else "Black to move."
+    return turn + _description_lines(fen_parts[0])
+
+
+def render_grid(fen: str) -> str:
+    """
+    Renders a FEN as an 8x8 text grid, with '.' for empty squares and spaces between squares.
+
+    Args:
+        fen (str): The FEN string representing the board state.
+
+    Returns:
+        str: The board grid, rank 8 first.
+
+    Raises:
+        ValueError: If the FEN is malformed.
+    """
+    return _grid(fen.split()[0])
+
+
+def render_natural(fen: str) -> str:
+    """
+    Renders a FEN as a single line of natural language, including castling rights,
+    en passant square and move number.
+
+    Args:
+        fen (str): The full (six field) FEN string.
+
+    Returns:
+        str: The natural language description.
+
+    Raises:
+        ValueError: If the FEN is malformed.
+    """
+    board_fen, turn, castling, en_passant, _, fullmove = fen.split()[:6]
+    parts = [f"{'White' if turn == 'w' else 'Black'} to move."]
+    pieces = _natural_pieces(board_fen)
+    if pieces:
+        parts.append(pieces)
+    if castling != "-":
+        parts.append(f"Castling rights: {' '.join(_CASTLING_RIGHTS[c] for c in castling)}.")
+    if en_passant != "-":
+        parts.append(f"En Passant available on {en_passant}.")
+    parts.append(f"Move number: {fullmove}.")
+    return " ".join(parts)
+
+
+_RENDERERS = {
+    "FEN": lambda fen: fen,
+    "desc": render_description,
+    "grid": render_grid,
+    "natural": render_natural,
+}
+
+
+def render(fen: str, style: str = "desc") -> str:
+    """
+    Renders a FEN as board text in the given style.
+
+    Args:
+        fen (str): The FEN string representing the board state.
+        style (str): One of ["FEN", "desc", "grid", "natural"].
+
+    Returns:
+        str: The rendered board.
+    """
+    try:
+        renderer = _RENDERERS[style]
+    except KeyError:
+        raise ValueError(f"Invalid style '{style}'. Must be one of {RENDER_STYLES}.") from None
+    return renderer(fen)
+
+
+def render_many(fens, style: str = "desc"):
+    """
+    Renders a column of FENs, rendering each distinct FEN once.
+
+    Args:
+        fens: A pandas Series, a pyarrow Array / ChunkedArray, or any iterable of FEN strings.
+        style (str): One of ["FEN", "desc", "grid", "natural"].
+
+    Returns:
+        The rendered boards, as a pandas Series (same index) for Series input, a pyarrow
+        string array for Arrow input, and a list otherwise.
+    """
+    if style not in _RENDERERS:
+        raise ValueError(f"Invalid style '{style}'. Must be one of {RENDER_STYLES}.")
+    renderer = _RENDERERS[style]
+
+    module = type(fens).__module__
+    if module.startswith("pandas"):
+        import numpy as np
+        import pandas as pd
+
+        codes, uniques = pd.factorize(fens, sort=False)
+        rendered = np.array([renderer(fen) for fen in uniques], dtype=object)
+        return pd.Series(rendered[codes], index=fens.index, name=fens.name)
+
+    if module.startswith("pyarrow"):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        encoded = pc.dictionary_encode(fens)
+        if isinstance(encoded, pa.ChunkedArray):
+            encoded = encoded.combine_chunks()
+        rendered = pa.array([renderer(fen) for fen in encoded.dictionary.to_pylist()], type=pa.string())
+        return pc.take(rendered, encoded.indices)
+
+    memo = {}
+    rendered: List[str] = []
+    for fen in fens:
+        text = memo.get(fen)
+        if text is None:
+            text = memo[fen] = renderer(fen)
+        rendered.append(text)
+    return rendered
+
+
+def clear_cache() -> None:
+    """Clears the placement caches (e.g. between benchmark runs)."""
+    _description_lines.cache_clear()
+    _grid_rank.cache_clear()
+    _grid.cache_clear()
+    _natural_pieces.cache_clear()
@@ -0,0 +1,201 @@
+"""
+Batched reward scoring for RL rollouts.
+
+Every prompt is rolled out several times, so the ground truth of a prompt (JSON text in
+older parquets, a {moves, rewards} struct in the ones from data.verl_builder) is parsed into
+a move -> reward dict once and cached; scoring a rollout is then one precompiled regex
+search plus a dict lookup. Large batches can be spread over a process pool.
+
+`compute_score` has the signature veRL expects from a custom reward function.
+"""
+import concurrent.futures
+from functools import lru_cache
+from typing import Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+from data.rewards import ground_truth_to_dict
+from .utility import ExtractionError, extract_answer
+
+
+# Reward when no answer can be extracted from the response
+FORMAT_ERROR_REWARD = -1.0
+# Reward when the answer is not one of the legal moves of the position
+ILLEGAL_MOVE_REWARD = -0.5
+# Both are lowered per position when its worst legal move is rewarded less (z-scored rewards
+# are unbounded), so that a wrong answer never outscores a legal move: see PositionRewards.
+
+_CACHE_SIZE = 1 << 14
+
+
+# ====================================================
+# Ground truth parsing (cached per unique prompt)
+# ====================================================
+class PositionRewards(dict):
+    """
+    The move -> reward dict of a position, with the rewards of its wrong answers:
+    `illegal_move_reward` / `format_error_reward` are ILLEGAL_MOVE_REWARD / FORMAT_ERROR_REWARD,
+    or that far below the worst legal move if it is rewarded less than 0.
+    """
+
+    def __init__(self, rewards=()):
+        super().__init__(rewards)
+        lowest = min(min(self.values(), default=0.0), 0.0)
+        self.illegal_move_reward = lowest + ILLEGAL_MOVE_REWARD
+        self.format_error_reward = lowest + FORMAT_ERROR_REWARD
+
+
+def _ground_truth_key(ground_truth) -> Hashable:
+    """Returns a hashable key identifying a ground truth in any of its stored forms."""
+    if isinstance(ground_truth, (str, bytes)):
+        return ground_truth
+    if "moves" in ground_truth and "rewards" in ground_truth:
+        return tuple(ground_truth["moves"]), tuple(ground_truth["rewards"])
+    return tuple(ground_truth), tuple(ground_truth.values())
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _parse_key(key: Hashable) -> PositionRewards:
+    if isinstance(key, (str, bytes)):
+        return PositionRewards(ground_truth_to_dict(key))
+    moves, rewards = key
+    return PositionRewards(zip(moves, map(float, rewards)))
+
+
+def parse_ground_truth(ground_truth) -> PositionRewards:
+    """
+    Parses a stored ground truth into a move -> reward dict, caching by content.
+
+    Args:
+        ground_truth: JSON text, a {"moves": [...], "rewards": [...]} struct or a
+            move -> reward dict.
+
+    Returns:
+        PositionRewards: The reward of every legal move (do not mutate, it is shared).
+    """
+    return _parse_key(_ground_truth_key(ground_truth))
+
+
+def clear_cache() -> None:
+    """Clears the ground truth cache."""
+    _parse_key.cache_clear()
+
+
+# ====================================================
+# Scoring
+# ====================================================
+def score_response(response: str, rewards: Dict[str, float]) -> float:
+    """
+    Scores one response against the parsed rewards of its prompt.
+
+    Args:
+        response (str): The model output, with the move between <answer> tags.
+        rewards (Dict[str, float]): Output of `parse_ground_truth` (a plain move -> reward dict
+            is wrapped in PositionRewards).
+
+    Returns:
+        float: The reward of the answered move, or the format error / illegal move reward of
+        the position.
+    """
+    if not isinstance(rewards, PositionRewards):
+        rewards = PositionRewards(rewards)
+    try:
+        move = extract_answer(response)
+    except ExtractionError:
+        return rewards.format_error_reward
+    return rewards.get(move, rewards.illegal_move_reward)
+
+
+def compute_score(data_source: str, solution_str: str, ground_truth, extra_info: Optional[Dict] = None) -> float:
+    """veRL custom reward function entry point for a single rollout."""
+    return score_response(solution_str, parse_ground_truth(ground_truth))
+
+
+def _score_chunk(responses: Sequence[str], ground_truths: Sequence, run_lengths: Optional[Sequence[int]] = None) -> List[float]:
+    """Scores responses; with `run_lengths`, ground_truths[i] covers the next run_lengths[i] responses."""
+    if run_lengths is not None:
+        ground_truths = [g for g, n in zip(ground_truths, run_lengths) for _ in range(n)]
+    scores = []
+    previous, rewards = None, None
+    for response, ground_truth in zip(responses, ground_truths):
+        # Rollouts of the same prompt are usually adjacent and share the ground truth object
+        if ground_truth is not previous:
+            previous, rewards = ground_truth, parse_ground_truth(ground_truth)
+        scores.append(score_response(response, rewards))
+    return scores
+
+
+def _run_length_encode(values: Sequence):
+    """Collapses adjacent equal values, so repeated ground truths are sent to a worker once."""
+    uniques, run_lengths = [], []
+    previous_key = None
+    for value in values:
+        if uniques and value is uniques[-1]:
+            run_lengths[-1] += 1
+            continue
+        # Compare by content key: parquet structs hold numpy arrays, which `==` cannot compare
+        key = _ground_truth_key(value)
+        if uniques and key == previous_key:
+            run_lengths[-1] += 1
+        else:
+            uniques.append(value)
+            run_lengths.append(1)
+            previous_key = key
+    return uniques, run_lengths
+
+
+class RewardScorer:
+    def __init__(self, num_workers: int = 0, chunk_size: int = 4096):
+        """
+        Scores batches of rollouts, optionally in a process pool.
+
+        Args:
+            num_workers (int): Worker processes (0 scores in the calling process).
+            chunk_size (int): Rollouts per task sent to a worker.
+        """
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self._executor = concurrent.futures.ProcessPoolExecutor(num_workers) if num_workers > 0 else None
+
+    def score(self, responses: Sequence[str], ground_truths: Sequence) -> np.ndarray:
+        """
+        Scores a batch of (response, ground truth) pairs.
+
+        Args:
+            responses (Sequence[str]): The model outputs.
+            ground_truths (Sequence): The ground truth of each response's prompt, in any form
+                accepted by `parse_ground_truth`.
+
+        Returns:
+            np.ndarray: One float64 reward per response.
+        """
+        if len(responses) != len(ground_truths):
+            raise ValueError(f"Got {len(responses)} responses but {len(ground_truths)} ground truths.")
+        if self._executor is None or len(responses) <= self.chunk_size:
+            return np.asarray(_score_chunk(responses, ground_truths), dtype=np.float64)
+
+        futures = [
+            self._executor.submit(
+                _score_chunk,
+                list(responses[start:start + self.chunk_size]),
+                *_run_length_encode(ground_truths[start:start + self.chunk_size]),
+            )
+            for start in range(0, len(responses), self.chunk_size)
+        ]
+        return np.concatenate([np.asarray(f.result(), dtype=np.float64) for f in futures])
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def score_batch(responses: Sequence[str], ground_truths: Sequence) -> np.ndarray:
+    """Scores a batch of (response, ground truth) pairs in the calling process."""
+    return RewardScorer().score(responses, ground_truths)
@@ -2,7 +2,14 @@ import re
 import random
 import typing
 from typing import List
-from collections import defaultdict
+
+from .render import render_description, render_grid
+
+
+_ANSWER_RE = re.compile(r"<answer>(.*?)</answer>", re.DOTALL)
+_EDGE_QUOTES_RE = re.compile(r'^["\']|["\']$')
+# Moves in UCI or SAN ("O-O-O+", "e8=Q#")
+_VALID_ANSWER_RE = re.compile(r"[A-Za-z0-9 *#+=-]+")
 
 
 # ====================================================
@@ -56,18 +63,16 @@ def extract_answer(text: str) -> str:
     Raises:
         ExtractionError: If the <answer> tags are not found.
     """
-    match = re.search(r"<answer>(.*?)</answer>", text, re.DOTALL)
+    match = _ANSWER_RE.search(text)
     if not match:
         raise ExtractionError("No <answer> tags found.")
 
     # Strip leading/trailing whitespace and quotes
     extracted = match.group(1).strip()
-    extracted = re.sub(
-        r'^["\']|["\']$', "", extracted
-    )  # Remove single/double quotes at edges
+    extracted = _EDGE_QUOTES_RE.sub("", extracted)  # Remove single/double quotes at edges
 
-    # Ensure it only contains alphanumeric characters
-    if not re.fullmatch(r"[A-Za-z0-9 *#]+", extracted):
+    # Ensure it only contains characters of UCI / SAN moves
+    if not _VALID_ANSWER_RE.fullmatch(extracted):
         raise ExtractionError("Extracted text contains invalid characters.")
 
     return extracted
@@ -83,68 +88,8 @@ def fen_to_description(fen: str) -> str:
     Returns:
         str: A formatted description of the board state.
     """
-    piece_map = {
-        "K": "King",
-        "Q": "Queen",
-        "R": "Rook",
-        "B": "Bishop",
-        "N": "Knight",
-        "P": "Pawn",
-        "k": "King",
-        "q": "Queen",
-        "r": "Rook",
-        "b": "Bishop",
-        "n": "Knight",
-        "p": "Pawn",
-    }
-
     try:
-        fen_parts = fen.split()
-        if len(fen_parts) < 2:
-            raise ValueError(
-                "Invalid FEN format. Ensure it has at least a board position and turn information."
-            )
-
-        ranks = fen_parts[0].split("/")
-        if len(ranks) != 8:
-            raise ValueError("Invalid FEN format. The board should have 8 ranks.")
-
-        turn = "White to move." if fen_parts[1] == "w" else "Black to move."
-        board = []
-
-        for r, rank in enumerate(ranks):
-            row = []
-            file = 0
-            for char in rank:
-                if char.isdigit():
-                    file += int(char)
-                elif char in piece_map:
-                    row.append((char, file, 8 - r))  # (Piece, File, Rank)
-                    file += 1
-                else:
-                    raise ValueError(f"Invalid character '{char}' in FEN notation.")
-            board.extend(row)
-
-        piece_positions = defaultdict(list)
-
-        for piece, file, rank in board:
-            color = "White" if piece.isupper() else "Black"
-            piece_type = piece_map[piece]
-            position = f"{chr(file + 97)}{rank}"
-            piece_positions[(color, piece_type)].append(position)
-
-        description = [turn]
-
-        for (color, piece_type), positions in sorted(
-            piece_positions.items(), key=lambda x: (x[0][0], x[0][1])
-        ):
-            position_text = ", ".join(positions)
-            description.append(
-                f"{color} {piece_type}{'s' if len(positions) > 1 else ''} on {position_text}."
-            )
-
-        return "\n".join(description)
-
+        return render_description(fen)
     except ValueError as e:
         return f"Error processing FEN: {e}"
     except Exception as e:
@@ -161,25 +106,7 @@ def fen_to_grid(fen: str) -> str:
         str: A formatted text representation of the chessboard.
     """
     try:
-        ranks = fen.split()[0].split('/')
-        if len(ranks) != 8:
-            raise ValueError("Invalid FEN format. The board should have 8 ranks.")
-        
-        board_grid = []
-        
-        for rank in ranks:
-            row = []
-            for char in rank:
-                if char.isdigit():
-                    row.extend(['.'] * int(char))  # Replace empty squares with '.'
-                elif char.isalpha():
-                    row.append(char)  # Keep piece symbols as is
-                else:
-                    raise ValueError(f"Invalid character '{char}' in FEN notation.")
-            board_grid.append(" ".join(row))
-        
-        return "\n".join(board_grid)
-    
+        return render_grid(fen)
     except ValueError as e:
         return f"Error processing FEN: {e}"
     except Exception as e:
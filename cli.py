@@ -0,0 +1,123 @@
+"""
+Single entry point for the repo's tools (run from the repo root):
+
+    python cli.py tournament --num-games 4 --num-workers 8
+    python cli.py distributed coordinator --host 0.0.0.0 --num-games 4 --port 5555   (and `distributed worker --coordinator HOST:5555` per core)
+    python cli.py ratings ladder --db elo_evaluator/games.sqlite
+    python cli.py suite run --engine mock --num-workers 8
+    python cli.py evaluate --model deepseek-r1:1.5b --board-representation desc --max-iters 50
+    python cli.py convert --output chess_challenges_full.csv 'data/data_preparation/utils/train/action_value-*_data.bag'
+    python cli.py label --output rollouts.bag --cache evaluations.sqlite --depth 20 rollout_fens.txt
+    python cli.py harvest --output data/harvest.parquet --min-ply 12 --min-elo 2200 games.pgn
+    python cli.py build-dataset --source data/raw_data/chess_challenges_full.csv --variants all
+    python cli.py position-index build --output data/index/train --csv train.csv
+
+Only the standard library is imported up front: each subcommand imports its own
+dependencies (Stockfish engines, ollama, pandas / pyarrow, apache_beam) when it runs, and
+arguments after the subcommand are passed to the tool (`python cli.py <command> --help`).
+`--import-time` prints how long startup and the subcommand's imports took.
+"""
+import time
+
+_START = time.perf_counter()
+
+import os  # noqa: E402
+import sys  # noqa: E402
+import argparse  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _tournament():
+    # elo_evaluator is a script directory (`from engine... import`, `from game import`)
+    sys.path.insert(0, os.path.join(REPO_ROOT, "elo_evaluator"))
+    import run_games
+    return run_games.main
+
+
+def _distributed():
+    sys.path.insert(0, os.path.join(REPO_ROOT, "elo_evaluator"))
+    import distributed
+    return distributed.main
+
+
+def _ratings():
+    sys.path.insert(0, os.path.join(REPO_ROOT, "elo_evaluator"))
+    import ratings
+    return ratings.main
+
+
+def _suite():
+    sys.path.insert(0, os.path.join(REPO_ROOT, "elo_evaluator"))
+    import suite
+    return suite.main
+
+
+def _evaluate():
+    from chat import evaluate
+    return evaluate.main
+
+
+def _convert():
+    # The data preparation tools import their helpers as `utils.*`
+    sys.path.insert(0, os.path.join(REPO_ROOT, "data", "data_preparation"))
+    from utils import aggregate
+    return aggregate.main
+
+
+def _label():
+    sys.path.insert(0, os.path.join(REPO_ROOT, "data", "data_preparation"))
+    from utils import label
+    return label.main
+
+
+def _harvest():
+    from data import pgn_harvest
+    return pgn_harvest.main
+
+
+def _build_dataset():
+    from data import verl_builder
+    return verl_builder.main
+
+
+def _position_index():
+    from data import position_index
+    return position_index.main
+
+
+# name -> (help, loader returning the tool's main(argv))
+COMMANDS = {
+    "tournament": ("Play an engine against Stockfish levels and estimate its Elo.", _tournament),
+    "distributed": ("Tournament coordinator / worker over TCP (multi-host).", _distributed),
+    "ratings": ("Rating ladder over the stored games (Bradley-Terry, anchored).", _ratings),
+    "suite": ("Elo proxy of an engine on the 2k challenge positions.", _suite),
+    "evaluate": ("Evaluate an ollama model on challenge positions.", _evaluate),
+    "convert": ("Aggregate action-value bags into a challenge CSV.", _convert),
+    "label": ("Label positions with Stockfish action values (cached).", _label),
+    "harvest": ("Sample deduplicated positions from PGN collections.", _harvest),
+    "build-dataset": ("Build the veRL parquet datasets from a challenge CSV.", _build_dataset),
+    "position-index": ("Build or query a position index (dedup / decontamination).", _position_index),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Chess reasoner tools.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n" + "\n".join(f"  {name:<15} {text}" for name, (text, _) in COMMANDS.items()),
+    )
+    parser.add_argument("--import-time", action="store_true", help="Print startup and import times.")
+    parser.add_argument("command", choices=COMMANDS, metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Arguments for the command.")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    tool_main = COMMANDS[args.command][1]()
+    if args.import_time:
+        print(f"startup: {(started - _START) * 1e3:.0f} ms, {args.command} imports: {(time.perf_counter() - started) * 1e3:.0f} ms", file=sys.stderr)
+    return tool_main(args.args)
+
+
+if __name__ == "__main__":
+    main()
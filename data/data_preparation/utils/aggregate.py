@@ -0,0 +1,284 @@
+"""Out-of-core group-by-FEN aggregation of action-value Bagz files.
+
+The action-value bags store one `(fen, move, win_prob)` record per legal move,
+so building the per-position move lists of `chess_challenges_*.csv` is a
+group-by over the whole dataset. Loading that into pandas only works for the
+test bag; the train set needs an external algorithm:
+
+1. Partition: the input bags are streamed by `num_workers` processes and every
+   record is hash-partitioned by FEN into one of `num_partitions` spill bags,
+   so all moves of a position land in the same partition.
+2. Reduce: each partition is grouped in at most `worker_memory_bytes`. When a
+   partition does not fit, sorted runs are spilled to disk and k-way merged.
+3. Merge: the per-partition CSVs are each sorted by FEN and are streamed into
+   a single CSV, giving the same row order as the in-memory
+   `sort_values` + `groupby("FEN")` version.
+
+Example (from `data/data_preparation`):
+
+  python -m utils.aggregate --output chess_challenges_full.csv \
+      'utils/train/action_value-*_data.bag'
+"""
+
+import argparse
+from collections.abc import Iterator, Sequence
+import concurrent.futures
+import csv
+import glob
+import heapq
+import itertools
+import os
+import tempfile
+import zlib
+
+from utils import bagz
+from utils.constants import CODERS
+
+
+# Rough number of bytes a buffered `(win_prob, move)` entry and a new FEN key
+# cost in a Python dict of lists. Only used to decide when to spill a run.
+_MOVE_ENTRY_BYTES = 120
+_FEN_ENTRY_BYTES = 250
+
+_CSV_HEADER = ('FEN', 'Move', 'Win Probability')
+
+
+def _partition_of(fen: str, num_partitions: int) -> int:
+  """Returns the partition of a FEN (stable across processes, unlike hash)."""
+  return zlib.crc32(fen.encode('utf-8')) % num_partitions
+
+
+def _partition_path(tmp_dir: str, partition: int, worker: int) -> str:
+  return os.path.join(tmp_dir, f'partition-{partition:05d}-{worker:05d}.bag')
+
+
+def _partition_bags(
+    filenames: Sequence[str],
+    tmp_dir: str,
+    num_partitions: int,
+    worker: int,
+) -> int:
+  """Hash-partitions the records of `filenames` into per-worker spill bags.
+
+  Records are copied as encoded bytes; only the FEN is decoded.
+
+  Returns:
+    The number of records written.
+  """
+  decode_fen = CODERS['fen'].decode_nested
+  writers = [
+      bagz.BagWriter(_partition_path(tmp_dir, partition, worker))
+      for partition in range(num_partitions)
+  ]
+  num_records = 0
+  try:
+    for filename in filenames:
+      reader = bagz.BagReader(filename)
+      for i in range(len(reader)):
+        record = reader[i]
+        fen = decode_fen(record)
+        writers[_partition_of(fen, num_partitions)].write(record)
+        num_records += 1
+  finally:
+    for writer in writers:
+      writer.close()
+  return num_records
+
+
+def _iter_partition(
+    tmp_dir: str, partition: int, num_workers: int
+) -> Iterator[tuple[str, str, float]]:
+  """Yields the decoded records of one partition across all worker files."""
+  decode = CODERS['action_value'].decode
+  for worker in range(num_workers):
+    reader = bagz.BagReader(_partition_path(tmp_dir, partition, worker))
+    for i in range(len(reader)):
+      yield decode(reader[i])
+
+
+def _run_path(tmp_dir: str, partition: int, run: int) -> str:
+  return os.path.join(tmp_dir, f'run-{partition:05d}-{run:05d}.bag')
+
+
+def _write_run(
+    groups: dict[str, list[tuple[float, str]]], filename: str
+) -> None:
+  """Writes buffered groups as a bag sorted by (FEN, descending win prob)."""
+  encode = CODERS['action_value'].encode
+  with bagz.BagWriter(filename) as writer:
+    for fen in sorted(groups):
+      for win_prob, move in sorted(groups[fen], key=lambda x: -x[0]):
+        writer.write(encode((fen, move, win_prob)))
+
+
+def _iter_run(filename: str) -> Iterator[tuple[str, str, float]]:
+  decode = CODERS['action_value'].decode
+  reader = bagz.BagReader(filename)
+  for i in range(len(reader)):
+    yield decode(reader[i])
+
+
+def _reduce_partition(
+    tmp_dir: str,
+    partition: int,
+    num_workers: int,
+    worker_memory_bytes: int,
+) -> tuple[str, int]:
+  """Groups one partition by FEN into a CSV sorted by FEN.
+
+  Returns:
+    The CSV filename and the number of positions it contains.
+  """
+  groups = {}
+  used_bytes = 0
+  runs = []
+  for fen, move, win_prob in _iter_partition(tmp_dir, partition, num_workers):
+    if (moves := groups.get(fen)) is None:
+      moves = groups[fen] = []
+      used_bytes += _FEN_ENTRY_BYTES + len(fen)
+    moves.append((win_prob, move))
+    used_bytes += _MOVE_ENTRY_BYTES
+    if used_bytes >= worker_memory_bytes:
+      runs.append(_run_path(tmp_dir, partition, len(runs)))
+      _write_run(groups, runs[-1])
+      groups = {}
+      used_bytes = 0
+
+  if runs:
+    # Spill the remainder too, then k-way merge all sorted runs.
+    if groups:
+      runs.append(_run_path(tmp_dir, partition, len(runs)))
+      _write_run(groups, runs[-1])
+    merged = heapq.merge(
+        *(_iter_run(run) for run in runs), key=lambda x: (x[0], -x[2])
+    )
+    grouped = (
+        (fen, [(win_prob, move) for _, move, win_prob in records])
+        for fen, records in itertools.groupby(merged, key=lambda x: x[0])
+    )
+  else:
+    grouped = (
+        (fen, sorted(groups[fen], key=lambda x: -x[0]))
+        for fen in sorted(groups)
+    )
+
+  filename = os.path.join(tmp_dir, f'partition-{partition:05d}.csv')
+  num_positions = 0
+  with open(filename, 'w', newline='') as f:
+    writer = csv.writer(f)
+    for fen, moves in grouped:
+      writer.writerow((
+          fen,
+          str([move for _, move in moves]),
+          str([win_prob for win_prob, _ in moves]),
+      ))
+      num_positions += 1
+
+  for run in runs:
+    os.unlink(run)
+  for worker in range(num_workers):
+    os.unlink(_partition_path(tmp_dir, partition, worker))
+  return filename, num_positions
+
+
+def _merge_csvs(filenames: Sequence[str], output: str) -> None:
+  """Streams FEN-sorted partition CSVs into one FEN-sorted CSV."""
+  files = [open(filename, newline='') for filename in filenames]
+  try:
+    with open(output, 'w', newline='') as f:
+      writer = csv.writer(f)
+      writer.writerow(_CSV_HEADER)
+      writer.writerows(
+          heapq.merge(*(csv.reader(file) for file in files), key=lambda x: x[0])
+      )
+  finally:
+    for file in files:
+      file.close()
+
+
+def aggregate_action_values(
+    filenames: Sequence[str],
+    output: str,
+    *,
+    num_partitions: int = 128,
+    num_workers: int | None = None,
+    worker_memory_bytes: int = 2 * 1024**3,
+    tmp_dir: str | None = None,
+) -> int:
+  """Groups action-value bags by FEN into a `chess_challenges_*.csv` file.
+
+  Each output row holds a position with its moves and win probabilities,
+  sorted by descending win probability, and rows are sorted by FEN.
+
+  Args:
+    filenames: The action-value Bagz files to aggregate.
+    output: The CSV file to write.
+    num_partitions: The number of on-disk hash partitions. More partitions
+      make each reduce smaller but keep more files open while partitioning.
+    num_workers: The number of worker processes. Defaults to the CPU count.
+    worker_memory_bytes: Approximate memory budget of a reduce worker before
+      it spills a sorted run to disk.
+    tmp_dir: Where to put the spill files. Needs about as much free space as
+      the input. Defaults to the system temporary directory.
+
+  Returns:
+    The number of positions written.
+  """
+  num_workers = num_workers or os.cpu_count() or 1
+  num_workers = min(num_workers, max(len(filenames), 1))
+  with tempfile.TemporaryDirectory(dir=tmp_dir) as spill_dir:
+    with concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+      list(executor.map(
+          _partition_bags,
+          [filenames[worker::num_workers] for worker in range(num_workers)],
+          itertools.repeat(spill_dir),
+          itertools.repeat(num_partitions),
+          range(num_workers),
+      ))
+      results = list(executor.map(
+          _reduce_partition,
+          itertools.repeat(spill_dir),
+          range(num_partitions),
+          itertools.repeat(num_workers),
+          itertools.repeat(worker_memory_bytes),
+      ))
+    _merge_csvs([filename for filename, _ in results], output)
+  return sum(num_positions for _, num_positions in results)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument(
+      'inputs', nargs='+', help='Action-value bag files or glob patterns.'
+  )
+  parser.add_argument('--output', required=True, help='The CSV to write.')
+  parser.add_argument('--num_partitions', type=int, default=128)
+  parser.add_argument('--num_workers', type=int, default=None)
+  parser.add_argument(
+      '--worker_memory_gb',
+      type=float,
+      default=2.0,
+      help='Memory budget of each reduce worker before spilling to disk.',
+  )
+  parser.add_argument('--tmp_dir', default=None)
+  args = parser.parse_args(argv)
+
+  filenames = sorted(
+      itertools.chain.from_iterable(map(glob.glob, args.inputs))
+  )
+  if not filenames:
+    raise FileNotFoundError(f'No bag files match {args.inputs}')
+  num_positions = aggregate_action_values(
+      filenames,
+      args.output,
+      num_partitions=args.num_partitions,
+      num_workers=args.num_workers,
+      worker_memory_bytes=int(args.worker_memory_gb * 1024**3),
+      tmp_dir=args.tmp_dir,
+  )
+  print(f'Wrote {num_positions} positions from {len(filenames)} bags to '
+        f'{args.output}')
+
+
+if __name__ == '__main__':
+  main()
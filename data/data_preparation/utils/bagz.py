@@ -5,13 +5,16 @@ serialised protocol buffers. It supports fast index based look-up.
 """
 
 import bisect
-from collections.abc import Sequence
+import collections
+from collections.abc import Iterable, Sequence
+import concurrent.futures
 import itertools
 import mmap
 import os
 import re
 import shutil
 import struct
+import threading
 from typing import Any, SupportsIndex
 
 from etils import epath
@@ -19,6 +22,39 @@ from typing_extensions import Self
 import zstandard as zstd
 
 
+def _dictionary_filename(filename: str) -> str:
+  directory, name = os.path.split(filename)
+  return os.path.join(directory, 'dict.' + name)
+
+
+def _load_dictionary(filename: str) -> zstd.ZstdCompressionDict | None:
+  """Loads the zstd dictionary stored alongside a Bagz file, if any."""
+  try:
+    with open(_dictionary_filename(filename), 'rb') as f:
+      return zstd.ZstdCompressionDict(f.read())
+  except FileNotFoundError:
+    return None
+
+
+def train_dictionary(
+    samples: Iterable[bytes], dict_size: int = 112_640
+) -> zstd.ZstdCompressionDict:
+  """Trains a zstd dictionary for compressing short records.
+
+  Small records such as FEN/move tuples compress poorly on their own because
+  each zstd frame starts from an empty history. A dictionary trained on a few
+  thousand representative records gives every frame a shared history.
+
+  Args:
+    samples: Representative (uncompressed) records.
+    dict_size: The maximum size of the dictionary in bytes.
+
+  Returns:
+    The trained dictionary, to be passed to `BagWriter`.
+  """
+  return zstd.train_dictionary(dict_size, list(samples))
+
+
 class BagFileReader(Sequence[bytes]):
   """Reader for single Bagz files."""
 
@@ -35,10 +71,28 @@ class BagFileReader(Sequence[bytes]):
       filename: The name of the single Bagz file to read.
       separate_limits: Whether the limits are stored in a separate file.
       decompress: Whether to decompress the records. If None, uses the file
-        extension to determine whether to decompress.
+        extension to determine whether to decompress. If a zstd dictionary
+        written by `BagWriter` (`dict.<name>`) exists next to the file, it is
+        used for decompression.
     """
     if decompress or (decompress is None and filename.endswith('.bagz')):
-      self._process = lambda x: zstd.decompress(x) if x else x
+      dictionary = _load_dictionary(filename)
+      if dictionary is None:
+        self._process = lambda x: zstd.decompress(x) if x else x
+      else:
+        # Decompressors are not thread-safe, so keep one per reading thread.
+        local = threading.local()
+
+        def _decompress(x: bytes) -> bytes:
+          if not x:
+            return x
+          if (decompressor := getattr(local, 'decompressor', None)) is None:
+            decompressor = local.decompressor = zstd.ZstdDecompressor(
+                dict_data=dictionary
+            )
+          return decompressor.decompress(x)
+
+        self._process = _decompress
     else:
       self._process = lambda x: x
     self._filename = filename
@@ -81,6 +135,11 @@ class BagFileReader(Sequence[bytes]):
     """Returns the number of records in the Bagz file."""
     return self._num_records
 
+  @property
+  def shard_lengths(self) -> tuple[int, ...]:
+    """Returns the number of records in each shard (a single one here)."""
+    return (self._num_records,)
+
   def __getitem__(self, index: SupportsIndex) -> bytes:
     """Returns a record from the Bagz file."""
     i = index.__index__()
@@ -132,6 +191,11 @@ class BagShardReader(Sequence[bytes]):
     """Returns the number of records in the Bagz file."""
     return self._accum[-1]
 
+  @property
+  def shard_lengths(self) -> tuple[int, ...]:
+    """Returns the number of records in each shard, in shard order."""
+    return tuple(map(len, self._bags))
+
   def __getitem__(self, index: int) -> bytes:
     if index < 0:
       index += self._accum[-1]
@@ -180,6 +244,11 @@ class BagReader(Sequence[bytes]):
     """Returns the number of records in the Bagz file."""
     return len(self._reader)
 
+  @property
+  def shard_lengths(self) -> tuple[int, ...]:
+    """Returns the number of records in each shard, in shard order."""
+    return self._reader.shard_lengths
+
   def __getitem__(self, index: SupportsIndex) -> bytes:
     """Returns a record from the Bagz file."""
     return self._reader[index]
@@ -195,6 +264,9 @@ class BagWriter:
       separate_limits: bool = False,
       compress: bool | None = None,
       compression_level: int = 0,
+      dictionary: zstd.ZstdCompressionDict | None = None,
+      num_threads: int = 0,
+      buffer_size: int = 1024,
   ) -> None:
     """Creates a BagWriter.
 
@@ -204,24 +276,89 @@ class BagWriter:
       compress: Whether to compress the records. If None, uses the file
         extension to determine whether to compress.
       compression_level: The compression level to use when compressing.
+      dictionary: A zstd dictionary (see `train_dictionary`) to compress the
+        records with. It is written next to the bag as `dict.<name>`, where
+        `BagFileReader` picks it up.
+      num_threads: If positive, records are buffered and compressed in batches
+        of `buffer_size` on a pool of `num_threads` threads. Records are still
+        written in order and each one stays a separate zstd frame, so reads
+        remain random-access.
+      buffer_size: The number of records per compression batch.
     """
-    if compress or (compress is None and filename.endswith('.bagz')):
-      self._process = zstd.ZstdCompressor(level=compression_level).compress
+    self._compress = compress or (
+        compress is None and filename.endswith('.bagz')
+    )
+    if self._compress:
+      self._compressor_args = dict(
+          level=compression_level, dict_data=dictionary
+      )
+      self._process = zstd.ZstdCompressor(**self._compressor_args).compress
     else:
       self._process = lambda x: x
     self._separate_limits = separate_limits
     directory, name = os.path.split(filename)
     self._records = open(filename, 'wb')
-    self._limits = open(os.path.join(directory, 'limits.' + name), 'wb+')
+    self._limits_filename = os.path.join(directory, 'limits.' + name)
+    if dictionary is not None and self._compress:
+      with open(_dictionary_filename(filename), 'wb') as f:
+        f.write(dictionary.as_bytes())
+
+    self._num_threads = num_threads
+    if num_threads > 0:
+      self._buffer_size = buffer_size
+      self._buffer = []
+      self._pending = collections.deque()
+      self._executor = concurrent.futures.ThreadPoolExecutor(num_threads)
+      self._local = threading.local()
+    self._limits = open(self._limits_filename, 'wb+')
 
   def write(self, data: bytes) -> None:
     """Writes a record to the Bagz file."""
+    if self._num_threads > 0:
+      self._buffer.append(data)
+      if len(self._buffer) >= self._buffer_size:
+        self._submit_buffer()
+      return
     if data:
       self._records.write(self._process(data))
     self._limits.write(struct.pack('<q', self._records.tell()))
 
+  def _compress_batch(self, batch: list[bytes]) -> list[bytes]:
+    """Compresses a batch of records with a thread-local compressor."""
+    if not self._compress:
+      return batch
+    if (compressor := getattr(self._local, 'compressor', None)) is None:
+      compressor = self._local.compressor = zstd.ZstdCompressor(
+          **self._compressor_args
+      )
+    return [compressor.compress(data) if data else data for data in batch]
+
+  def _submit_buffer(self) -> None:
+    """Hands the buffered records to the pool, bounding in-flight batches."""
+    if self._buffer:
+      self._pending.append(
+          self._executor.submit(self._compress_batch, self._buffer)
+      )
+      self._buffer = []
+    while len(self._pending) > 2 * self._num_threads:
+      self._write_batch(self._pending.popleft().result())
+
+  def _write_batch(self, batch: list[bytes]) -> None:
+    offset = self._records.tell()
+    limits = []
+    for data in batch:
+      if data:
+        self._records.write(data)
+        offset += len(data)
+      limits.append(offset)
+    self._limits.write(struct.pack(f'<{len(limits)}q', *limits))
+
   def flush(self) -> None:
     """Flushes the Bagz file."""
+    if self._num_threads > 0:
+      self._submit_buffer()
+      while self._pending:
+        self._write_batch(self._pending.popleft().result())
     self._records.flush()
     self._limits.flush()
 
@@ -234,6 +371,9 @@ class BagWriter:
 
   def close(self) -> None:
     """Concatenates the limits file to the end of the data file."""
+    if self._num_threads > 0:
+      self.flush()
+      self._executor.shutdown()
     if self._separate_limits:
       self._records.close()
       self._limits.close()
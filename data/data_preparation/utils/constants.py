@@ -0,0 +1,20 @@
+"""Coders for the records stored in the searchless_chess Bagz files."""
+
+from apache_beam import coders
+
+
+CODERS = {
+    'fen': coders.StrUtf8Coder(),
+    'move': coders.StrUtf8Coder(),
+    'count': coders.BigIntegerCoder(),
+    'win_prob': coders.FloatCoder(),
+}
+CODERS['action_value'] = coders.TupleCoder((
+    CODERS['fen'],
+    CODERS['move'],
+    CODERS['win_prob'],
+))
+CODERS['behavioral_cloning'] = coders.TupleCoder((
+    CODERS['fen'],
+    CODERS['move'],
+))
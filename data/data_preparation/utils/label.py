@@ -0,0 +1,365 @@
+"""Bulk action-value labeling of positions with a pool of UCI engines.
+
+New positions (from our own games, RL rollouts, ...) have no win
+probabilities. `label_positions` streams FENs through a pool of local engine
+processes, each running a multipv analysis over every legal move, converts the
+centipawn scores to win probabilities and writes one `(fen, move, win_prob)`
+record per move with `CODERS['action_value']`, i.e. bags in the format of the
+downloaded `action_value-*_data.bag` files.
+
+Analyses are kept in a SQLite `EvaluationCache` keyed by position (the EPD,
+i.e. the FEN without its move clocks, so transpositions reached at other move
+numbers share an entry) together with the depth they were searched to, so a
+position is never analysed twice at the same or a lower depth: re-running on
+overlapping inputs only searches the new positions, and asking for a deeper
+search only re-analyses what was searched shallower.
+
+Example (from `data/data_preparation`):
+
+  python -m utils.label --output rollouts.bag --cache evaluations.sqlite \
+      --depth 20 --num_engines 8 rollout_fens.txt
+"""
+
+import argparse
+import collections
+from collections.abc import Iterable, Iterator, Sequence
+import concurrent.futures
+import csv
+import json
+import math
+import os
+import queue
+import shutil
+import sqlite3
+
+import chess
+import chess.engine
+
+from utils import bagz
+from utils.constants import CODERS
+
+
+# Scale of the lichess centipawn to win-probability sigmoid.
+_CP_SCALE = 0.00368208
+
+_DEFAULT_ENGINE_PATH = shutil.which('stockfish') or '/opt/homebrew/bin/stockfish'
+
+
+def centipawns_to_win_probability(centipawns: float) -> float:
+  """Returns the win probability of a centipawn score (lichess formula)."""
+  return 0.5 + 0.5 * (2 / (1 + math.exp(-_CP_SCALE * centipawns)) - 1)
+
+
+def score_to_win_probability(score: chess.engine.Score) -> float:
+  """Returns the win probability of a score from the side to move's view.
+
+  Mates are certain wins or losses, so they are mapped to 1 and 0.
+  """
+  mate = score.mate()
+  if mate is not None:
+    return 1.0 if mate > 0 else 0.0
+  return centipawns_to_win_probability(score.score())
+
+
+class EvaluationCache:
+  """Persistent position -> `[(move, win_prob), ...]` cache in a SQLite file.
+
+  Positions are keyed by `chess.Board.epd` (the FEN without move clocks) in
+  the `fen` column.
+
+  Every entry records the search depth and the number of moves (multipv) of
+  its analysis. `get` only returns entries searched at least as deep and as
+  wide as requested, and `put` never replaces an entry with a shallower or
+  narrower one.
+  """
+
+  def __init__(self, filename: str) -> None:
+    self._connection = sqlite3.connect(filename)
+    self._connection.execute('PRAGMA journal_mode=WAL')
+    self._connection.execute(
+        'CREATE TABLE IF NOT EXISTS evaluations ('
+        ' fen TEXT PRIMARY KEY,'
+        ' depth INTEGER NOT NULL,'
+        ' num_moves INTEGER NOT NULL,'
+        ' action_values TEXT NOT NULL)'
+    )
+    self._connection.commit()
+
+  def __len__(self) -> int:
+    return self._connection.execute(
+        'SELECT COUNT(*) FROM evaluations'
+    ).fetchone()[0]
+
+  def get(
+      self, fen: str, depth: int, num_moves: int = 0
+  ) -> list[tuple[str, float]] | None:
+    """Returns the cached action values of `fen`.
+
+    Args:
+      fen: The position, as written by `chess.Board.epd`.
+      depth: The minimum search depth of the analysis.
+      num_moves: The minimum number of evaluated moves.
+
+    Returns:
+      The `(move, win_prob)` pairs, or `None` if the position was not
+      analysed deep or wide enough.
+    """
+    row = self._connection.execute(
+        'SELECT action_values FROM evaluations'
+        ' WHERE fen = ? AND depth >= ? AND num_moves >= ?',
+        (fen, depth, num_moves),
+    ).fetchone()
+    if row is None:
+      return None
+    return [(move, win_prob) for move, win_prob in json.loads(row[0])]
+
+  def put(
+      self, fen: str, depth: int, action_values: Sequence[tuple[str, float]]
+  ) -> None:
+    """Stores an analysis unless the cached one is deeper or wider.
+
+    Writes are committed by `commit` (or `close`), so they can be batched.
+    """
+    self._connection.execute(
+        'INSERT INTO evaluations (fen, depth, num_moves, action_values)'
+        ' VALUES (?, ?, ?, ?)'
+        ' ON CONFLICT(fen) DO UPDATE SET'
+        ' depth = excluded.depth, num_moves = excluded.num_moves,'
+        ' action_values = excluded.action_values'
+        ' WHERE excluded.depth >= evaluations.depth'
+        ' AND excluded.num_moves >= evaluations.num_moves',
+        (fen, depth, len(action_values), json.dumps(action_values)),
+    )
+
+  def commit(self) -> None:
+    self._connection.commit()
+
+  def close(self) -> None:
+    self._connection.commit()
+    self._connection.close()
+
+  def __enter__(self) -> 'EvaluationCache':
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback) -> None:
+    self.close()
+
+
+class EnginePool:
+  """A pool of UCI engine processes shared by the labeling threads.
+
+  `chess.engine.SimpleEngine` calls block, so each analysis runs in a thread
+  that checks an idle engine out of the pool for its duration; with one
+  thread per engine, all engine processes search in parallel.
+  """
+
+  def __init__(
+      self,
+      engine_path: str,
+      num_engines: int,
+      options: dict[str, int | str] | None = None,
+  ) -> None:
+    self._engines = []
+    self._idle = queue.SimpleQueue()
+    try:
+      for _ in range(num_engines):
+        engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+        self._engines.append(engine)
+        if options:
+          engine.configure(options)
+        self._idle.put(engine)
+    except BaseException:
+      self.close()
+      raise
+
+  def __len__(self) -> int:
+    return len(self._engines)
+
+  def analyse(
+      self, fen: str, depth: int, multipv: int | None
+  ) -> list[tuple[str, float]]:
+    """Returns the `(move, win_prob)` pairs of the `multipv` best moves.
+
+    Args:
+      fen: The position.
+      depth: The search depth.
+      multipv: The number of moves to evaluate, `None` for every legal move.
+
+    Returns:
+      The evaluated moves in the engine's order (best first). Empty if the
+      game is over.
+    """
+    board = chess.Board(fen)
+    num_moves = board.legal_moves.count()
+    if num_moves == 0:
+      return []
+    if multipv is not None:
+      num_moves = min(num_moves, multipv)
+    engine = self._idle.get()
+    try:
+      infos = engine.analyse(
+          board, chess.engine.Limit(depth=depth), multipv=num_moves
+      )
+    finally:
+      self._idle.put(engine)
+    return [
+        (info['pv'][0].uci(), score_to_win_probability(info['score'].relative))
+        for info in infos
+        if info.get('pv')
+    ]
+
+  def close(self) -> None:
+    for engine in self._engines:
+      engine.quit()
+    self._engines = []
+
+  def __enter__(self) -> 'EnginePool':
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback) -> None:
+    self.close()
+
+
+def label_positions(
+    fens: Iterable[str],
+    output: str,
+    *,
+    cache: EvaluationCache,
+    engine_path: str = _DEFAULT_ENGINE_PATH,
+    depth: int = 20,
+    multipv: int | None = None,
+    num_engines: int | None = None,
+    engine_options: dict[str, int | str] | None = None,
+    commit_every: int = 1000,
+) -> dict[str, int]:
+  """Labels a stream of positions and writes their action values to a bag.
+
+  Positions are written in input order (duplicates, including the same
+  position at another move number, once). Cached positions
+  are written without starting an engine search; the others are analysed by
+  the engine pool, with at most a few searches per engine in flight so the
+  input can be an unbounded stream.
+
+  Args:
+    fens: The positions to label.
+    output: The action-value bag to write.
+    cache: The evaluation cache, read and updated.
+    engine_path: The UCI engine binary.
+    depth: The search depth of every analysis.
+    multipv: The number of moves labeled per position, `None` for all.
+    num_engines: The number of engine processes, defaults to the CPU count.
+    engine_options: UCI options for every engine, e.g. `{'Hash': 256}`.
+    commit_every: The number of new analyses between cache commits.
+
+  Returns:
+    Counts of the positions seen, found in the cache, analysed and records
+    written.
+  """
+  num_engines = num_engines or os.cpu_count() or 1
+  options = {'Threads': 1, **(engine_options or {})}
+  stats = collections.Counter(positions=0, cached=0, analysed=0, records=0)
+  encode = CODERS['action_value'].encode
+  seen = set()
+  # (epd, fen, action values or future) in input order
+  pending = collections.deque()
+  max_pending = 4 * num_engines
+
+  with bagz.BagWriter(output) as writer, EnginePool(
+      engine_path, num_engines, options
+  ) as pool, concurrent.futures.ThreadPoolExecutor(num_engines) as executor:
+
+    def write_ready(limit: int) -> None:
+      """Writes the finished head of `pending`, waiting while it is over `limit`."""
+      while pending:
+        epd, fen, result = pending[0]
+        if isinstance(result, concurrent.futures.Future):
+          if len(pending) <= limit and not result.done():
+            return
+          result = result.result()
+          cache.put(epd, depth, result)
+          stats['analysed'] += 1
+          if stats['analysed'] % commit_every == 0:
+            cache.commit()
+        pending.popleft()
+        for move, win_prob in result:
+          writer.write(encode((fen, move, win_prob)))
+        stats['records'] += len(result)
+
+    for fen in fens:
+      board = chess.Board(fen)
+      fen = board.fen()
+      epd = board.epd()
+      if epd in seen:
+        continue
+      seen.add(epd)
+      stats['positions'] += 1
+      num_moves = board.legal_moves.count()
+      if multipv is not None:
+        num_moves = min(num_moves, multipv)
+      action_values = cache.get(epd, depth, num_moves)
+      if action_values is not None:
+        stats['cached'] += 1
+        pending.append((epd, fen, action_values))
+      else:
+        pending.append(
+            (epd, fen, executor.submit(pool.analyse, fen, depth, multipv))
+        )
+      write_ready(limit=max_pending)
+    write_ready(limit=0)
+  cache.commit()
+  return dict(stats)
+
+
+def iter_fens(filename: str) -> Iterator[str]:
+  """Yields the FENs of a CSV with a `FEN` column or a file of FEN lines."""
+  with open(filename, newline='') as f:
+    if filename.endswith('.csv'):
+      for row in csv.DictReader(f):
+        yield row['FEN']
+    else:
+      for line in f:
+        if line.strip():
+          yield line.strip()
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument(
+      'inputs',
+      nargs='+',
+      help='Files of FENs, one per line, or CSVs with a FEN column.',
+  )
+  parser.add_argument('--output', required=True, help='The bag to write.')
+  parser.add_argument(
+      '--cache', required=True, help='The SQLite evaluation cache.'
+  )
+  parser.add_argument('--engine', default=_DEFAULT_ENGINE_PATH)
+  parser.add_argument('--depth', type=int, default=20)
+  parser.add_argument(
+      '--multipv',
+      type=int,
+      default=None,
+      help='Moves labeled per position (default: all legal moves).',
+  )
+  parser.add_argument('--num_engines', type=int, default=None)
+  parser.add_argument('--hash_mb', type=int, default=64)
+  args = parser.parse_args(argv)
+
+  with EvaluationCache(args.cache) as cache:
+    stats = label_positions(
+        (fen for filename in args.inputs for fen in iter_fens(filename)),
+        args.output,
+        cache=cache,
+        engine_path=args.engine,
+        depth=args.depth,
+        multipv=args.multipv,
+        num_engines=args.num_engines,
+        engine_options={'Hash': args.hash_mb},
+    )
+  print(f'Labeled {stats["positions"]} positions ({stats["cached"]} cached, '
+        f'{stats["analysed"]} analysed), wrote {stats["records"]} records to '
+        f'{args.output}')
+
+
+if __name__ == '__main__':
+  main()
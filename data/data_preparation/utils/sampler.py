@@ -0,0 +1,196 @@
+"""Locality-aware shuffled sampling over sharded Bagz files.
+
+Uniformly random `__getitem__` calls over 2148 memory-mapped shards touch a
+different page on almost every read, which thrashes the page cache on
+spinning or network disks. `BlockShuffleSampler` shuffles at three levels
+instead:
+
+1. the shard order is shuffled,
+2. each shard is cut into contiguous blocks of `block_size` records whose
+   order is shuffled within the shard,
+3. the records of `window_blocks` consecutive blocks are read block by block
+   into memory and shuffled there.
+
+Reads are therefore sequential within a block and confined to a few shards at
+a time, while the window shuffle mixes records from `window_blocks` unrelated
+parts of the dataset.
+
+Every epoch is a deterministic function of `(seed, epoch)`, blocks are dealt
+round-robin to the `world_size * num_workers` consumers (ranks times
+data-loader workers), and the position inside an epoch is a small
+checkpointable state.
+"""
+
+from collections.abc import Iterator, Sequence
+from typing import Any
+
+import numpy as np
+
+
+class BlockShuffleSampler:
+  """Block-level shuffled sampler over the records of sharded Bagz files."""
+
+  def __init__(
+      self,
+      shard_lengths: Sequence[int],
+      *,
+      block_size: int = 1024,
+      window_blocks: int = 64,
+      seed: int = 0,
+      rank: int = 0,
+      world_size: int = 1,
+      worker_id: int = 0,
+      num_workers: int = 1,
+      drop_remainder: bool = True,
+  ) -> None:
+    """Creates a BlockShuffleSampler.
+
+    Args:
+      shard_lengths: The number of records in each shard, e.g. the
+        `shard_lengths` of a `BagShardReader`. Indices are global record
+        indices of the concatenated shards, as used by `BagShardReader`.
+      block_size: The number of consecutive records read sequentially.
+      window_blocks: The number of blocks whose records are shuffled together
+        in memory. The buffer holds `block_size * window_blocks` records.
+      seed: The base seed; each epoch is shuffled with `(seed, epoch)`.
+      rank: The index of this process among `world_size` training processes.
+      world_size: The number of training processes.
+      worker_id: The index of this data-loader worker within its process
+        (e.g. `torch.utils.data.get_worker_info().id`).
+      num_workers: The number of data-loader workers per process.
+      drop_remainder: Whether to truncate every consumer to the smallest
+        per-consumer sample count, so all ranks see the same number of
+        samples per epoch.
+    """
+    if not 0 <= rank < world_size or not 0 <= worker_id < num_workers:
+      raise ValueError(
+          f'Invalid consumer: rank {rank}/{world_size}, '
+          f'worker {worker_id}/{num_workers}.'
+      )
+    self._shard_lengths = np.asarray(shard_lengths, dtype=np.int64)
+    self._shard_starts = np.concatenate(
+        ([0], np.cumsum(self._shard_lengths)[:-1])
+    )
+    self._block_size = block_size
+    self._window_blocks = window_blocks
+    self._seed = seed
+    self._consumer = rank * num_workers + worker_id
+    self._num_consumers = world_size * num_workers
+    self._drop_remainder = drop_remainder
+    self._epoch = 0
+    self._window = 0
+    self._offset = 0
+
+  def _epoch_blocks(self) -> tuple[np.ndarray, np.ndarray, int]:
+    """Returns this consumer's block starts, lengths and its sample budget."""
+    rng = np.random.default_rng((self._seed, self._epoch))
+    starts, lengths = [], []
+    for shard in rng.permutation(len(self._shard_lengths)):
+      shard_length = self._shard_lengths[shard]
+      num_blocks = -(-shard_length // self._block_size)
+      block_starts = rng.permutation(num_blocks) * self._block_size
+      starts.append(self._shard_starts[shard] + block_starts)
+      lengths.append(np.minimum(self._block_size, shard_length - block_starts))
+    starts = np.concatenate(starts) if starts else np.zeros(0, np.int64)
+    lengths = np.concatenate(lengths) if lengths else np.zeros(0, np.int64)
+
+    owners = np.arange(len(starts)) % self._num_consumers
+    counts = np.bincount(
+        owners, weights=lengths, minlength=self._num_consumers
+    ).astype(np.int64)
+    mine = owners == self._consumer
+    budget = counts.min() if self._drop_remainder else counts[self._consumer]
+    return starts[mine], lengths[mine], int(budget)
+
+  def _window_indices(
+      self, starts: np.ndarray, lengths: np.ndarray, window: int
+  ) -> tuple[np.ndarray, np.ndarray]:
+    """Returns a window's indices in read order and its shuffle permutation."""
+    lo = window * self._window_blocks
+    starts = starts[lo : lo + self._window_blocks]
+    lengths = lengths[lo : lo + self._window_blocks]
+    order = np.argsort(starts)
+    starts, lengths = starts[order], lengths[order]
+    total = int(lengths.sum())
+    # Concatenated aranges: start of each block plus the offset inside it.
+    block_offsets = np.cumsum(lengths) - lengths
+    indices = np.repeat(starts - block_offsets, lengths) + np.arange(total)
+    rng = np.random.default_rng(
+        (self._seed, self._epoch, self._consumer, window)
+    )
+    return indices, rng.permutation(total)
+
+  def _iter_windows(self) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Yields (sorted indices, permutation) per window from the saved state.
+
+    Advances `window`/`offset` as the caller consumes the permutation and
+    moves to the next epoch once the current one is exhausted.
+    """
+    starts, lengths, budget = self._epoch_blocks()
+    num_windows = -(-len(starts) // self._window_blocks)
+    consumed = 0
+    for window in range(num_windows):
+      indices, permutation = self._window_indices(starts, lengths, window)
+      permutation = permutation[: budget - consumed]
+      consumed += len(indices)
+      if window < self._window:
+        continue
+      yield indices, permutation
+      self._window, self._offset = window + 1, 0
+      if consumed >= budget:
+        break
+    self._epoch, self._window, self._offset = self._epoch + 1, 0, 0
+
+  def __iter__(self) -> Iterator[int]:
+    """Yields the global record indices of the rest of the current epoch."""
+    for indices, permutation in self._iter_windows():
+      for position in permutation[self._offset :]:
+        self._offset += 1
+        yield int(indices[position])
+
+  def iter_records(self, reader: Sequence[bytes]) -> Iterator[bytes]:
+    """Yields the records of the rest of the current epoch from `reader`.
+
+    Each window is first read in index order, i.e. block by block, and then
+    emitted in shuffled order from memory. Yields the same records in the
+    same order as `reader[i] for i in self`.
+
+    Args:
+      reader: A reader over the shards, e.g. a `BagShardReader`.
+    """
+    for indices, permutation in self._iter_windows():
+      remaining = permutation[self._offset :]
+      # Only read what the rest of the window needs, still in index order.
+      needed = np.zeros(len(indices), dtype=bool)
+      needed[remaining] = True
+      buffer = {int(i): reader[int(indices[i])] for i in np.flatnonzero(needed)}
+      for position in remaining:
+        self._offset += 1
+        yield buffer.pop(int(position))
+
+  def __len__(self) -> int:
+    """Returns the number of samples this consumer yields per epoch."""
+    return self._epoch_blocks()[2]
+
+  def set_epoch(self, epoch: int) -> None:
+    """Starts `epoch` from its beginning."""
+    self._epoch, self._window, self._offset = epoch, 0, 0
+
+  def state_dict(self) -> dict[str, Any]:
+    """Returns the position in the sample stream, for checkpointing."""
+    return {
+        'seed': self._seed,
+        'epoch': self._epoch,
+        'window': self._window,
+        'offset': self._offset,
+    }
+
+  def load_state_dict(self, state: dict[str, Any]) -> None:
+    """Resumes from a `state_dict()`; the next sample is the one after it."""
+    if state['seed'] != self._seed:
+      raise ValueError(
+          f'Checkpoint seed {state["seed"]} does not match {self._seed}.'
+      )
+    self._epoch = state['epoch']
+    self._window = state['window']
+    self._offset = state['offset']
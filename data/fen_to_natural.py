@@ -1,47 +1,9 @@
-import re
 import csv
 import ast
 
-def fen_to_natural(fen: str) -> str:
-    piece_map = {
-        'K': 'White King', 'Q': 'White Queen', 'R': 'White Rook', 'B': 'White Bishop', 'N': 'White Knight', 'P': 'White Pawn',
-        'k': 'Black King', 'q': 'Black Queen', 'r': 'Black Rook', 'b': 'Black Bishop', 'n': 'Black Knight', 'p': 'Black Pawn'
-    }
-    
-    parts = fen.split()
-    board_fen, turn, castling, en_passant, halfmove, fullmove = parts[:6]
-    
-    board_rows = board_fen.split('/')
-    board = []
-    
-    for r, row in enumerate(board_rows):
-        expanded_row = ''
-        for char in row:
-            if char.isdigit():
-                expanded_row += '.' * int(char)
-            else:
-                expanded_row += char
-        board.append(expanded_row)
-    
-    natural_description = []
-    natural_description.append(f"{'White' if turn == 'w' else 'Black'} to move.")
-    
-    for r in range(8):
-        for c in range(8):
-            piece = board[r][c]
-            if piece != '.':
-                natural_description.append(f"{piece_map[piece]} on {chr(97 + c)}{8 - r}.")
-    
-    if castling != '-':
-        castling_rights = ' '.join([f"{('White' if c.isupper() else 'Black')} {'King-side' if c in 'Kk' else 'Queen-side'} castling" for c in castling])
-        natural_description.append(f"Castling rights: {castling_rights}.")
-    
-    if en_passant != '-':
-        natural_description.append(f"En Passant available on {en_passant}.")
-    
-    natural_description.append(f"Move number: {fullmove}.")
-    
-    return ' '.join(natural_description)
+# The renderer is shared with the prompt builders in `chat`; run this script from the
+# repo root as `python -m data.fen_to_natural` so the package is importable.
+from chat.render import render_natural as fen_to_natural
 
 def parse_csv():
     parsed = []
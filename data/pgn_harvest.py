@@ -0,0 +1,426 @@
+"""
+Streaming, multiprocess harvesting of training positions from PGN game collections.
+
+Inputs are cut into byte ranges at game boundaries (a blank line followed by a header tag in
+.pgn files, a line break in the .jsonl shards of data/data_pgn/download.ipynb, whose "text"
+field holds the PGN, or rowid ranges of the `games` table of elo_evaluator/ratings.py), and
+the ranges are parsed in a process pool. Games are first filtered on their headers alone
+(`chess.pgn.read_headers`); only the accepted ones have their mainline replayed, by a visitor
+that skips variations and comments and renders the FEN of the sampled plies only.
+
+Positions are deduplicated by `position_index.hash_fens` (optionally against an exclusion
+index, e.g. the test split) and streamed to a Bagz file of (FEN, move) records or to a parquet
+file (FEN, Move, Result for the side to move, Ply, ratings, source) one chunk at a time, so
+the corpus is never held in memory. The positions already written are kept in a Bloom filter
+(about 2.4 bytes per position at the default 1e-4 error rate, instead of ~70 in a Python set):
+a false positive drops a position that was not a duplicate, a duplicate is never written.
+The filter is sized from the input size; pass `--dedup-capacity` when that estimate is far off.
+
+Usage (from the repo root):
+    python -m data.pgn_harvest --output data/harvest.parquet --min-ply 12 --min-elo 2200 \\
+        --positions-per-game 8 --exclude data/index/test.npy data/data_pgn/chess_data_pgn/ccrl-data.jsonl-*
+    python -m data.pgn_harvest --output data/tournament.bag elo_evaluator/games.sqlite
+"""
+import io
+import os
+import json
+import random
+import sqlite3
+import argparse
+import multiprocessing
+from typing import List, Optional, Sequence, Tuple
+
+import chess
+import chess.pgn
+import numpy as np
+
+from .position_index import KEY_TYPES, BloomFilter, hash_fens, load_position_set
+
+CHUNK_BYTES = 16 * 2**20
+SQLITE_CHUNK_ROWS = 2000
+_BOUNDARY_WINDOW = 2**20
+# Bounds for sizing the dedup filter: PGN bytes per ply (SAN move and move number), bytes per
+# game (headers and moves) and plies per game in a database
+_BYTES_PER_PLY = 6
+_BYTES_PER_GAME = 600
+_PLIES_PER_GAME = 80
+_RESULT_SCORES = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+# (FEN, move, result for the side to move, ply, white Elo, black Elo, source)
+Record = Tuple[str, str, float, int, Optional[int], Optional[int], str]
+
+
+# ====================================================
+# Sampling rules
+# ====================================================
+class SamplingRules:
+    def __init__(
+        self,
+        min_ply: int = 0,
+        max_ply: Optional[int] = None,
+        min_elo: Optional[int] = None,
+        positions_per_game: Optional[int] = None,
+        require_result: bool = True,
+        seed: int = 0,
+    ):
+        """
+        Which games are read and which of their positions are kept.
+
+        Args:
+            min_ply (int): First ply sampled (skips the opening book moves).
+            max_ply (Optional[int]): Last ply sampled (None for the whole game).
+            min_elo (Optional[int]): Minimum WhiteElo and BlackElo (games without ratings are
+                skipped when set).
+            positions_per_game (Optional[int]): Sample this many plies of each game uniformly
+                (None keeps every ply in range).
+            require_result (bool): Skip unfinished games ("*"), whose result is unknown.
+            seed (int): Sampling seed; each input range is sampled deterministically.
+        """
+        self.min_ply = min_ply
+        self.max_ply = max_ply
+        self.min_elo = min_elo
+        self.positions_per_game = positions_per_game
+        self.require_result = require_result
+        self.seed = seed
+
+    def accepts(self, headers: chess.pgn.Headers) -> bool:
+        if self.require_result and headers.get("Result") not in _RESULT_SCORES:
+            return False
+        if self.min_elo is not None:
+            elos = (_elo(headers, "WhiteElo"), _elo(headers, "BlackElo"))
+            if None in elos or min(elos) < self.min_elo:
+                return False
+        return True
+
+
+def _elo(headers: chess.pgn.Headers, key: str) -> Optional[int]:
+    try:
+        return int(headers.get(key, ""))
+    except ValueError:
+        return None
+
+
+class _MainlineSampler(chess.pgn.BaseVisitor):
+    """
+    Replays the mainline and keeps the FEN and move of the sampled plies (reservoir sampling).
+    A game with an illegal or unparsable move yields None instead of raising.
+    """
+
+    def __init__(self, rules: SamplingRules, rng: random.Random):
+        self.rules = rules
+        self.rng = rng
+        self.samples = []
+        self.ply = 0
+        self.eligible = 0
+        self.bad = False
+
+    def handle_error(self, error: Exception):
+        self.bad = True
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board: chess.Board, move: chess.Move):
+        ply = self.ply
+        self.ply += 1
+        if ply < self.rules.min_ply or (self.rules.max_ply is not None and ply > self.rules.max_ply):
+            return
+        self.eligible += 1
+        k = self.rules.positions_per_game
+        if k is None or len(self.samples) < k:
+            self.samples.append((board.fen(), move.uci(), board.turn, ply))
+        else:
+            slot = self.rng.randrange(self.eligible)
+            if slot < k:
+                self.samples[slot] = (board.fen(), move.uci(), board.turn, ply)
+
+    def result(self):
+        return None if self.bad else self.samples
+
+
+# ====================================================
+# Parsing (worker processes)
+# ====================================================
+def _parse_pgn_text(text: str, rules: SamplingRules, rng: random.Random, source: str, records: List[Record], stats: dict):
+    handle = io.StringIO(text)
+    while True:
+        offset = handle.tell()
+        headers = chess.pgn.read_headers(handle)
+        if headers is None:
+            return
+        stats["games"] += 1
+        if not rules.accepts(headers):
+            continue
+        stats["accepted_games"] += 1
+        end = handle.tell()
+        handle.seek(offset)
+        samples = chess.pgn.read_game(handle, Visitor=lambda: _MainlineSampler(rules, rng))
+        handle.seek(end)
+        if samples is None:
+            stats["bad_games"] += 1
+            continue
+        white_score = _RESULT_SCORES.get(headers.get("Result"), 0.5)
+        white_elo, black_elo = _elo(headers, "WhiteElo"), _elo(headers, "BlackElo")
+        for fen, move, turn, ply in samples:
+            score = white_score if turn == chess.WHITE else 1.0 - white_score
+            records.append((fen, move, score, ply, white_elo, black_elo, source))
+
+
+def _harvest_chunk(task) -> Tuple[List[Record], np.ndarray, dict]:
+    """Parses one input range; returns its records, their position hashes and counts."""
+    path, start, end, rules, key = task
+    rng = random.Random(f"{rules.seed}:{path}:{start}")
+    records, stats = [], {"games": 0, "accepted_games": 0, "bad_games": 0}
+    source = os.path.basename(path)
+    kind = _input_kind(path)
+    if kind == "sqlite":
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        rows = connection.execute("SELECT pgn FROM games WHERE rowid >= ? AND rowid < ? AND pgn IS NOT NULL", (start, end))
+        _parse_pgn_text("\n\n".join(pgn for pgn, in rows), rules, rng, source, records, stats)
+        connection.close()
+    else:
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start).decode("utf-8", errors="replace")
+        if kind == "jsonl":
+            for line in data.splitlines():
+                if line.strip():
+                    _parse_pgn_text(json.loads(line)["text"], rules, rng, source, records, stats)
+        else:
+            _parse_pgn_text(data, rules, rng, source, records, stats)
+    hashes = hash_fens([record[0] for record in records], key)
+    return records, hashes, stats
+
+
+# ====================================================
+# Splitting
+# ====================================================
+def _input_kind(path: str) -> str:
+    if path.endswith((".sqlite", ".db")):
+        return "sqlite"
+    if ".jsonl" in os.path.basename(path):
+        return "jsonl"
+    return "pgn"
+
+
+def _next_boundary(f, offset: int, size: int, separator: bytes) -> int:
+    """The first game start at or after `offset` (right after `separator`)."""
+    f.seek(offset)
+    carry = b""
+    while offset < size:
+        window = f.read(_BOUNDARY_WINDOW)
+        data = carry + window
+        found = data.find(separator)
+        if found >= 0:
+            return offset - len(carry) + found + len(separator) - (1 if separator.endswith(b"[") else 0)
+        carry = data[-len(separator):]
+        offset += len(window)
+    return size
+
+
+def split_input(path: str, chunk_bytes: int = CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """Cuts an input into (start, end) ranges that begin and end at game boundaries."""
+    kind = _input_kind(path)
+    if kind == "sqlite":
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        low, high = connection.execute("SELECT MIN(rowid), MAX(rowid) FROM games").fetchone()
+        connection.close()
+        if low is None:
+            return []
+        return [(start, min(start + SQLITE_CHUNK_ROWS, high + 1)) for start in range(low, high + 1, SQLITE_CHUNK_ROWS)]
+
+    size = os.path.getsize(path)
+    separator = b"\n" if kind == "jsonl" else b"\n\n["
+    boundaries = [0]
+    with open(path, "rb") as f:
+        while boundaries[-1] + chunk_bytes < size:
+            boundaries.append(_next_boundary(f, boundaries[-1] + chunk_bytes, size, separator))
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+# ====================================================
+# Output
+# ====================================================
+class _BagOutput:
+    """(FEN, move) records in the behavioral cloning format of the searchless_chess bags."""
+
+    def __init__(self, path: str):
+        from .data_preparation.utils import bagz
+        from .data_preparation.utils.constants import CODERS
+
+        self._encode = CODERS["behavioral_cloning"].encode
+        self._writer = bagz.BagWriter(path)
+
+    def write(self, records: Sequence[Record]):
+        for record in records:
+            self._writer.write(self._encode((record[0], record[1])))
+
+    def close(self):
+        self._writer.close()
+
+
+class _ParquetOutput:
+    def __init__(self, path: str, row_group_size: int = 100_000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ("FEN", pa.string()),
+            ("Move", pa.string()),
+            ("Result", pa.float32()),
+            ("Ply", pa.int32()),
+            ("WhiteElo", pa.int32()),
+            ("BlackElo", pa.int32()),
+            ("Source", pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._row_group_size = row_group_size
+        self._buffer = []
+
+    def write(self, records: Sequence[Record]):
+        self._buffer.extend(records)
+        if len(self._buffer) >= self._row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            columns = list(zip(*self._buffer))
+            self._writer.write_table(self._pa.Table.from_arrays(
+                [self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+                schema=self._schema,
+            ))
+            self._buffer = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def _open_output(path: str):
+    if path.endswith(".bag"):
+        return _BagOutput(path)
+    if path.endswith(".parquet"):
+        return _ParquetOutput(path)
+    raise ValueError(f"Unknown output format for {path}; use a .bag or .parquet file.")
+
+
+# ====================================================
+# Harvesting
+# ====================================================
+def _estimate_positions(inputs: Sequence[str], rules: SamplingRules) -> int:
+    """Upper bound of the positions sampled from the inputs, from their sizes."""
+    total = 0
+    for path in inputs:
+        if _input_kind(path) == "sqlite":
+            connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            num_games = connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+            connection.close()
+            plies = num_games * _PLIES_PER_GAME
+        else:
+            size = os.path.getsize(path)
+            num_games, plies = size // _BYTES_PER_GAME + 1, size // _BYTES_PER_PLY
+        if rules.positions_per_game is not None:
+            plies = min(plies, num_games * rules.positions_per_game)
+        total += plies
+    return max(total, 1)
+
+
+def harvest(
+    inputs: Sequence[str],
+    output: str,
+    rules: Optional[SamplingRules] = None,
+    num_workers: Optional[int] = None,
+    chunk_bytes: int = CHUNK_BYTES,
+    exclude: Optional[str] = None,
+    key: str = "fen",
+    dedup_capacity: Optional[int] = None,
+    dedup_error_rate: float = 1e-4,
+) -> dict:
+    """
+    Harvests deduplicated positions from PGN collections into a .bag or .parquet file.
+
+    Args:
+        inputs (Sequence[str]): .pgn files, .jsonl shards ({"text": pgn} lines) or game databases
+            (.sqlite / .db with a `games.pgn` column).
+        output (str): The .bag or .parquet file to write.
+        rules (Optional[SamplingRules]): Game filters and position sampling (default: every
+            position of every finished game).
+        num_workers (Optional[int]): Parser processes (default: the CPU count).
+        chunk_bytes (int): Approximate size of the input ranges handed to the workers.
+        exclude (Optional[str]): A PositionIndex (.npy) or BloomFilter (.npz) of positions to
+            leave out, e.g. the test split.
+        key (str): One of position_index.KEY_TYPES.
+        dedup_capacity (Optional[int]): Expected number of distinct positions, to size the Bloom
+            filter of written positions (default: estimated from the input sizes).
+        dedup_error_rate (float): False positive rate of that filter at capacity, i.e. the
+            fraction of unique positions dropped as supposed duplicates.
+
+    Returns:
+        dict: Counts of games read / accepted / bad (illegal moves, dropped) and positions
+        sampled / duplicate / excluded / written.
+    """
+    rules = rules or SamplingRules()
+    excluded = load_position_set(exclude) if exclude is not None else None
+    tasks = [(path, start, end, rules, key) for path in inputs for start, end in split_input(path, chunk_bytes)]
+    totals = {"games": 0, "accepted_games": 0, "bad_games": 0, "positions": 0, "duplicates": 0, "excluded": 0, "written": 0}
+    seen = BloomFilter(dedup_capacity or _estimate_positions(inputs, rules), dedup_error_rate)
+
+    writer = _open_output(output)
+    try:
+        with multiprocessing.Pool(num_workers or os.cpu_count()) as pool:
+            for records, hashes, stats in pool.imap(_harvest_chunk, tasks):
+                totals["games"] += stats["games"]
+                totals["accepted_games"] += stats["accepted_games"]
+                totals["bad_games"] += stats["bad_games"]
+                totals["positions"] += len(records)
+                keep = np.ones(len(records), dtype=bool)
+                if excluded is not None and len(records):
+                    keep &= ~excluded.contains(hashes)
+                    totals["excluded"] += int((~keep).sum())
+                # The first row of every position not written before
+                candidates = np.flatnonzero(keep)
+                _, first = np.unique(hashes[candidates], return_index=True)
+                rows = candidates[np.sort(first)]
+                rows = rows[~seen.contains(hashes[rows])]
+                seen.add(hashes[rows])
+                totals["duplicates"] += len(candidates) - len(rows)
+                kept = [records[i] for i in rows.tolist()]
+                writer.write(kept)
+                totals["written"] += len(kept)
+    finally:
+        writer.close()
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Harvest training positions from PGN collections.")
+    parser.add_argument("inputs", nargs="+", help=".pgn files, .jsonl shards or game databases (.sqlite).")
+    parser.add_argument("--output", required=True, help="A .bag (FEN, move records) or .parquet file.")
+    parser.add_argument("--min-ply", type=int, default=0, help="Skip the first plies (openings).")
+    parser.add_argument("--max-ply", type=int, default=None)
+    parser.add_argument("--min-elo", type=int, default=None, help="Minimum rating of both players.")
+    parser.add_argument("--positions-per-game", type=int, default=None)
+    parser.add_argument("--include-unfinished", action="store_true", help="Keep games without a result.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num-workers", type=int, default=None)
+    parser.add_argument("--chunk-mb", type=float, default=CHUNK_BYTES / 2**20)
+    parser.add_argument("--exclude", default=None, help="Position index (.npy) or Bloom filter (.npz) to leave out.")
+    parser.add_argument("--key", choices=KEY_TYPES, default="fen")
+    parser.add_argument("--dedup-capacity", type=int, default=None, help="Expected distinct positions (default: estimated).")
+    parser.add_argument("--dedup-error-rate", type=float, default=1e-4, help="Share of unique positions dropped as false duplicates.")
+    args = parser.parse_args(argv)
+
+    rules = SamplingRules(args.min_ply, args.max_ply, args.min_elo, args.positions_per_game, not args.include_unfinished, args.seed)
+    totals = harvest(args.inputs, args.output, rules, args.num_workers, int(args.chunk_mb * 2**20), args.exclude, args.key,
+                     args.dedup_capacity, args.dedup_error_rate)
+    print(
+        f"Read {totals['games']} games ({totals['accepted_games']} accepted, {totals['bad_games']} bad), sampled {totals['positions']} positions: "
+        f"{totals['duplicates']} duplicates, {totals['excluded']} excluded, {totals['written']} written to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
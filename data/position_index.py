@@ -0,0 +1,276 @@
+"""
+Position identity index for deduplication and train/test decontamination.
+
+Positions are identified by a 64-bit hash of their normalized FEN (board, side to move,
+castling and en passant -- the move clocks are dropped) or by their polyglot Zobrist hash.
+Two structures hold sets of hashes:
+
+- `PositionIndex`: an exact, sorted uint64 array (8 bytes per position, binary-search
+  lookups, memory-mapped when loaded).
+- `BloomFilter`: a bit array with a configurable false positive rate (~1.2 bytes per
+  position at 1%), for training sets too large to keep exactly.
+
+Usage (from the repo root):
+    python -m data.position_index build --output data/index/train --csv train.csv [--bloom-error-rate 0.001]
+    python -m data.position_index check --index data/index/train.npy --csv new_data.csv
+"""
+import os
+import hashlib
+import argparse
+import multiprocessing
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+KEY_TYPES = ("fen", "zobrist")
+# Distinct FENs per task when hashing in a process pool
+HASH_CHUNK_SIZE = 1 << 18
+
+
+# ====================================================
+# Hashing
+# ====================================================
+def normalize_fen(fen: str) -> str:
+    """Drops the halfmove clock and fullmove number, which do not change the position."""
+    return " ".join(fen.split()[:4])
+
+
+def position_hash(fen: str, key: str = "fen") -> int:
+    """
+    Hashes a position to an unsigned 64-bit integer.
+
+    Args:
+        fen (str): The FEN of the position (move clocks are ignored).
+        key (str): "fen" for blake2b of the normalized FEN, "zobrist" for the polyglot
+            Zobrist hash (slower, needs python-chess, matches opening books).
+
+    Returns:
+        int: The position hash.
+    """
+    if key == "fen":
+        return int.from_bytes(hashlib.blake2b(normalize_fen(fen).encode(), digest_size=8).digest(), "little")
+    if key == "zobrist":
+        import chess
+        import chess.polyglot
+
+        return chess.polyglot.zobrist_hash(chess.Board(fen))
+    raise ValueError(f"Invalid key '{key}'. Must be one of {KEY_TYPES}.")
+
+
+def _blake2b_fens(fens: Sequence[str]) -> np.ndarray:
+    """`position_hash(fen, "fen")` of many FENs, with the digests joined and read as one array."""
+    blake2b = hashlib.blake2b
+    digests = b"".join(blake2b(" ".join(fen.split(None, 4)[:4]).encode(), digest_size=8).digest() for fen in fens)
+    return np.frombuffer(digests, dtype="<u8").astype(np.uint64)
+
+
+def hash_fens(fens: Iterable[str], key: str = "fen", num_workers: int = 1) -> np.ndarray:
+    """
+    Hashes many FENs into a uint64 array.
+
+    Repeated FENs are hashed once. With `num_workers` > 1, inputs of more than
+    HASH_CHUNK_SIZE distinct FENs are hashed in a process pool.
+    """
+    codes, uniques = pd.factorize(fens if isinstance(fens, (pd.Series, np.ndarray)) else np.asarray(list(fens), dtype=object))
+    if (codes < 0).any():
+        raise ValueError("Missing FEN")
+    uniques = uniques.tolist()
+    if key != "fen":
+        hashes = np.fromiter((position_hash(fen, key) for fen in uniques), dtype=np.uint64, count=len(uniques))
+    elif num_workers > 1 and len(uniques) > HASH_CHUNK_SIZE:
+        chunks = [uniques[i:i + HASH_CHUNK_SIZE] for i in range(0, len(uniques), HASH_CHUNK_SIZE)]
+        with multiprocessing.Pool(min(num_workers, len(chunks))) as pool:
+            hashes = np.concatenate(pool.map(_blake2b_fens, chunks))
+    else:
+        hashes = _blake2b_fens(uniques)
+    return hashes[codes]
+
+
+# ====================================================
+# Exact index
+# ====================================================
+class PositionIndex:
+    def __init__(self, hashes: Optional[np.ndarray] = None):
+        """
+        Exact set of position hashes, stored as a sorted unique uint64 array.
+
+        Args:
+            hashes (Optional[np.ndarray]): Initial hashes (any order, duplicates allowed).
+        """
+        self.hashes = np.unique(np.asarray(hashes, dtype=np.uint64)) if hashes is not None else np.zeros(0, np.uint64)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def add(self, hashes: np.ndarray) -> None:
+        """Adds hashes (a sorted merge, so add in large batches)."""
+        self.hashes = np.union1d(self.hashes, np.asarray(hashes, dtype=np.uint64))
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Returns a boolean mask of which hashes are in the index."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(self.hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        positions = np.searchsorted(self.hashes, hashes)
+        return self.hashes[np.minimum(positions, len(self.hashes) - 1)] == hashes
+
+    def save(self, path: str) -> None:
+        np.save(path, self.hashes)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "PositionIndex":
+        index = cls()
+        index.hashes = np.load(path, mmap_mode="r" if mmap else None)
+        return index
+
+
+# ====================================================
+# Bloom filter
+# ====================================================
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    """Remixes 64-bit hashes into an independent second hash for double hashing."""
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def position_rank(hashes: np.ndarray, seed: int) -> np.ndarray:
+    """
+    Seeded pseudo-random uint64 key of every position hash. Sorting by it shuffles positions,
+    and since it only depends on the position, repeated rows of a position get the same key.
+    """
+    seed_hash = _splitmix64(np.asarray([seed], dtype=np.uint64))[0]
+    return _splitmix64(np.asarray(hashes, dtype=np.uint64) ^ seed_hash)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        Bloom filter over position hashes (no false negatives, `error_rate` false positives
+        once `capacity` positions have been added).
+
+        Args:
+            capacity (int): Expected number of positions.
+            error_rate (float): Target false positive rate at capacity.
+        """
+        num_bits = max(64, int(-capacity * np.log(error_rate) / np.log(2) ** 2))
+        self.num_bits = (num_bits + 7) // 8 * 8
+        self.num_hashes = max(1, round(self.num_bits / max(capacity, 1) * np.log(2)))
+        self.bits = np.zeros(self.num_bits // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _bit_positions(self, hashes: np.ndarray):
+        h1 = np.asarray(hashes, dtype=np.uint64)
+        h2 = _splitmix64(h1) | np.uint64(1)
+        num_bits = np.uint64(self.num_bits)
+        with np.errstate(over="ignore"):
+            for i in range(self.num_hashes):
+                yield (h1 + np.uint64(i) * h2) % num_bits
+
+    def add(self, hashes: np.ndarray) -> None:
+        for positions in self._bit_positions(hashes):
+            np.bitwise_or.at(self.bits, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(hashes)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Returns a boolean mask of which hashes are (probably) in the filter."""
+        found = np.ones(len(hashes), dtype=bool)
+        for positions in self._bit_positions(hashes):
+            found &= ((self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1).astype(bool)
+        return found
+
+    def save(self, path: str) -> None:
+        np.savez(path, bits=self.bits, num_hashes=self.num_hashes, count=self.count)
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        with np.load(path) as data:
+            bloom = cls.__new__(cls)
+            bloom.bits = data["bits"]
+            bloom.num_bits = len(bloom.bits) * 8
+            bloom.num_hashes = int(data["num_hashes"])
+            bloom.count = int(data["count"])
+        return bloom
+
+
+def load_position_set(path: str):
+    """Loads a saved PositionIndex (.npy) or BloomFilter (.npz)."""
+    if path.endswith(".npz"):
+        return BloomFilter.load(path)
+    return PositionIndex.load(path)
+
+
+# ====================================================
+# Splits
+# ====================================================
+def disjoint_split(fens: Sequence[str], test_size: int, seed: int = 42, key: str = "fen") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Splits rows into train and test so that no position appears in both, keeping one row
+    per position.
+
+    Args:
+        fens (Sequence[str]): The FEN of every row.
+        test_size (int): Number of distinct positions in the test split.
+        seed (int): Seed for choosing the test positions.
+        key (str): One of KEY_TYPES.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Row indices of the train and test splits.
+    """
+    _, first_rows = np.unique(hash_fens(fens, key), return_index=True)
+    first_rows = np.random.default_rng(seed).permutation(first_rows)
+    if test_size > len(first_rows):
+        raise ValueError(f"test_size {test_size} is larger than the {len(first_rows)} distinct positions.")
+    return np.sort(first_rows[test_size:]), np.sort(first_rows[:test_size])
+
+
+def _iter_csv_hashes(paths: Sequence[str], key: str, num_workers: int = 1, chunk_size: int = 1_000_000):
+    for path in paths:
+        for chunk in pd.read_csv(path, usecols=["FEN"], chunksize=chunk_size):
+            yield path, hash_fens(chunk["FEN"], key, num_workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query a position identity index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Index the positions of CSV files (FEN column).")
+    build.add_argument("--output", required=True, help="Path prefix; writes <output>.npy (and <output>.bloom.npz).")
+    build.add_argument("--csv", nargs="+", required=True)
+    build.add_argument("--key", choices=KEY_TYPES, default="fen")
+    build.add_argument("--bloom-error-rate", type=float, default=None, help="Also write a Bloom filter.")
+
+    check = subparsers.add_parser("check", help="Count rows of CSV files whose positions are in an index.")
+    check.add_argument("--index", required=True, help="A .npy index or .npz Bloom filter.")
+    check.add_argument("--csv", nargs="+", required=True)
+    check.add_argument("--key", choices=KEY_TYPES, default="fen")
+    for sub in (build, check):
+        sub.add_argument("--num-workers", type=int, default=os.cpu_count(), help="Hashing processes.")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        index = PositionIndex(np.concatenate([hashes for _, hashes in _iter_csv_hashes(args.csv, args.key, args.num_workers)]))
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        index.save(args.output + ".npy")
+        print(f"Indexed {len(index)} distinct positions to {args.output}.npy")
+        if args.bloom_error_rate is not None:
+            bloom = BloomFilter(len(index), args.bloom_error_rate)
+            bloom.add(index.hashes)
+            bloom.save(args.output + ".bloom.npz")
+            print(f"Wrote a {bloom.num_bits / 8 / 2**20:.1f} MiB Bloom filter to {args.output}.bloom.npz")
+    else:
+        positions = load_position_set(args.index)
+        for path in args.csv:
+            total = found = 0
+            for _, hashes in _iter_csv_hashes([path], args.key, args.num_workers):
+                total += len(hashes)
+                found += int(positions.contains(hashes).sum())
+            print(f"{path}: {found}/{total} rows in the index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Segmented (per-position) reward normalization.
+
+A batch of positions is represented Arrow-style as one flat array of win probabilities
+plus `offsets`, where position i owns `values[offsets[i]:offsets[i + 1]]`. Every mode is
+computed for the whole batch in a few vectorized NumPy passes instead of one small array
+per row.
+"""
+import json
+from typing import Dict, Union
+
+import numpy as np
+
+
+REWARD_MODES = ("minmax", "zscore", "rank")
+
+
+def _segment_ids(offsets: np.ndarray) -> np.ndarray:
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def _segment_reduce(ufunc: np.ufunc, values: np.ndarray, offsets: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Applies `ufunc.reduceat` per segment (0 for empty segments)."""
+    out = np.zeros(len(lengths))
+    nonempty = lengths > 0
+    if nonempty.any():
+        out[nonempty] = ufunc.reduceat(values, offsets[:-1][nonempty])
+    return out
+
+
+def segment_normalize(values: np.ndarray, offsets: np.ndarray, mode: str = "minmax") -> np.ndarray:
+    """
+    Normalizes the win probabilities of many positions at once.
+
+    Args:
+        values (np.ndarray): Flat win probabilities of all moves of all positions.
+        offsets (np.ndarray): Segment boundaries, length num_positions + 1, starting at 0.
+        mode (str): One of
+            - "minmax": rescale each position to [0, 1] (0.5 if all moves are equal).
+            - "zscore": subtract the position mean and divide by its standard deviation
+              (0 if all moves are equal). Unbounded: chat.reward lowers the penalties of
+              wrong answers below the worst move of each position.
+            - "rank": average rank of each move within its position scaled to [0, 1], best
+              move 1 (0.5 for a single move).
+
+    Returns:
+        np.ndarray: The normalized rewards, aligned with `values`.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    if offsets[0] != 0 or offsets[-1] != len(values) or (lengths < 0).any():
+        raise ValueError("offsets must start at 0, be non-decreasing and end at len(values).")
+
+    if mode == "minmax":
+        seg_min = np.repeat(_segment_reduce(np.minimum, values, offsets, lengths), lengths)
+        seg_range = np.repeat(_segment_reduce(np.maximum, values, offsets, lengths), lengths) - seg_min
+        out = np.full_like(values, 0.5)
+        np.divide(values - seg_min, seg_range, out=out, where=seg_range > 0)
+        return out
+
+    if mode == "zscore":
+        safe_lengths = np.maximum(lengths, 1)
+        mean = _segment_reduce(np.add, values, offsets, lengths) / safe_lengths
+        centered = values - np.repeat(mean, lengths)
+        std = np.repeat(np.sqrt(_segment_reduce(np.add, centered * centered, offsets, lengths) / safe_lengths), lengths)
+        out = np.zeros_like(values)
+        np.divide(centered, std, out=out, where=std > 0)
+        return out
+
+    if mode == "rank":
+        segment_ids = _segment_ids(offsets)
+        order = np.lexsort((values, segment_ids))
+        sorted_values, sorted_ids = values[order], segment_ids[order]
+        # Ties (same position, same value) share the average of their ordinal ranks
+        new_group = np.ones(len(values), dtype=bool)
+        new_group[1:] = (sorted_values[1:] != sorted_values[:-1]) | (sorted_ids[1:] != sorted_ids[:-1])
+        group_starts = np.flatnonzero(new_group)
+        group_sizes = np.diff(np.append(group_starts, len(values)))
+        average_position = np.repeat(group_starts + (group_sizes - 1) / 2, group_sizes)
+        ranks = np.empty_like(values)
+        ranks[order] = average_position - offsets[:-1][sorted_ids]
+        denominator = np.repeat(lengths - 1, lengths).astype(np.float64)
+        out = np.full_like(values, 0.5)
+        np.divide(ranks, denominator, out=out, where=denominator > 0)
+        return out
+
+    raise ValueError(f"Invalid mode '{mode}'. Must be one of {REWARD_MODES}.")
+
+
+def ground_truth_to_dict(ground_truth: Union[str, Dict]) -> Dict[str, float]:
+    """
+    Converts a stored ground truth into a move -> reward dict.
+
+    Handles the structured column ({"moves": [...], "rewards": [...]}), a plain move -> reward
+    dict, and the JSON text of older parquets (either the ground truth itself or the whole
+    reward_model).
+    """
+    if isinstance(ground_truth, (str, bytes)):
+        ground_truth = json.loads(ground_truth)
+        ground_truth = ground_truth.get("ground_truth", ground_truth)
+    if "moves" in ground_truth and "rewards" in ground_truth:
+        return dict(zip(ground_truth["moves"], map(float, ground_truth["rewards"])))
+    return {move: float(reward) for move, reward in ground_truth.items()}
@@ -0,0 +1,277 @@
+"""
+Pre-tokenized, packed SFT dataset (replaces `preprocess_function` in chess_sft_qwen_base.ipynb).
+
+Data prep runs once per (source, tokenizer): prompts and completions are tokenized in
+batches and appended to a flat token file, with offsets and prompt lengths next to it, so
+restarts memory-map the cache instead of tokenizing again. Examples are then packed into
+sequences of `max_length` tokens (best-fit decreasing), so batches are almost free of
+padding. Each packed sequence comes with labels (-100 on prompt tokens and padding) and
+position ids that restart at 0 for every example, and without an `attention_mask` (the
+convention of transformers' DataCollatorWithFlattening): flash-attention 2 models then derive
+the example boundaries from the position ids and run varlen attention, so packed examples do
+not attend to each other. Eager and SDPA attention ignore the boundaries (a 2D padding mask
+would not separate the examples either); for them, `block_mask=True` adds a block-diagonal
+causal 4D `attention_mask`.
+
+Cache layout (`cache_dir`):
+    tokens.bin          uint32 token ids of all examples, back to back
+    offsets.npy         int64, example i is tokens[offsets[i]:offsets[i + 1]]
+    prompt_lengths.npy  int32, the first prompt_lengths[i] tokens of example i are the prompt
+    meta.json           tokenizer, source hash and counts (the cache is rebuilt on mismatch)
+
+Usage (from the repo root, needs transformers):
+    python -m data.sft_pack --source chess_challenges_train_10k.csv --tokenizer Qwen/Qwen2.5-1.5B --cache-dir data/sft_cache/train
+"""
+import os
+import ast
+import json
+import bisect
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from chat.render import render_many
+from .verl_builder import file_sha256
+
+
+# Bump when the example format changes so existing caches are rebuilt
+CACHE_VERSION = 1
+IGNORE_INDEX = -100
+
+
+# ====================================================
+# Examples
+# ====================================================
+def build_examples(df: pd.DataFrame) -> Tuple[List[str], List[str]]:
+    """
+    Turns challenge rows into (prompt, completion) text, as the notebook did: the board
+    description as the prompt and the best (first) move between answer tags as the completion.
+
+    Args:
+        df (pd.DataFrame): Rows with FEN and Move (list or its string form) columns.
+
+    Returns:
+        Tuple[List[str], List[str]]: The prompts and completions.
+    """
+    boards = render_many(df["FEN"], "desc")
+    moves = [m if isinstance(m, list) else ast.literal_eval(m) for m in df["Move"]]
+    prompts = [f"{board}\nThe best move is: \n" for board in boards]
+    completions = [f"<answer> {row[0]} </answer>" for row in moves]
+    return prompts, completions
+
+
+# ====================================================
+# Tokenization cache
+# ====================================================
+def _tokenizer_name(tokenizer) -> str:
+    return getattr(tokenizer, "name_or_path", None) or type(tokenizer).__name__
+
+
+def tokenize_to_cache(
+    source: str,
+    tokenizer,
+    cache_dir: str,
+    chunk_size: int = 10_000,
+    force: bool = False,
+) -> Dict:
+    """
+    Tokenizes a challenge CSV in batches into the memory-mapped cache layout.
+
+    The prompt and completion are tokenized separately, so the prompt length is exact (no
+    search for the answer tag), and the tokenizer's EOS token is appended to the completion.
+
+    Args:
+        source (str): Challenge CSV with FEN and Move columns.
+        tokenizer: A Hugging Face tokenizer (anything callable on a list of strings that
+            returns {"input_ids": [[...], ...]} and has `eos_token_id`).
+        cache_dir (str): Where to write the cache.
+        chunk_size (int): Rows tokenized per batch.
+        force (bool): Rebuild even if the cache matches.
+
+    Returns:
+        Dict: The cache metadata.
+    """
+    meta = {
+        "cache_version": CACHE_VERSION,
+        "tokenizer": _tokenizer_name(tokenizer),
+        "vocab_size": len(tokenizer),
+        "source_sha256": file_sha256(source),
+    }
+    meta_path = os.path.join(cache_dir, "meta.json")
+    if not force and os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            cached = json.load(f)
+        if {key: cached.get(key) for key in meta} == meta:
+            return cached
+
+    os.makedirs(cache_dir, exist_ok=True)
+    eos = [tokenizer.eos_token_id] if tokenizer.eos_token_id is not None else []
+    offsets, prompt_lengths = [0], []
+    with open(os.path.join(cache_dir, "tokens.bin.tmp"), "wb") as f:
+        for chunk in pd.read_csv(source, chunksize=chunk_size):
+            prompts, completions = build_examples(chunk)
+            prompt_ids = tokenizer(prompts, add_special_tokens=False)["input_ids"]
+            completion_ids = tokenizer(completions, add_special_tokens=False)["input_ids"]
+            lengths = [len(p) + len(c) + len(eos) for p, c in zip(prompt_ids, completion_ids)]
+            flat = np.fromiter(
+                (t for p, c in zip(prompt_ids, completion_ids) for t in (*p, *c, *eos)),
+                dtype=np.uint32,
+                count=sum(lengths),
+            )
+            f.write(flat.tobytes())
+            offsets.extend((offsets[-1] + np.cumsum(lengths)).tolist())
+            prompt_lengths.extend(len(p) for p in prompt_ids)
+
+    np.save(os.path.join(cache_dir, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    np.save(os.path.join(cache_dir, "prompt_lengths.npy"), np.asarray(prompt_lengths, dtype=np.int32))
+    os.replace(os.path.join(cache_dir, "tokens.bin.tmp"), os.path.join(cache_dir, "tokens.bin"))
+    meta.update({"num_examples": len(prompt_lengths), "num_tokens": offsets[-1]})
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def load_cache(cache_dir: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Memory-maps a cache, returning (tokens, offsets, prompt_lengths)."""
+    tokens = np.memmap(os.path.join(cache_dir, "tokens.bin"), dtype=np.uint32, mode="r")
+    offsets = np.load(os.path.join(cache_dir, "offsets.npy"))
+    prompt_lengths = np.load(os.path.join(cache_dir, "prompt_lengths.npy"))
+    return tokens, offsets, prompt_lengths
+
+
+# ====================================================
+# Packing
+# ====================================================
+def pack_examples(lengths: np.ndarray, max_length: int) -> List[List[int]]:
+    """
+    Packs examples into sequences of at most `max_length` tokens with best-fit decreasing
+    (longest examples first, each into the fullest sequence that still has room).
+
+    Args:
+        lengths (np.ndarray): Token count of every example.
+        max_length (int): Tokens per packed sequence. Longer examples are left out.
+
+    Returns:
+        List[List[int]]: Example indices of every packed sequence.
+    """
+    bins: List[List[int]] = []
+    # Sorted (remaining room, bin id) of the bins that can still take an example
+    open_bins: List[Tuple[int, int]] = []
+    for index in np.argsort(-np.asarray(lengths), kind="stable"):
+        length = int(lengths[index])
+        if length > max_length:
+            continue
+        position = bisect.bisect_left(open_bins, (length, -1))
+        if position < len(open_bins):
+            room, bin_id = open_bins.pop(position)
+        else:
+            room, bin_id = max_length, len(bins)
+            bins.append([])
+        bins[bin_id].append(int(index))
+        if room - length > 0:
+            bisect.insort(open_bins, (room - length, bin_id))
+    return bins
+
+
+def block_diagonal_mask(position_ids: np.ndarray, dtype=np.float32) -> np.ndarray:
+    """
+    Additive causal attention mask that keeps the packed examples of a sequence apart.
+
+    Args:
+        position_ids (np.ndarray): Position ids of a packed sequence (each example, and the
+            trailing padding, starts at 0).
+        dtype: Float dtype of the mask (that of the model).
+
+    Returns:
+        np.ndarray: (1, L, L) mask, 0 where token i may attend token j (same example, j <= i)
+        and the dtype's minimum elsewhere -- the inverted 4D `attention_mask` HF models accept.
+    """
+    segments = np.cumsum(position_ids == 0)
+    allowed = (segments[:, None] == segments[None, :]) & np.tri(len(position_ids), dtype=bool)
+    return np.where(allowed, 0, np.finfo(dtype).min).astype(dtype)[None]
+
+
+class PackedSFTDataset:
+    def __init__(self, cache_dir: str, max_length: int = 512, pad_token_id: int = 0, seed: Optional[int] = 0,
+                 block_mask: bool = False):
+        """
+        Map-style dataset of packed sequences over a tokenization cache (works with
+        torch.utils.data.DataLoader and the transformers Trainer's default collator).
+
+        Args:
+            cache_dir (str): A cache written by `tokenize_to_cache`.
+            max_length (int): Tokens per packed sequence.
+            pad_token_id (int): Token used to pad the end of a sequence.
+            seed (Optional[int]): Shuffles the order of the packed sequences (None keeps the
+                packing order).
+            block_mask (bool): Add a block-diagonal 4D `attention_mask` (see block_diagonal_mask)
+                for eager / SDPA attention. Without it, items have no attention mask and only
+                flash-attention 2 keeps the examples apart.
+        """
+        self.tokens, self.offsets, self.prompt_lengths = load_cache(cache_dir)
+        self.max_length = max_length
+        self.pad_token_id = pad_token_id
+        self.block_mask = block_mask
+        lengths = np.diff(self.offsets)
+        self.packs = pack_examples(lengths, max_length)
+        self.num_dropped = int((lengths > max_length).sum())
+        if seed is not None:
+            order = np.random.default_rng(seed).permutation(len(self.packs))
+            self.packs = [self.packs[i] for i in order]
+
+    def __len__(self) -> int:
+        return len(self.packs)
+
+    def __getitem__(self, index: int) -> Dict[str, np.ndarray]:
+        input_ids = np.full(self.max_length, self.pad_token_id, dtype=np.int64)
+        labels = np.full(self.max_length, IGNORE_INDEX, dtype=np.int64)
+        position_ids = np.zeros(self.max_length, dtype=np.int64)
+        cursor = 0
+        for example in self.packs[index]:
+            start, end = self.offsets[example], self.offsets[example + 1]
+            length = end - start
+            input_ids[cursor:cursor + length] = self.tokens[start:end]
+            prompt_length = self.prompt_lengths[example]
+            labels[cursor + prompt_length:cursor + length] = self.tokens[start + prompt_length:end]
+            position_ids[cursor:cursor + length] = np.arange(length)
+            cursor += length
+        # The padding is a segment of its own (and, being last, is never attended to)
+        position_ids[cursor:] = np.arange(self.max_length - cursor)
+        item = {
+            "input_ids": input_ids,
+            "labels": labels,
+            "position_ids": position_ids,
+        }
+        if self.block_mask:
+            item["attention_mask"] = block_diagonal_mask(position_ids)
+        return item
+
+    def packing_efficiency(self) -> float:
+        """Fraction of the packed sequence slots holding real tokens."""
+        used = sum(int(self.offsets[e + 1] - self.offsets[e]) for pack in self.packs for e in pack)
+        return used / max(1, len(self.packs) * self.max_length)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tokenize a challenge CSV into a packed SFT cache.")
+    parser.add_argument("--source", required=True, help="Challenge CSV (FEN, Move).")
+    parser.add_argument("--tokenizer", required=True, help="Hugging Face tokenizer name or path.")
+    parser.add_argument("--cache-dir", required=True)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the cache is up to date.")
+    args = parser.parse_args(argv)
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    meta = tokenize_to_cache(args.source, tokenizer, args.cache_dir, args.chunk_size, args.force)
+    dataset = PackedSFTDataset(args.cache_dir, args.max_length, tokenizer.pad_token_id or 0)
+    print(f"{meta['num_examples']} examples, {meta['num_tokens']} tokens -> {len(dataset)} packed sequences "
+          f"of {args.max_length} ({dataset.packing_efficiency():.1%} full, {dataset.num_dropped} too long)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""
+Streaming builder for the veRL parquet datasets (replaces the per-row loop in
+verl_data_processing/verl_process.ipynb).
+
+The source CSV is read in chunks, chunks are turned into Arrow tables by a process pool
+(all requested variants per chunk, so the CSV is parsed once) and the tables are written
+with `pyarrow.parquet.ParquetWriter` in row groups of `row_group_size`. Each output gets a
+`.manifest.json` next to it recording the variant config and the source hash; outputs whose
+manifest still matches are skipped, so re-running for all variants only builds what changed.
+
+The splits are a seeded sample of the distinct positions of the source, whatever its order
+(the full challenge CSV is sorted by FEN): a first pass over the FEN column ranks every
+position by a seeded hash (data.position_index.position_rank) and keeps the lowest-ranked
+ones, the second pass builds the selected rows. Each position is used once, so train and test
+never overlap.
+
+Usage (from the repo root):
+    python -m data.verl_builder --source data/raw_data/chess_challenges_full.csv --variants all
+"""
+import os
+import ast
+import json
+import random
+import hashlib
+import argparse
+import collections
+import concurrent.futures
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from chat.render import render_description
+from .loader import convert_uci_moves_to_pgn
+from .rewards import segment_normalize
+from .position_index import BloomFilter, hash_fens, load_position_set, position_rank
+
+
+DATA_ROOT = os.path.dirname(os.path.abspath(__file__))
+PROMPT_DIR = os.path.join(DATA_ROOT, "verl_data_processing", "prompts")
+
+# Bump when the row format changes so existing outputs are rebuilt
+BUILDER_VERSION = 4
+# Source rows per chunk of the selection pass (FEN column only)
+SELECTION_CHUNK_ROWS = 100_000
+
+# Board representation / move notation / reward normalization (see data.rewards) / system prompt
+VARIANTS = {
+    "FEN_board_normal_reward": {"board": "FEN", "moves": "UCI", "reward": "minmax", "system_prompt": "FEN"},
+    "FEN_board_zscore_reward": {"board": "FEN", "moves": "UCI", "reward": "zscore", "system_prompt": "FEN"},
+    "FEN_board_rank_reward": {"board": "FEN", "moves": "UCI", "reward": "rank", "system_prompt": "FEN"},
+    "DESC_board_normal_reward": {"board": "desc", "moves": "UCI", "reward": "minmax", "system_prompt": "DESC"},
+    "DESC_board_zscore_reward": {"board": "desc", "moves": "UCI", "reward": "zscore", "system_prompt": "DESC"},
+    "DESC_board_normal_reward_PGN_moves": {"board": "desc", "moves": "PGN", "reward": "minmax", "system_prompt": "DESC_PGN"},
+    "DESC_board_zscore_reward_PGN_moves": {"board": "desc", "moves": "PGN", "reward": "zscore", "system_prompt": "DESC_PGN"},
+}
+
+# The ground truth is stored as parallel native list columns (no JSON round trip on the RL side)
+GROUND_TRUTH_TYPE = pa.struct([("moves", pa.list_(pa.string())), ("rewards", pa.list_(pa.float64()))])
+PROMPT_TYPE = pa.list_(pa.struct([("content", pa.string()), ("role", pa.string())]))
+EXTRA_INFO_TYPE = pa.struct([("index", pa.int64()), ("split", pa.string())])
+SCHEMA = pa.schema([
+    ("data_source", pa.string()),
+    ("prompt", PROMPT_TYPE),
+    ("ability", pa.string()),
+    ("reward_model", pa.struct([("style", pa.string()), ("ground_truth", GROUND_TRUTH_TYPE)])),
+    ("extra_info", EXTRA_INFO_TYPE),
+])
+
+
+# ====================================================
+# Row processing
+# ====================================================
+@lru_cache(maxsize=None)
+def load_system_prompt(name: str) -> str:
+    """Loads a system prompt from verl_data_processing/prompts, wrapped in chat tokens."""
+    with open(os.path.join(PROMPT_DIR, f"system_{name}.txt"), "r") as file:
+        return f"<|im_start|>system\n{file.read()}<|im_end|>"
+
+
+def format_prompt(board: str, legal_moves: List[str], variant: Dict) -> str:
+    """
+    Formats the board and (already shuffled) legal moves into a full chat prompt.
+
+    Args:
+        board (str): The FEN of the position.
+        legal_moves (List[str]): The legal moves, in the notation of the variant.
+        variant (Dict): One of VARIANTS.
+
+    Returns:
+        str: System prompt followed by the user turn and the assistant prefix.
+    """
+    moves = f"[{', '.join(legal_moves)}]"
+    if variant["board"] == "FEN":
+        user = f"<FEN> {board} </FEN> <legalmoves> {moves} </legalmoves>"
+    else:
+        user = f"<board> {render_description(board)} </board> <legalmoves> {moves} </legalmoves>"
+    prompt = f"<|im_start|>user: {user}<|im_end|>\n<|im_start|>assistant: ".replace("'", "")
+    return load_system_prompt(variant["system_prompt"]) + "\n" + prompt
+
+
+def _to_pgn(fen: str, moves: List[str]) -> List[str]:
+    pgn_moves = convert_uci_moves_to_pgn(fen, moves)
+    if len(pgn_moves) != len(moves):
+        raise ValueError(f"Illegal moves in {moves} for position {fen}")
+    return pgn_moves
+
+
+def _process_chunk(
+    chunk: pd.DataFrame, rows: np.ndarray, splits: np.ndarray, starts: Dict[str, int], targets: List[str], seed: int
+) -> Dict[Tuple[str, str], pa.Table]:
+    """
+    Turns a chunk of raw CSV rows into one Arrow table per (variant, split).
+
+    The legal moves of each row are shuffled once (same order in every variant) and the
+    rewards of the whole chunk are normalized in one `segment_normalize` call per variant.
+
+    Args:
+        chunk (pd.DataFrame): Raw CSV rows (list columns still as strings).
+        rows (np.ndarray): Row number of every row in the source.
+        splits (np.ndarray): "test" or "train" for every row.
+        starts (Dict[str, int]): Index (extra_info) of the chunk's first row of each split.
+        targets (List[str]): Names of the variants to build.
+        seed (int): Base seed for shuffling the legal moves.
+
+    Returns:
+        Dict[Tuple[str, str], pa.Table]: Tables keyed by (variant, split).
+    """
+    fens = chunk["FEN"].tolist()
+    orders, uci_moves, win_probs = [], [], []
+    for row, moves_text, probs_text in zip(rows.tolist(), chunk["Move"], chunk["Win Probability"]):
+        moves = [move.replace("'", "") for move in ast.literal_eval(moves_text)]
+        order = list(range(len(moves)))
+        random.Random(seed * 1_000_003 + row).shuffle(order)
+        orders.append(order)
+        uci_moves.append([moves[i] for i in order])
+        probs = ast.literal_eval(probs_text)
+        win_probs.extend(probs[i] for i in order)
+    win_probs = np.asarray(win_probs, dtype=np.float64)
+    offsets = np.zeros(len(fens) + 1, dtype=np.int32)
+    np.cumsum([len(order) for order in orders], out=offsets[1:])
+
+    is_test = splits == "test"
+    indices = np.where(is_test, starts["test"] + np.cumsum(is_test) - 1, starts["train"] + np.cumsum(~is_test) - 1)
+
+    tables, rewards_by_mode = {}, {}
+    pgn_moves = None
+    for name in targets:
+        variant = VARIANTS[name]
+        if variant["moves"] == "PGN":
+            if pgn_moves is None:
+                pgn_moves = [_to_pgn(fen, moves) for fen, moves in zip(fens, uci_moves)]
+            moves = pgn_moves
+        else:
+            moves = uci_moves
+        mode = variant["reward"]
+        if mode not in rewards_by_mode:
+            rewards_by_mode[mode] = segment_normalize(win_probs, offsets, mode)
+        rewards = rewards_by_mode[mode]
+        ground_truth = pa.StructArray.from_arrays(
+            [
+                pa.ListArray.from_arrays(pa.array(offsets), pa.array([m for row in moves for m in row], type=pa.string())),
+                pa.ListArray.from_arrays(pa.array(offsets), pa.array(rewards, type=pa.float64())),
+            ],
+            fields=list(GROUND_TRUTH_TYPE),
+        )
+        table = pa.Table.from_arrays(
+            [
+                pa.array(["chess_reasoning"] * len(fens), type=pa.string()),
+                pa.array([[{"content": format_prompt(fen, row, variant), "role": "user"}] for fen, row in zip(fens, moves)], type=PROMPT_TYPE),
+                pa.array(["math"] * len(fens), type=pa.string()),
+                pa.StructArray.from_arrays(
+                    [pa.array(["rule"] * len(fens), type=pa.string()), ground_truth],
+                    fields=list(SCHEMA.field("reward_model").type),
+                ),
+                pa.StructArray.from_arrays(
+                    [pa.array(indices, type=pa.int64()), pa.array(splits, type=pa.string())],
+                    fields=list(EXTRA_INFO_TYPE),
+                ),
+            ],
+            schema=SCHEMA,
+        )
+        for split, mask in (("test", is_test), ("train", ~is_test)):
+            if mask.any():
+                tables[(name, split)] = table.filter(pa.array(mask))
+    return tables
+
+
+# ====================================================
+# Split selection
+# ====================================================
+class _SplitSelection:
+    def __init__(self, test_samples: int, train_samples: Optional[int], seed: int, exclude: List, train_capacity: int):
+        """
+        Seeded, streaming choice of the positions of the test and train splits.
+
+        Every position gets a seeded pseudo-random rank; the `test_samples` lowest-ranked
+        positions form the test split and the next `train_samples` the train split. `scan`
+        reads the source once and keeps at most twice that many candidates. Without a train
+        size, every other position is train.
+
+        Args:
+            test_samples (int): Positions in the test split.
+            train_samples (Optional[int]): Positions in the train split (None for the rest).
+            seed (int): Seed of the ranks.
+            exclude (List): PositionIndex / BloomFilter sets of positions to leave out.
+            train_capacity (int): Expected number of train positions without a train size, to
+                size the Bloom filter that deduplicates them.
+        """
+        self.test_samples = test_samples
+        self.train_samples = train_samples
+        self.seed = seed
+        self.exclude = exclude
+        self.capacity = test_samples + (train_samples or 0)
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._ranks = np.zeros(0, dtype=np.uint64)
+        self._threshold = None  # rank of the last candidate once there are `capacity` of them
+        # A false positive only drops a unique train row, never leaks a test position
+        self._train_seen = BloomFilter(train_capacity, error_rate=1e-4) if train_samples is None else None
+
+    def _allowed(self, hashes: np.ndarray) -> np.ndarray:
+        keep = np.ones(len(hashes), dtype=bool)
+        for positions in self.exclude:
+            keep &= ~positions.contains(hashes)
+        return keep
+
+    def scan(self, fens: pd.Series) -> None:
+        """First pass: collects the lowest-ranked positions of a chunk of the source."""
+        if not self.capacity:
+            return
+        hashes = hash_fens(fens)
+        hashes = hashes[self._allowed(hashes)]
+        ranks = position_rank(hashes, self.seed)
+        if self._threshold is not None:
+            below = ranks <= self._threshold
+            hashes, ranks = hashes[below], ranks[below]
+        self._hashes = np.concatenate([self._hashes, hashes])
+        self._ranks = np.concatenate([self._ranks, ranks])
+        if len(self._hashes) > 2 * self.capacity:
+            self._compact()
+
+    def _compact(self) -> None:
+        self._hashes, first = np.unique(self._hashes, return_index=True)
+        self._ranks = self._ranks[first]
+        if len(self._hashes) >= self.capacity:
+            lowest = np.argsort(self._ranks, kind="stable")[:self.capacity]
+            self._hashes, self._ranks = self._hashes[lowest], self._ranks[lowest]
+            self._threshold = self._ranks[-1]
+
+    def finish(self) -> Tuple[int, int]:
+        """Ends the first pass; returns the number of selected test and train positions."""
+        self._compact()
+        by_rank = self._hashes[np.argsort(self._ranks, kind="stable")]
+        self.selected = {"test": np.sort(by_rank[:self.test_samples]), "train": np.sort(by_rank[self.test_samples:])}
+        self.emitted = {split: np.zeros(len(hashes), dtype=bool) for split, hashes in self.selected.items()}
+        self._hashes = self._ranks = None
+        return len(self.selected["test"]), len(self.selected["train"])
+
+    @property
+    def done(self) -> bool:
+        """Whether the second pass has found every selected position."""
+        return self._train_seen is None and all(emitted.all() for emitted in self.emitted.values())
+
+    def __call__(self, fens: pd.Series) -> np.ndarray:
+        """
+        Second pass: returns the split of every row of a chunk ("test", "train" or "" to skip),
+        keeping the first row of every selected position (call on chunks in source order).
+        """
+        hashes = hash_fens(fens)
+        splits = np.full(len(hashes), "", dtype=object)
+        in_test = np.zeros(len(hashes), dtype=bool)
+        for split, selected in self.selected.items():
+            if not len(selected):
+                continue
+            where = np.minimum(np.searchsorted(selected, hashes), len(selected) - 1)
+            hit = selected[where] == hashes
+            if split == "test":
+                in_test = hit
+            rows = np.flatnonzero(hit)
+            _, first = np.unique(where[rows], return_index=True)
+            rows = rows[first]
+            rows = rows[~self.emitted[split][where[rows]]]
+            self.emitted[split][where[rows]] = True
+            splits[rows] = split
+        if self._train_seen is not None:
+            rows = np.flatnonzero(~in_test & self._allowed(hashes))
+            _, first = np.unique(hashes[rows], return_index=True)
+            rows = np.sort(rows[first])
+            rows = rows[~self._train_seen.contains(hashes[rows])]
+            self._train_seen.add(hashes[rows])
+            splits[rows] = "train"
+        return splits
+
+
+# ====================================================
+# Incremental builds
+# ====================================================
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Hashes a file in blocks without reading it all into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def output_filename(variant: str, split: str, num_samples: Optional[int]) -> str:
+    """Names outputs like the notebook did, e.g. train-FEN_board_normal_reward-5k.parquet."""
+    if num_samples is None:
+        size = "full"
+    elif split == "train" and num_samples >= 1000:
+        size = f"{num_samples // 1000}k"
+    else:
+        size = str(num_samples)
+    return f"{split}-{variant}-{size}.parquet"
+
+
+def _manifest(variant: str, split: str, source_hash: str, train_samples: Optional[int], test_samples: int, seed: int, exclude_hashes: List[str]) -> Dict:
+    return {
+        "builder_version": BUILDER_VERSION,
+        "variant": variant,
+        "config": VARIANTS[variant],
+        "system_prompt_sha256": hashlib.sha256(load_system_prompt(VARIANTS[variant]["system_prompt"]).encode()).hexdigest(),
+        "split": split,
+        "train_samples": train_samples,
+        "test_samples": test_samples,
+        "seed": seed,
+        "source_sha256": source_hash,
+        "exclude_sha256": exclude_hashes,
+    }
+
+
+def _is_up_to_date(path: str, manifest: Dict) -> bool:
+    try:
+        with open(path + ".manifest.json", "r") as f:
+            return os.path.exists(path) and json.load(f)["inputs"] == manifest
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return False
+
+
+def build_datasets(
+    source: str,
+    output_dir: str,
+    variants: List[str],
+    train_samples: Optional[int] = 5000,
+    test_samples: int = 256,
+    seed: int = 42,
+    num_workers: Optional[int] = None,
+    chunk_size: int = 512,
+    row_group_size: int = 4096,
+    force: bool = False,
+    exclude: Optional[List[str]] = None,
+) -> Dict[str, int]:
+    """
+    Builds the train / test parquets of the given variants from a challenge CSV.
+
+    The source is read twice. The first pass draws `test_samples` + `train_samples` distinct
+    positions (normalized FEN) at random with `seed`, the source order does not matter; the
+    second writes the first row of every drawn position, in source order. Positions in any
+    `exclude` set are never drawn, and the splits never share a position.
+
+    Args:
+        source (str): Challenge CSV with FEN, Move and Win Probability columns.
+        output_dir (str): Where to write the parquets and their manifests.
+        variants (List[str]): Names of VARIANTS to build.
+        train_samples (Optional[int]): Rows in the train split (None for the rest of the source).
+        test_samples (int): Rows in the test split.
+        seed (int): Seed for drawing the positions and shuffling the legal moves in the prompts.
+        num_workers (Optional[int]): Worker processes (defaults to the CPU count).
+        chunk_size (int): Source rows per task.
+        row_group_size (int): Rows per parquet row group.
+        force (bool): Rebuild even if the manifests match.
+        exclude (Optional[List[str]]): Saved position sets (see data.position_index) whose
+            positions must not appear in either split, e.g. evaluation suites.
+
+    Returns:
+        Dict[str, int]: Rows written per output filename (skipped outputs are left out).
+    """
+    source_hash = file_sha256(source)
+    exclude = exclude or []
+    exclude_hashes = [file_sha256(path) for path in exclude]
+    os.makedirs(output_dir, exist_ok=True)
+    num_rows = {"train": train_samples, "test": test_samples}
+
+    targets, manifests = [], {}
+    for name in variants:
+        for split in ("train", "test"):
+            path = os.path.join(output_dir, output_filename(name, split, num_rows[split]))
+            manifests[(name, split)] = (path, _manifest(name, split, source_hash, train_samples, test_samples, seed, exclude_hashes))
+        if force or not all(_is_up_to_date(*manifests[(name, split)]) for split in ("train", "test")):
+            targets.append(name)
+        else:
+            print(f"Skipping {name}: up to date")
+    if not targets:
+        return {}
+
+    # Without a train size, bound the Bloom filter by the source size (rows are > 100 bytes)
+    selection = _SplitSelection(test_samples, train_samples, seed, [load_position_set(path) for path in exclude], os.path.getsize(source) // 100)
+    for chunk in pd.read_csv(source, usecols=["FEN"], chunksize=SELECTION_CHUNK_ROWS):
+        selection.scan(chunk["FEN"])
+    num_test, num_train = selection.finish()
+    print(f"Selected {num_test} test and {num_train if train_samples is not None else 'all other'} train positions")
+    writers, pending_tables, written = {}, collections.defaultdict(list), collections.Counter()
+
+    def write(key, table, final=False):
+        pending_tables[key].append(table)
+        if sum(len(t) for t in pending_tables[key]) >= row_group_size or final:
+            if key not in writers:
+                writers[key] = pq.ParquetWriter(manifests[key][0] + ".tmp", SCHEMA)
+            combined = pa.concat_tables(pending_tables[key])
+            writers[key].write_table(combined, row_group_size=row_group_size)
+            written[key] += len(combined)
+            pending_tables[key] = []
+
+    num_workers = num_workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+        in_flight = collections.deque()
+        starts, source_row = {"test": 0, "train": 0}, 0
+        for chunk in pd.read_csv(source, chunksize=chunk_size):
+            splits = selection(chunk["FEN"])
+            keep = splits != ""
+            rows = np.flatnonzero(keep) + source_row
+            source_row += len(chunk)
+            if keep.any():
+                splits = splits[keep].astype(str)
+                in_flight.append(executor.submit(_process_chunk, chunk[keep], rows, splits, dict(starts), targets, seed))
+                for split in starts:
+                    starts[split] += int((splits == split).sum())
+            if selection.done:
+                break
+            # Keep memory bounded -- write finished chunks in order before reading more
+            while len(in_flight) > 2 * num_workers:
+                for key, table in in_flight.popleft().result().items():
+                    write(key, table)
+        while in_flight:
+            for key, table in in_flight.popleft().result().items():
+                write(key, table)
+
+    results = {}
+    for key, (path, manifest) in manifests.items():
+        if key[0] not in targets:
+            continue
+        if pending_tables[key] or key not in writers:
+            write(key, pa.Table.from_pylist([], schema=SCHEMA), final=True)
+        writers[key].close()
+        os.replace(path + ".tmp", path)
+        with open(path + ".manifest.json", "w") as f:
+            json.dump({"inputs": manifest, "rows": written[key]}, f, indent=2)
+        results[os.path.basename(path)] = written[key]
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the veRL parquet datasets from a challenge CSV.")
+    parser.add_argument("--source", required=True, help="Challenge CSV (FEN, Move, Win Probability), in any order.")
+    parser.add_argument("--output-dir", default=os.path.join(DATA_ROOT, "parquet_datasets"))
+    parser.add_argument("--variants", nargs="+", default=["all"], help=f"'all' or any of {list(VARIANTS)}")
+    parser.add_argument("--train-samples", type=int, default=5000, help="-1 for all remaining rows")
+    parser.add_argument("--test-samples", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--num-workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--row-group-size", type=int, default=4096)
+    parser.add_argument("--force", action="store_true", help="Rebuild even if outputs are up to date.")
+    parser.add_argument("--exclude", nargs="*", default=[], help="Position sets (.npy / .npz from data.position_index) to leave out.")
+    args = parser.parse_args(argv)
+
+    variants = list(VARIANTS) if args.variants == ["all"] else args.variants
+    unknown = set(variants) - set(VARIANTS)
+    if unknown:
+        parser.error(f"Unknown variants: {sorted(unknown)}")
+
+    results = build_datasets(
+        source=args.source,
+        output_dir=args.output_dir,
+        variants=variants,
+        train_samples=None if args.train_samples < 0 else args.train_samples,
+        test_samples=args.test_samples,
+        seed=args.seed,
+        num_workers=args.num_workers,
+        chunk_size=args.chunk_size,
+        row_group_size=args.row_group_size,
+        force=args.force,
+        exclude=args.exclude,
+    )
+    for filename, rows in results.items():
+        print(f"Wrote {rows} rows to {filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+"""
+Multi-host tournaments: a coordinator hands out pair specs (opponent level, opening) over TCP
+and workers on any number of hosts play both colours of every pair and send the results back.
+Both games of a pair are played by one worker, which shares the opponent engine (and its hash)
+and the adjudication cache between them.
+
+Every handed-out pair is a lease that the worker keeps alive with heartbeats while it plays.
+A pair whose lease expires (the worker hung, crashed or its host died) or whose worker reports
+an error goes back into the queue, up to `--max-attempts` times. A dropped connection alone
+does not end a lease: workers reconnect and keep heartbeating and reporting under the same id. A
+result that arrives late (after its pair was re-leased) is still accepted if the pair has no
+result yet; duplicates are ignored. The pairs are those of run_games.py and the results are
+summarized the same way, with the variance reduction of pairing. With `--db`, the coordinator
+stores every game in the game database of ratings.py and refits the rating ladder at the end.
+
+The protocol has no authentication, so the coordinator listens on 127.0.0.1 unless `--host`
+is given; only expose it on a trusted network. With `--engine mock`, both engines of a pair
+are seeded from the pair id (and `--seed`), so mock runs repeat exactly, whichever worker
+plays a pair.
+
+The protocol is one JSON object per line in each direction:
+    {"op": "lease", "worker": ...}                 -> {"lease_id", "spec", "lease_seconds"} | {"wait": s} | {"done": true}
+    {"op": "heartbeat", "pair_id", "lease_id"}    -> {"ok": bool}  (false: the lease was lost)
+    {"op": "complete", "pair_id", "lease_id", "games": [{"result", "winner", "pgn", "duration_seconds"}] * 2} -> {"ok": bool}
+    {"op": "fail", "pair_id", "lease_id", "error"} -> {"ok": bool}
+
+Usage (from elo_evaluator/):
+    python distributed.py coordinator --host 0.0.0.0 --num-games 4 --port 5555 --db games.sqlite --player-name ckpt-1000  # on one host
+    python distributed.py worker --coordinator HOST:5555               # on every host, once per core
+    python distributed.py local --num-workers 4 --engine mock          # coordinator + local worker processes
+    python distributed.py coordinator --host 0.0.0.0 --num-games 20 --openings openings.epd --max-openings 500
+"""
+import os
+import json
+import time
+import socket
+import argparse
+import itertools
+import threading
+import collections
+import socketserver
+import multiprocessing
+
+import chess
+
+from game import close_eval_engine
+from openings import pairing_report, print_pairing_report
+from ratings import GameDatabase, print_ladder
+from run_games import (
+    KNOWN_ENGINES_CONFIGS,
+    NUM_GAMES,
+    TIME_LIMIT,
+    add_opening_arguments,
+    even_num_games,
+    game_score,
+    openings_from_args,
+    play_pair,
+    record_result,
+    schedule_pairs,
+    summarize_results,
+)
+from utils import create_engine
+
+DEFAULT_PORT = 5555
+LEASE_SECONDS = 600.0
+WAIT_SECONDS = 1.0
+# Mock runs: the opponent of pair i is seeded with i, the evaluated engine with this + seed + i
+MOCK_PLAYER_SEED = 1 << 32
+
+
+# ====================================================
+# Coordinator
+# ====================================================
+class Coordinator:
+    def __init__(self, pairs, lease_seconds: float = LEASE_SECONDS, max_attempts: int = 3, log_file: str | None = None,
+                 player_name: str = "unknown", db: GameDatabase | None = None):
+        """
+        Queue of colour-reversed pairs with leases and retries.
+
+        Args:
+            pairs: (known engine name, opening board) tuples, see run_games.schedule_pairs.
+            lease_seconds (float): How long a pair may go without a heartbeat before it is re-queued.
+            max_attempts (int): How many times a pair is handed out before it is given up on.
+            log_file (str | None): File the results are appended to, as in run_games.py.
+            player_name (str): Name of the evaluated engine, which workers play the games as.
+            db (GameDatabase | None): Database every finished game is stored in.
+        """
+        self.specs = {
+            pair_id: {"pair_id": pair_id, "player": player_name, "opponent": name, "fen": board.fen()}
+            for pair_id, (name, board) in enumerate(pairs)
+        }
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.log_file = log_file
+        self.player_name = player_name
+        self.db = db
+        self.results = {}  # pair_id -> {"games": [{"result", "winner"}, ...] (LLM as white first), "worker"}
+        self.failed = {}  # pair_id -> last error
+        self._pending = collections.deque(self.specs)
+        self._leases = {}  # pair_id -> (lease_id, worker, deadline)
+        self._attempts = collections.Counter()
+        self._lease_ids = itertools.count()
+        self._lock = threading.Lock()
+        self.finished = threading.Event()
+        if not self.specs:
+            self.finished.set()
+
+    def handle(self, request: dict) -> dict:
+        """Answers one protocol message."""
+        op = request.get("op")
+        if op == "lease":
+            return self.lease(request["worker"])
+        if op == "heartbeat":
+            return {"ok": self.heartbeat(request["pair_id"], request["lease_id"])}
+        if op == "complete":
+            return {"ok": self.complete(request["pair_id"], request["games"], request.get("worker"))}
+        if op == "fail":
+            return {"ok": self.fail(request["pair_id"], request["lease_id"], request.get("error", ""))}
+        return {"error": f"Unknown op: {op}"}
+
+    def lease(self, worker: str) -> dict:
+        with self._lock:
+            self._expire_leases()
+            if self._pending:
+                pair_id = self._pending.popleft()
+                self._attempts[pair_id] += 1
+                lease_id = next(self._lease_ids)
+                self._leases[pair_id] = (lease_id, worker, time.monotonic() + self.lease_seconds)
+                return {"lease_id": lease_id, "spec": self.specs[pair_id], "lease_seconds": self.lease_seconds}
+            if self._leases:
+                return {"wait": WAIT_SECONDS}
+            return {"done": True}
+
+    def heartbeat(self, pair_id: int, lease_id: int) -> bool:
+        with self._lock:
+            lease = self._leases.get(pair_id)
+            if lease is None or lease[0] != lease_id:
+                return False
+            self._leases[pair_id] = (lease_id, lease[1], time.monotonic() + self.lease_seconds)
+            return True
+
+    def complete(self, pair_id: int, games: list, worker: str | None = None) -> bool:
+        """
+        Records the results of a pair; returns False for duplicates (the pair already has a result).
+
+        Args:
+            games: {"result", "winner"} and optionally "pgn" and "duration_seconds" of the game
+                with the LLM as white, then of the game with the LLM as black.
+        """
+        with self._lock:
+            if pair_id in self.results or pair_id in self.failed:
+                return False
+            self.results[pair_id] = {"games": [{"result": g["result"], "winner": g["winner"]} for g in games], "worker": worker}
+            self._leases.pop(pair_id, None)
+            if pair_id in self._pending:  # re-queued after its lease expired
+                self._pending.remove(pair_id)
+            spec = self.specs[pair_id]
+            for game, llm_white in zip(games, (True, False)):
+                self._log(pair_id, f"LLM as White: {llm_white} | Result: {game['result']} | Winner: {game['winner']}")
+                if self.db is not None:
+                    white, black = (spec["player"], spec["opponent"]) if llm_white else (spec["opponent"], spec["player"])
+                    self.db.add_game(white, black, game["result"], opening_fen=spec["fen"], pgn=game.get("pgn"),
+                                     duration_seconds=game.get("duration_seconds"), event="ELO Eval")
+            self._check_finished()
+            return True
+
+    def fail(self, pair_id: int, lease_id: int, error: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(pair_id)
+            if lease is None or lease[0] != lease_id:
+                return False
+            del self._leases[pair_id]
+            self._retry(pair_id, error)
+            return True
+
+    def expire_leases(self) -> None:
+        with self._lock:
+            self._expire_leases()
+
+    def _expire_leases(self) -> None:
+        now = time.monotonic()
+        for pair_id, (_, worker, deadline) in list(self._leases.items()):
+            if deadline < now:
+                del self._leases[pair_id]
+                self._retry(pair_id, f"lease of worker {worker} expired")
+
+    def _retry(self, pair_id: int, error: str) -> None:
+        self._log(pair_id, f"Attempt {self._attempts[pair_id]} failed: {error}")
+        if self._attempts[pair_id] >= self.max_attempts:
+            self.failed[pair_id] = error
+            self._check_finished()
+        else:
+            self._pending.append(pair_id)
+
+    def _check_finished(self) -> None:
+        if len(self.results) + len(self.failed) == len(self.specs):
+            self.finished.set()
+
+    def _log(self, pair_id: int, message: str) -> None:
+        spec = self.specs[pair_id]
+        entry = f"Pair {pair_id} | With: {spec['opponent']} | {message}\n"
+        print(entry, end="")
+        if self.log_file is not None:
+            with open(self.log_file, "a") as f:
+                f.write(entry)
+
+    def tally(self) -> dict:
+        """The results in the {known engine}_wins / _draws / _losses format of run_games.py."""
+        results = {}
+        for pair_id, pair in sorted(self.results.items()):
+            for game in pair["games"]:
+                record_result(results, self.specs[pair_id]["opponent"], game["winner"], self.player_name)
+        return results
+
+    def pair_scores(self) -> list:
+        """(opponent, score as white, score as black) of every finished pair, see openings.pairing_report."""
+        return [
+            (self.specs[pair_id]["opponent"], *(game_score(game["winner"], self.player_name) for game in pair["games"]))
+            for pair_id, pair in sorted(self.results.items())
+        ]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        with self.server.connections_lock:
+            self.server.connections += 1
+        try:
+            for line in self.rfile:
+                request = json.loads(line)
+                self.wfile.write((json.dumps(coordinator.handle(request)) + "\n").encode())
+        except (ConnectionError, ValueError, KeyError):
+            pass
+        finally:
+            with self.server.connections_lock:
+                self.server.connections -= 1
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, coordinator: Coordinator):
+        super().__init__(address, _Handler)
+        self.coordinator = coordinator
+        self.connections = 0
+        self.connections_lock = threading.Lock()
+
+
+def start_coordinator(coordinator: Coordinator, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> _Server:
+    """Serves the coordinator in a background thread (port 0 picks a free port)."""
+    server = _Server((host, port), coordinator)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def wait_for_games(server: _Server, grace_seconds: float = 3 * WAIT_SECONDS) -> None:
+    """Blocks until every pair has a result or was given up on, then stops the server."""
+    coordinator = server.coordinator
+    # Leases are also expired here, so pairs of dead workers are re-queued without new requests
+    while not coordinator.finished.wait(WAIT_SECONDS):
+        coordinator.expire_leases()
+    # Let connected workers poll once more and receive {"done": true}
+    deadline = time.monotonic() + grace_seconds
+    while server.connections and time.monotonic() < deadline:
+        time.sleep(0.05)
+    server.shutdown()
+    server.server_close()
+
+
+# ====================================================
+# Worker
+# ====================================================
+class _Connection:
+    def __init__(self, address, worker: str, connect_timeout: float = 60.0):
+        self.address = address
+        self.worker = worker
+        self.connect_timeout = connect_timeout
+        self._lock = threading.Lock()  # shared with the heartbeat thread
+        self._file = None
+        self._connect()
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                self._file = socket.create_connection(self.address).makefile("rwb")
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(WAIT_SECONDS)
+
+    def request(self, **message) -> dict:
+        """Sends one message and returns the reply, reconnecting once if the connection dropped."""
+        message["worker"] = self.worker
+        payload = (json.dumps(message) + "\n").encode()
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    self._file.write(payload)
+                    self._file.flush()
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError("Coordinator closed the connection")
+                    return json.loads(line)
+                except OSError:
+                    if attempt:
+                        raise
+                    self._file.close()
+                    self._connect()
+
+    def close(self):
+        self._file.close()
+
+
+def _heartbeat(connection: _Connection, pair_id: int, lease_id: int, interval: float, stop: threading.Event):
+    while not stop.wait(interval):
+        try:
+            if not connection.request(op="heartbeat", pair_id=pair_id, lease_id=lease_id)["ok"]:
+                return  # lease lost, the result may still be accepted
+        except OSError:
+            return
+
+
+def run_worker(address, engine: str = "stockfish", connect_timeout: float = 60.0, seed: int = 0) -> int:
+    """
+    Plays leased pairs until the coordinator has none left.
+
+    Args:
+        address: (host, port) of the coordinator.
+        engine (str): "stockfish", or "mock" to play with MockEngine players and evaluation
+            (no Stockfish binary needed, for testing on one machine).
+        connect_timeout (float): Seconds to keep retrying the first connection.
+        seed (int): Base seed of the mock engines, which are seeded per pair.
+
+    Returns:
+        int: The number of games played.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    connection = _Connection(tuple(address), worker, connect_timeout)
+    if engine == "mock":
+        from engine.mock import MockEngine
+        unknown_engine = None  # one per pair, seeded from the pair
+        eval_engine = MockEngine("eval")
+    else:
+        unknown_engine = create_engine("Stockfish_1950", time=TIME_LIMIT)  # replace with LLM
+        eval_engine = None  # the shared Stockfish evaluation engine of game.py
+    num_games = 0
+    try:
+        while True:
+            response = connection.request(op="lease")
+            if response.get("done"):
+                break
+            if "wait" in response:
+                time.sleep(response["wait"])
+                continue
+            spec, lease_id = response["spec"], response["lease_id"]
+            pair_id = spec["pair_id"]
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=_heartbeat, args=(connection, pair_id, lease_id, response["lease_seconds"] / 3, stop), daemon=True
+            )
+            heartbeat.start()
+            try:
+                if engine == "mock":
+                    player_engine = MockEngine("unknown", seed=MOCK_PLAYER_SEED + seed + pair_id)
+                    known_engine = MockEngine(spec["opponent"], seed=pair_id)
+                else:
+                    player_engine, known_engine = unknown_engine, None
+                games = play_pair(
+                    player_engine, spec["player"], spec["opponent"], chess.Board(spec["fen"]),
+                    known_engine=known_engine, eval_engine=eval_engine,
+                )
+            except Exception as e:
+                connection.request(op="fail", pair_id=pair_id, lease_id=lease_id, error=f"{type(e).__name__}: {e}")
+                continue
+            finally:
+                stop.set()
+                heartbeat.join()
+            connection.request(
+                op="complete", pair_id=pair_id, lease_id=lease_id,
+                games=[{"result": result, "winner": winner, "pgn": str(game), "duration_seconds": duration}
+                       for result, winner, game, duration in games],
+            )
+            num_games += len(games)
+    finally:
+        connection.close()
+        if unknown_engine is not None:
+            unknown_engine.close()
+        close_eval_engine()
+    return num_games
+
+
+def _worker_process(address, engine, seed):
+    run_worker(address, engine, seed=seed)
+
+
+# ====================================================
+# Entry points
+# ====================================================
+def run_coordinator(num_games: int = NUM_GAMES, host: str = "127.0.0.1", port: int = DEFAULT_PORT, lease_seconds: float = LEASE_SECONDS,
+                    max_attempts: int = 3, log_file: str = "game_log.txt", num_local_workers: int = 0, engine: str = "stockfish",
+                    db_path: str | None = None, player_name: str = "unknown", openings: list | None = None, seed: int = 0) -> dict:
+    """
+    Hands out the colour-reversed pairs of run_games.py (on `openings`, default the standard
+    start) to workers and estimates the Elo from their results. Binds to localhost unless
+    `host` is given (the protocol is not authenticated); `seed` seeds local mock workers.
+    """
+    with open(log_file, "w") as file:
+        pass  # File is now empty
+    db = GameDatabase(db_path) if db_path is not None else None
+    if db is not None:
+        db.add_player(player_name)
+        for stockfish_name, stockfish_elo in KNOWN_ENGINES_CONFIGS.items():
+            db.add_player(stockfish_name, stockfish_elo)
+    coordinator = Coordinator(schedule_pairs(num_games, openings), lease_seconds, max_attempts, log_file, player_name, db)
+    server = start_coordinator(coordinator, host, port)
+    address = ("127.0.0.1", server.server_address[1])
+    print(f"Coordinator listening on {host}:{address[1]} with {len(coordinator.specs)} pairs")
+
+    processes = []
+    for _ in range(num_local_workers):
+        p = multiprocessing.Process(target=_worker_process, args=(address, engine, seed))
+        p.start()
+        processes.append(p)
+    wait_for_games(server)
+    for p in processes:
+        p.join()
+
+    print('All games have been played!')
+    if coordinator.failed:
+        print(f"Gave up on {len(coordinator.failed)} pairs: {coordinator.failed}")
+    results = coordinator.tally()
+    print(results)
+    summary = summarize_results(results)
+    summary["pairing"] = pairing_report(coordinator.pair_scores())
+    print_pairing_report(summary["pairing"])
+    if db is not None:
+        summary["ratings"] = db.update_ratings()
+        print_ladder(db)
+        db.close()
+    return summary
+
+
+def _address(text: str):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed Elo tournaments (coordinator / workers over TCP).")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    for mode in ("coordinator", "local"):
+        sub = subparsers.add_parser(mode)
+        sub.add_argument("--num-games", type=even_num_games, default=NUM_GAMES, help="Games per Elo level (played in colour-reversed pairs, even).")
+        sub.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+        sub.add_argument("--max-attempts", type=int, default=3)
+        sub.add_argument("--log-file", default="game_log.txt")
+        sub.add_argument("--db", default=None, help="Game database to store the games in and rate from (see ratings.py).")
+        sub.add_argument("--player-name", default="unknown", help="Name of the evaluated engine.")
+        add_opening_arguments(sub)
+    coordinator_parser, local_parser = subparsers.choices["coordinator"], subparsers.choices["local"]
+    coordinator_parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on, e.g. 0.0.0.0 for other hosts (no authentication).")
+    coordinator_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    local_parser.add_argument("--num-workers", type=int, default=4, help="Local worker processes standing in for hosts.")
+    local_parser.add_argument("--engine", choices=["stockfish", "mock"], default="stockfish")
+    worker_parser = subparsers.add_parser("worker")
+    worker_parser.add_argument("--coordinator", type=_address, default=("127.0.0.1", DEFAULT_PORT), help="HOST:PORT")
+    worker_parser.add_argument("--engine", choices=["stockfish", "mock"], default="stockfish")
+    for sub in (local_parser, worker_parser):
+        sub.add_argument("--seed", type=int, default=0, help="Base seed of mock engines.")
+    args = parser.parse_args(argv)
+
+    if args.mode == "worker":
+        num_games = run_worker(args.coordinator, args.engine, seed=args.seed)
+        print(f"Played {num_games} games")
+        return num_games
+    if args.mode == "coordinator":
+        return run_coordinator(args.num_games, args.host, args.port, args.lease_seconds, args.max_attempts, args.log_file,
+                               db_path=args.db, player_name=args.player_name, openings=openings_from_args(args))
+    return run_coordinator(args.num_games, "127.0.0.1", 0, args.lease_seconds, args.max_attempts, args.log_file,
+                           num_local_workers=args.num_workers, engine=args.engine, db_path=args.db, player_name=args.player_name,
+                           openings=openings_from_args(args), seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,4 +7,21 @@ class Engine(ABC):
         """Returns the best legal move from a given board."""
 
     def __init__(self, name):
-        self._name = name
\ No newline at end of file
+        self._name = name
+
+    def stop(self) -> None:
+        """Asks a `play` running in another thread to return early (its move is discarded).
+
+        A stop that arrives before the search has started ends it as soon as it starts;
+        one that arrives after `play` returned stays pending until `clear_stop`.
+        Engines that cannot be interrupted simply finish their search.
+        """
+
+    def clear_stop(self) -> None:
+        """Withdraws a pending `stop`, so that the next `play` searches in full."""
+
+    def reseed(self, seed: int) -> None:
+        """Restarts the random choices of a randomized engine from `seed`.
+
+        Deterministic engines ignore it.
+        """
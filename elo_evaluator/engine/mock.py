@@ -0,0 +1,65 @@
+from .base import Engine
+import chess
+import chess.engine
+import random
+import threading
+import time
+
+# Centipawn values used by the material evaluation
+_PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 300,
+    chess.BISHOP: 300,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 0,
+}
+
+class MockEngine(Engine):
+    """A deterministic stand-in for Stockfish (tests and benchmarks, no binary needed).
+
+    Plays a seeded random legal move and evaluates positions by material balance.
+    `think_time` (seconds) emulates the latency of a real search in `play` and
+    `analyse`; a waiting `play` returns early when `stop` is called.
+    """
+
+    def __init__(self, name: str = "mock", seed: int = 0, think_time: float = 0.0) -> None:
+        super().__init__(name)
+        self._rng = random.Random(seed)
+        self._think_time = think_time
+        self._stopped = threading.Event()
+
+    def close(self) -> None:
+        pass
+
+    def analyse(self, board: chess.Board):
+        """Returns the material balance in the same shape as Stockfish's analysis."""
+        if self._think_time:
+            time.sleep(self._think_time)
+        material = 0
+        for piece_type, value in _PIECE_VALUES.items():
+            material += value * (
+                len(board.pieces(piece_type, chess.WHITE)) - len(board.pieces(piece_type, chess.BLACK))
+            )
+        score = chess.engine.PovScore(chess.engine.Cp(material), chess.WHITE).pov(board.turn)
+        return {"score": chess.engine.PovScore(score, board.turn)}
+
+    def play(self, board: chess.Board) -> chess.Move:
+        """Returns a random legal move."""
+        legal_moves = list(board.legal_moves)
+        if not legal_moves:
+            raise ValueError('No legal moves, the game is over.')
+        move = self._rng.choice(legal_moves)
+        if self._think_time:
+            self._stopped.wait(self._think_time)
+            self._stopped.clear()
+        return move
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def clear_stop(self) -> None:
+        self._stopped.clear()
+
+    def reseed(self, seed: int) -> None:
+        self._rng.seed(seed)
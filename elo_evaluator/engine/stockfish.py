@@ -2,6 +2,7 @@ from .base import Engine
 import chess
 import chess.engine
 import os
+import threading
 
 from collections.abc import Mapping, Sequence
 
@@ -17,6 +18,9 @@ class StockfishEngine(Engine):
         self._limit = limit
         self._skill_level = None
         self._elo = None
+        self._analysis = None  # the running search of `play`, for `stop`
+        self._stop_requested = False
+        self._stop_lock = threading.Lock()
         stockfish_path = "/opt/homebrew/bin/stockfish" # Update this path if needed
         self._engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
 
@@ -53,11 +57,37 @@ class StockfishEngine(Engine):
 
     def play(self, board: chess.Board) -> chess.Move:
         """Returns the best move from stockfish."""
-        best_move = self._engine.play(board, limit=self._limit).move
+        # Searching through an analysis handle (same `go` command and limit as
+        # `SimpleEngine.play`) lets `stop` end the search from another thread.
+        # Unlike `play`, `analysis` turns UCI_AnalyseMode on unless told not to.
+        options = {"UCI_AnalyseMode": False} if "UCI_AnalyseMode" in self._engine.options else {}
+        with self._engine.analysis(board, limit=self._limit, options=options) as analysis:
+            with self._stop_lock:
+                self._analysis = analysis
+                # A stop that came while the search was being started
+                if self._stop_requested:
+                    analysis.stop()
+            try:
+                best_move = analysis.wait().move
+            finally:
+                with self._stop_lock:
+                    self._analysis = None
+                    self._stop_requested = False
         if best_move is None:
             raise ValueError('No best move found, something went wrong.')
         return best_move
 
+    def stop(self) -> None:
+        """Stops a running `play`, which then returns the best move found so far."""
+        with self._stop_lock:
+            self._stop_requested = True
+            if self._analysis is not None:
+                self._analysis.stop()
+
+    def clear_stop(self) -> None:
+        with self._stop_lock:
+            self._stop_requested = False
+
 # Example Usage
 if __name__ == "__main__":
     engine = StockfishEngine(limit=chess.engine.Limit(time=0.05))
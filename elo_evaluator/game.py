@@ -1,69 +1,234 @@
 from engine.stockfish import Engine, StockfishEngine
 import chess
 import chess.pgn
+import collections
+import concurrent.futures
 import datetime
+import functools
 
 # We use a stockfish engine to evaluate the current board and terminate the
-# game early if the score is high enough (i.e., _MIN_SCORE_TO_STOP).
-_EVAL_STOCKFISH_ENGINE = StockfishEngine(
-    name="eval",
-    limit=chess.engine.Limit(time=0.01)
-)
+# game early if the score is high enough (i.e., _MIN_SCORE_TO_STOP). It is
+# started on first use, so importing this module does not need Stockfish.
+_EVAL_STOCKFISH_ENGINE = None
 _MIN_SCORE_TO_STOP = 1300
 
+
+def get_eval_engine() -> StockfishEngine:
+  """Returns the shared evaluation engine, starting it if needed."""
+  global _EVAL_STOCKFISH_ENGINE
+  if _EVAL_STOCKFISH_ENGINE is None:
+    _EVAL_STOCKFISH_ENGINE = StockfishEngine(
+        name="eval",
+        limit=chess.engine.Limit(time=0.01)
+    )
+  return _EVAL_STOCKFISH_ENGINE
+
+
+def close_eval_engine() -> None:
+  """Closes the shared evaluation engine if it was started."""
+  global _EVAL_STOCKFISH_ENGINE
+  if _EVAL_STOCKFISH_ENGINE is not None:
+    _EVAL_STOCKFISH_ENGINE.close()
+    _EVAL_STOCKFISH_ENGINE = None
+
+
+class TerminationTracker:
+  """Incremental game-termination checks for a board that is only changed through `push`.
+
+  Equivalent to `board.is_game_over() or board.can_claim_fifty_moves() or
+  board.is_repetition()`, but python-chess answers `is_repetition` (and the
+  fivefold check of `is_game_over`) by scanning and replaying the move stack,
+  and searches for a legal move in several of these calls. The tracker instead
+  counts the occurrences of every position (by python-chess' transposition key,
+  the identity `is_repetition` compares) since the last irreversible move, and
+  looks for a legal move once per ply, so the bookkeeping per ply does not grow
+  with the length of the game.
+  """
+
+  def __init__(self, board: chess.Board):
+    self._board = board
+    self._has_legal_moves = None
+    # Seed the counts with the reversible tail of the board's move stack.
+    history = board.copy()
+    keys = [history._transposition_key()]
+    while history.move_stack:
+      move = history.pop()
+      if history.is_irreversible(move):
+        break
+      keys.append(history._transposition_key())
+    self._counts = collections.Counter(keys)
+    self._key = keys[0]
+
+  def push(self, move: chess.Move) -> None:
+    """Plays a move on the tracked board."""
+    if self._board.is_irreversible(move):
+      # Earlier positions can no longer repeat.
+      self._counts.clear()
+    self._board.push(move)
+    self._key = self._board._transposition_key()
+    self._counts[self._key] += 1
+    self._has_legal_moves = None
+
+  def repetitions(self) -> int:
+    """How often the current position has occurred."""
+    return self._counts[self._key]
+
+  def has_legal_moves(self) -> bool:
+    """Whether the side to move has a legal move (searched once per ply)."""
+    if self._has_legal_moves is None:
+      self._has_legal_moves = any(self._board.generate_legal_moves())
+    return self._has_legal_moves
+
+  def is_over(self) -> bool:
+    """Whether the game is over or a draw can be claimed (fifty moves, threefold)."""
+    board = self._board
+    if self._counts[self._key] >= 3 or not self.has_legal_moves():
+      return True
+    if board.halfmove_clock >= 100:
+      return True
+    # Material is only insufficient without pawns, rooks and queens.
+    if not (board.pawns | board.rooks | board.queens) and board.is_insufficient_material():
+      return True
+    if board.halfmove_clock == 99:
+      # A move that does not reset the clock can claim the fifty-move rule,
+      # unless it ends the game.
+      for move in board.generate_legal_moves():
+        if not board.is_zeroing(move):
+          board.push(move)
+          try:
+            if any(board.generate_legal_moves()):
+              return True
+          finally:
+            board.pop()
+    return False
+
+  def result(self) -> str:
+    """The result of a game stopped by `is_over` (`board.result(claim_draw=True)`)."""
+    if not self.has_legal_moves() and self._board.is_check():
+      return '0-1' if self._board.turn == chess.WHITE else '1-0'
+    return '1/2-1/2'
+
+
+def _adjudicate(
+    eval_engine: Engine, board: chess.Board, cache: dict | None = None
+) -> str | None:
+  """Returns the result if the evaluation of `board` is decisive, else None.
+
+  With a `cache` (FEN -> evaluation), positions already evaluated, e.g. in the
+  shared opening moves of a colour-reversed pair, are not analysed again.
+  """
+  if cache is None:
+    info = eval_engine.analyse(board)
+  else:
+    fen = board.fen()
+    info = cache.get(fen)
+    if info is None:
+      info = cache[fen] = eval_engine.analyse(board)
+  score = info['score'].relative
+  if score.is_mate():
+    is_winning = score.mate() > 0
+  else:
+    is_winning = score.score() > 0
+  score_too_high = score.is_mate() or abs(score.score()) > _MIN_SCORE_TO_STOP
+
+  if not score_too_high:
+    return None
+  is_white = board.turn == chess.WHITE
+  if is_white and is_winning or (not is_white and not is_winning):
+    return '1-0'
+  return '0-1'
+
+
+def _stop_if_decided(engine: Engine, adjudication: concurrent.futures.Future) -> None:
+  if adjudication.exception() is None and adjudication.result() is not None:
+    engine.stop()
+
+
 def _play_game(
     engines: tuple[Engine, Engine],
     engines_names: tuple[str, str],
     white_name: str,
     initial_board: chess.Board | None = None,
+    eval_engine: Engine | None = None,
+    pipeline: bool = True,
+    adjudication_cache: dict | None = None,
 ) -> chess.pgn.Game:
   """Plays a game of chess between two engines.
 
+  After every move, the position is adjudicated by `eval_engine` while the
+  next engine already searches its reply (`pipeline`). Adjudication still
+  decides before the reply is pushed: if it ends the game, the search is
+  stopped (`Engine.stop`) and its move discarded, so the game is the same as
+  when adjudicating and searching one after the other.
+
+  This holds for engines limited by depth or nodes. An engine limited by time
+  shares the CPU with the adjudication while they overlap, so it may search
+  less deeply than in sequence: leave a core free for `eval_engine` per game
+  played in parallel, or pass `pipeline=False`, when results must not depend
+  on the load.
+
   Args:
     engines: The engines to play the game.
     engines_names: The names of the engines.
     white_name: The name of the engine playing white.
     initial_board: The initial board (if None, the standard starting position).
+    eval_engine: The engine whose `analyse` adjudicates the game (if None, the
+      shared Stockfish evaluation engine).
+    pipeline: Whether to overlap adjudication with the next search. If False,
+      the next search only starts once the adjudication is done.
+    adjudication_cache: Evaluations of the positions adjudicated so far (FEN ->
+      analysis), shared by the games of a colour-reversed pair.
 
   Returns:
     The game played between the engines.
   """
   if initial_board is None:
     initial_board = chess.Board()
+  if eval_engine is None:
+    eval_engine = get_eval_engine()
   white_player = engines_names.index(white_name)
   current_player = white_player if initial_board.turn else 1 - white_player
   board = initial_board
+  tracker = TerminationTracker(board)
   result = None
   print(f'Starting FEN: {board.fen()}')
 
-  while not (
-      board.is_game_over()
-      or board.can_claim_fifty_moves()
-      or board.is_repetition()
-  ):
-    best_move = engines[current_player].play(board)
-    # print(f'Best move: {best_move.uci()}')
-
-    # Push move to the game.
-    board.push(best_move)
-    current_player = 1 - current_player
-
-    # We analyse the board once the last move is done and pushed.
-    info = _EVAL_STOCKFISH_ENGINE.analyse(board)
-    score = info['score'].relative
-    if score.is_mate():
-      is_winning = score.mate() > 0
-    else:
-      is_winning = score.score() > 0
-    score_too_high = score.is_mate() or abs(score.score()) > _MIN_SCORE_TO_STOP
-
-    if score_too_high:
-      is_white = board.turn == chess.WHITE
-      if is_white and is_winning or (not is_white and not is_winning):
-        result = '1-0'
+  # Adjudication runs in a worker thread while this one searches; both only
+  # read the board, which is changed once they are done.
+  with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+    adjudication = None  # Of the position after the last move.
+    is_over = tracker.is_over()
+    while not is_over:
+      mover = engines[current_player]
+      if adjudication is not None:
+        # If the game ends before this move, the move is not needed anymore.
+        adjudication.add_done_callback(functools.partial(_stop_if_decided, mover))
+      best_move = mover.play(board)
+      # print(f'Best move: {best_move.uci()}')
+      if adjudication is not None:
+        result = adjudication.result()
+        adjudication = None
+        if result is not None:
+          break
+
+      # Push move to the game.
+      tracker.push(best_move)
+      current_player = 1 - current_player
+      is_over = tracker.is_over()
+
+      # We analyse the board once the last move is done and pushed.
+      if is_over or not pipeline:
+        result = _adjudicate(eval_engine, board, adjudication_cache)
+        if result is not None:
+          break
       else:
-        result = '0-1'
-      break
+        adjudication = executor.submit(
+            _adjudicate, eval_engine, board, adjudication_cache
+        )
+  # The executor has run the adjudication callbacks by now: withdraw a stop
+  # that came after the search it was meant for.
+  for engine in engines:
+    engine.clear_stop()
   print(f'End FEN: {board.fen()}')
 
   game = chess.pgn.Game.from_board(board)
@@ -74,7 +239,7 @@ def _play_game(
   if result is not None:  # Due to early stopping.
     game.headers['Result'] = result
   else:
-    game.headers['Result'] = board.result(claim_draw=True)
+    game.headers['Result'] = tracker.result()
   return game
 
 
@@ -98,4 +263,4 @@ if __name__ == "__main__":
     #close engines to end the program
     engine_white.close()
     engine_black.close()
-    _EVAL_STOCKFISH_ENGINE.close()
\ No newline at end of file
+    close_eval_engine()
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Opening suites and colour-paired games.
+
+With a single start position, games between time-limited engines largely repeat each other.
+A suite of openings (EPD, FEN or PGN files) makes them independent, and playing every opening
+twice with colours reversed (a pair) cancels most of the advantage an opening gives one side:
+the unknown engine's pair score varies much less than two independent games' scores do, so the
+same confidence on its Elo needs fewer games. `pairing_report` measures that variance reduction
+from the pair results of a tournament.
+
+Usage (from elo_evaluator/):
+    python run_games.py --openings openings.epd --max-openings 500
+    python distributed.py local --engine mock --openings games.pgn --opening-plies 8
+"""
+import math
+import random
+from collections import defaultdict
+
+import chess
+import chess.pgn
+
+# z-score of the reported confidence intervals (95%)
+Z_95 = 1.96
+
+
+# ====================================================
+# Suites
+# ====================================================
+def load_openings(path: str, max_openings: int | None = None, seed: int | None = 0, plies: int | None = None) -> list:
+    """
+    Loads the positions of an opening suite.
+
+    Args:
+        path (str): A PGN file (the position at the end of every game's mainline, or after
+            `plies` half-moves) or a file of EPD / FEN lines ("#" starts a comment line).
+        max_openings (int | None): Keep this many openings, drawn at random with `seed`
+            (None keeps them all).
+        seed (int | None): Seed of the draw; also shuffles the suite unless None.
+        plies (int | None): Truncate PGN games to this many half-moves.
+
+    Returns:
+        list: The FENs of the openings, without duplicates.
+    """
+    if path.endswith(".pgn"):
+        fens = _read_pgn_openings(path, plies)
+    else:
+        fens = _read_epd_openings(path)
+    fens = list(dict.fromkeys(fens))
+    if not fens:
+        raise ValueError(f"No openings found in {path}")
+    if seed is not None:
+        random.Random(seed).shuffle(fens)
+    return fens[:max_openings] if max_openings is not None else fens
+
+
+def _read_epd_openings(path: str):
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split()
+            try:
+                # A full FEN has the move counters as its 5th and 6th fields
+                if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                    board = chess.Board(" ".join(fields[:6]))
+                else:
+                    board, _ = chess.Board.from_epd(line)
+            except ValueError as e:
+                raise ValueError(f"Invalid opening in {path}: {line!r}") from e
+            yield board.fen()
+
+
+def _read_pgn_openings(path: str, plies: int | None):
+    with open(path, "r") as f:
+        while (game := chess.pgn.read_game(f)) is not None:
+            board = game.board()
+            for ply, move in enumerate(game.mainline_moves()):
+                if plies is not None and ply >= plies:
+                    break
+                board.push(move)
+            yield board.fen()
+
+
+# ====================================================
+# Pairing report
+# ====================================================
+def _elo_half_width(score: float, stderr: float) -> float:
+    """Half-width of the Elo confidence interval of a score (slope of the logistic Elo curve)."""
+    score = max(min(score, 0.99), 0.01)
+    return Z_95 * stderr * 400 / (math.log(10) * score * (1 - score))
+
+
+def _pair_statistics(pairs) -> dict:
+    """Statistics of (score, score) pairs, centered per group: {group: [(s1, s2), ...]}."""
+    num_pairs = sum(len(group) for group in pairs.values())
+    num_groups = len(pairs)
+    total = sum(s1 + s2 for group in pairs.values() for s1, s2 in group)
+    stats = {"num_pairs": num_pairs, "num_games": 2 * num_pairs, "score": total / (2 * num_pairs) if num_pairs else 0.0}
+    if num_pairs <= num_groups:
+        stats.update(stderr_paired=None, stderr_unpaired=None, variance_ratio=None, elo_ci_paired=None, elo_ci_unpaired=None)
+        return stats
+
+    game_squares = pair_squares = 0.0
+    for group in pairs.values():
+        game_mean = sum(s1 + s2 for s1, s2 in group) / (2 * len(group))
+        game_squares += sum((s - game_mean) ** 2 for pair in group for s in pair)
+        pair_squares += sum(((s1 + s2) / 2 - game_mean) ** 2 for s1, s2 in group)
+    # Per-game variance if games were independent vs. variance of a pair's mean score
+    game_variance = game_squares / (2 * num_pairs - num_groups)
+    pair_variance = pair_squares / (num_pairs - num_groups)
+    stderr_unpaired = math.sqrt(game_variance / (2 * num_pairs))
+    stderr_paired = math.sqrt(pair_variance / num_pairs)
+    stats.update(
+        stderr_paired=stderr_paired,
+        stderr_unpaired=stderr_unpaired,
+        # Fraction of the games independent games would need for the same confidence
+        variance_ratio=stderr_paired ** 2 / stderr_unpaired ** 2 if game_variance else None,
+        elo_ci_paired=_elo_half_width(stats["score"], stderr_paired),
+        elo_ci_unpaired=_elo_half_width(stats["score"], stderr_unpaired),
+    )
+    return stats
+
+
+def pairing_report(pair_scores) -> dict:
+    """
+    Compares the precision of colour-paired games with that of as many independent games.
+
+    Args:
+        pair_scores: (opponent, score as white, score as black) of every pair, scores of the
+            evaluated engine (1 win, 0.5 draw, 0 loss).
+
+    Returns:
+        dict: Statistics per opponent and over all pairs ("all", deviations taken from each
+        opponent's mean): num_pairs, num_games, score, stderr_paired / stderr_unpaired (of the
+        mean score), variance_ratio (paired / unpaired variance, i.e. the fraction of games
+        pairing needs for the same confidence) and the matching 95% Elo half-widths. The
+        precision statistics are None without enough pairs.
+    """
+    by_opponent = defaultdict(list)
+    for opponent, white_score, black_score in pair_scores:
+        by_opponent[opponent].append((white_score, black_score))
+    report = {opponent: _pair_statistics({opponent: pairs}) for opponent, pairs in sorted(by_opponent.items())}
+    report["all"] = _pair_statistics(by_opponent)
+    return report
+
+
+def print_pairing_report(report: dict):
+    print(f"\n{'Opponent':<20} {'Pairs':>6} {'Score':>7} {'Elo CI paired':>14} {'unpaired':>9} {'Var ratio':>10}")
+    for opponent, stats in report.items():
+        if stats["variance_ratio"] is None:
+            print(f"{opponent:<20} {stats['num_pairs']:>6} {stats['score']:>7.3f} {'-':>14} {'-':>9} {'-':>10}")
+            continue
+        print(f"{opponent:<20} {stats['num_pairs']:>6} {stats['score']:>7.3f} {stats['elo_ci_paired']:>13.0f}"
+              f"  {stats['elo_ci_unpaired']:>8.0f} {stats['variance_ratio']:>10.2f}")
+    ratio = report["all"]["variance_ratio"]
+    if ratio == 0:
+        # Every pair scored its opponent's mean, there is no pair-to-pair variance to compare
+        print(f"No variance between pairs in {report['all']['num_games']} games.")
+    elif ratio is not None:
+        print(f"Pairing reached the confidence of {report['all']['num_games'] / ratio:.0f} independent games "
+              f"with {report['all']['num_games']} games.")
@@ -0,0 +1,321 @@
+"""
+Persistent game database and Bradley-Terry rating ladder over every stored game.
+
+Games (players, opening, PGN, result, timings) are kept in SQLite, so tournaments of
+different checkpoints accumulate instead of being thrown away. Ratings are the maximum
+a-posteriori Bradley-Terry (Elo scale) strengths given all games, with anchored players (the
+Stockfish levels of run_games.py) held at their nominal Elo and a weak Gaussian prior that
+keeps perfect scores finite. Standard errors come from the inverse Hessian of the
+log-posterior.
+
+The fit works on the per-pair score totals (one SQL GROUP BY), so its cost depends on the
+number of player pairs, not games, and it is warm-started from the stored ratings: after a
+few new games, Newton's method converges in one or two steps. The log-posterior is concave,
+and every Newton step is halved until it increases it, so lopsided or perfect scores far from
+the starting point converge too. A new checkpoint therefore
+needs only a handful of games against rated players (`suggest_opponents` picks the most
+informative ones) to get a rating with a confidence interval.
+
+Usage (from elo_evaluator/):
+    python run_games.py --db games.sqlite --player-name ckpt-1000    # store games as they are played
+    python ratings.py ladder --db games.sqlite                       # refit and print all ratings
+    python ratings.py opponents --db games.sqlite --player ckpt-1000 # who to play next
+"""
+import math
+import time
+import sqlite3
+import argparse
+import warnings
+
+import chess.pgn
+import numpy as np
+
+# Natural-log scale of the Elo logistic: P(win) = 1 / (1 + 10 ** (-diff / 400))
+_ELO_SCALE = math.log(10) / 400
+PRIOR_SD = 1000.0
+Z_95 = 1.96
+
+_RESULT_SCORES = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    name TEXT PRIMARY KEY,
+    anchor_elo REAL
+);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    white TEXT NOT NULL REFERENCES players(name),
+    black TEXT NOT NULL REFERENCES players(name),
+    result TEXT NOT NULL,
+    white_score REAL NOT NULL,
+    opening_fen TEXT,
+    pgn TEXT,
+    num_plies INTEGER,
+    duration_seconds REAL,
+    event TEXT,
+    played_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_white ON games(white);
+CREATE INDEX IF NOT EXISTS games_black ON games(black);
+CREATE TABLE IF NOT EXISTS ratings (
+    name TEXT PRIMARY KEY REFERENCES players(name),
+    elo REAL NOT NULL,
+    stderr REAL,
+    num_games INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+# ====================================================
+# Bradley-Terry fit
+# ====================================================
+def fit_ratings(pairs, anchors: dict, initial: dict | None = None, prior_sd: float = PRIOR_SD, max_iters: int = 50, tol: float = 1e-4) -> dict:
+    """
+    Fits Elo-scale Bradley-Terry ratings by damped Newton's method (each step is halved until
+    the log-posterior increases). Warns (RuntimeWarning) if `tol` is not reached.
+
+    Args:
+        pairs: (player a, player b, total score of a, number of games) tuples; draws count 0.5.
+        anchors (dict): Player -> fixed Elo. At least one is needed to set the scale's origin.
+        initial (dict | None): Player -> starting Elo (e.g. the stored ratings).
+        prior_sd (float): Standard deviation (Elo) of the prior around the mean anchor Elo.
+        max_iters (int): Maximum number of Newton steps.
+        tol (float): Stop once no rating moves by more than this (Elo).
+
+    Returns:
+        dict: Player -> (Elo, standard error); anchors have a standard error of 0. Players not
+        connected to an anchor through games are left out.
+    """
+    if not anchors:
+        raise ValueError("At least one anchored player is needed.")
+    pairs = [pair for pair in pairs if pair[0] != pair[1]]
+    connected = _connected_to(anchors, pairs)
+    pairs = [pair for pair in pairs if pair[0] in connected]
+    free = sorted(connected - set(anchors))
+    index = {name: i for i, name in enumerate(free)}
+    mean_anchor = float(np.mean(list(anchors.values())))
+    initial = initial or {}
+    ratings = np.array([initial.get(name, mean_anchor) for name in free], dtype=np.float64)
+
+    a = np.array([index.get(p[0], -1) for p in pairs], dtype=np.int64)
+    b = np.array([index.get(p[1], -1) for p in pairs], dtype=np.int64)
+    fixed_a = np.array([anchors.get(p[0], 0.0) for p in pairs])
+    fixed_b = np.array([anchors.get(p[1], 0.0) for p in pairs])
+    scores = np.array([p[2] for p in pairs], dtype=np.float64)
+    counts = np.array([p[3] for p in pairs], dtype=np.float64)
+    free_a, free_b = a >= 0, b >= 0
+
+    def differences(ratings):
+        ra = np.where(free_a, ratings[np.maximum(a, 0)], fixed_a)
+        rb = np.where(free_b, ratings[np.maximum(b, 0)], fixed_b)
+        return _ELO_SCALE * (ra - rb)
+
+    def log_posterior(ratings):
+        x = differences(ratings)
+        # log p = -log(1 + e^-x), log (1 - p) = -log(1 + e^x)
+        likelihood = -scores * np.logaddexp(0, -x) - (counts - scores) * np.logaddexp(0, x)
+        return likelihood.sum() - np.sum((ratings - mean_anchor) ** 2) / (2 * prior_sd**2)
+
+    hessian = -np.eye(len(free)) / prior_sd**2
+    converged = not free
+    for _ in range(max_iters if free else 0):
+        p = 1 / (1 + np.exp(-differences(ratings)))
+        residual = _ELO_SCALE * (scores - counts * p)
+        weight = _ELO_SCALE**2 * counts * p * (1 - p)
+
+        gradient = -(ratings - mean_anchor) / prior_sd**2
+        np.add.at(gradient, a[free_a], residual[free_a])
+        np.add.at(gradient, b[free_b], -residual[free_b])
+        hessian = -np.eye(len(free)) / prior_sd**2
+        np.add.at(hessian, (a[free_a], a[free_a]), -weight[free_a])
+        np.add.at(hessian, (b[free_b], b[free_b]), -weight[free_b])
+        both = free_a & free_b
+        np.add.at(hessian, (a[both], b[both]), weight[both])
+        np.add.at(hessian, (b[both], a[both]), weight[both])
+
+        step = np.linalg.solve(hessian, gradient)
+        current = log_posterior(ratings)
+        while log_posterior(ratings - step) < current and np.max(np.abs(step)) >= tol:
+            step /= 2
+        ratings -= step
+        if np.max(np.abs(step)) < tol:
+            converged = True
+            break
+    if not converged:
+        warnings.warn(f"Ratings did not converge to {tol} Elo in {max_iters} Newton steps.", RuntimeWarning)
+
+    stderr = np.sqrt(np.diag(np.linalg.inv(-hessian))) if free else np.zeros(0)
+    fitted = {name: (float(elo), 0.0) for name, elo in anchors.items()}
+    fitted.update({name: (float(ratings[i]), float(stderr[i])) for name, i in index.items()})
+    return fitted
+
+
+def _connected_to(anchors: dict, pairs) -> set:
+    """The players linked to an anchor by a chain of games."""
+    neighbours = {}
+    for a, b, _, _ in pairs:
+        neighbours.setdefault(a, set()).add(b)
+        neighbours.setdefault(b, set()).add(a)
+    connected = set(anchors)
+    frontier = list(anchors)
+    while frontier:
+        for other in neighbours.get(frontier.pop(), ()):
+            if other not in connected:
+                connected.add(other)
+                frontier.append(other)
+    return connected
+
+
+def expected_score(elo: float, opponent_elo: float) -> float:
+    return 1 / (1 + 10 ** ((opponent_elo - elo) / 400))
+
+
+# ====================================================
+# Database
+# ====================================================
+class GameDatabase:
+    def __init__(self, path: str):
+        """
+        SQLite store of players, games and fitted ratings.
+
+        Args:
+            path (str): The database file (created if needed). Several processes may write to
+                it; each write is a short transaction. The connection may be shared by threads
+                that serialize their calls (e.g. the coordinator's lock in distributed.py).
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_player(self, name: str, anchor_elo: float | None = None):
+        """Registers a player; an anchor Elo fixes its rating (None keeps an existing anchor)."""
+        with self._connection:
+            self._connection.execute(
+                "INSERT INTO players (name, anchor_elo) VALUES (?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET anchor_elo = COALESCE(excluded.anchor_elo, anchor_elo)",
+                (name, anchor_elo),
+            )
+
+    def add_game(self, white: str, black: str, result: str, opening_fen: str | None = None, pgn: str | None = None,
+                 num_plies: int | None = None, duration_seconds: float | None = None, event: str | None = None) -> int:
+        """Stores a finished game ("1-0", "0-1" or "1/2-1/2") and returns its id."""
+        if result not in _RESULT_SCORES:
+            raise ValueError(f"Unfinished or unknown result: {result}")
+        with self._connection:
+            for name in (white, black):
+                self._connection.execute("INSERT OR IGNORE INTO players (name) VALUES (?)", (name,))
+            cursor = self._connection.execute(
+                "INSERT INTO games (white, black, result, white_score, opening_fen, pgn, num_plies, duration_seconds, event, played_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (white, black, result, _RESULT_SCORES[result], opening_fen, pgn, num_plies, duration_seconds, event, time.time()),
+            )
+        return cursor.lastrowid
+
+    def add_pgn_game(self, game: chess.pgn.Game, opening_fen: str | None = None, duration_seconds: float | None = None) -> int:
+        """Stores a game as returned by game._play_game."""
+        headers = game.headers
+        return self.add_game(
+            headers["White"], headers["Black"], headers["Result"],
+            opening_fen=opening_fen if opening_fen is not None else game.board().fen(),
+            pgn=str(game), num_plies=game.end().ply() - game.ply(),
+            duration_seconds=duration_seconds, event=headers.get("Event"),
+        )
+
+    def anchors(self) -> dict:
+        rows = self._connection.execute("SELECT name, anchor_elo FROM players WHERE anchor_elo IS NOT NULL")
+        return dict(rows.fetchall())
+
+    def pair_scores(self) -> list:
+        """(white, black, white's total score, games) for every pairing."""
+        return self._connection.execute(
+            "SELECT white, black, SUM(white_score), COUNT(*) FROM games GROUP BY white, black"
+        ).fetchall()
+
+    def game_counts(self) -> dict:
+        rows = self._connection.execute(
+            "SELECT name, COUNT(*) FROM (SELECT white AS name FROM games UNION ALL SELECT black FROM games) GROUP BY name"
+        )
+        return dict(rows.fetchall())
+
+    def stored_ratings(self) -> dict:
+        """Player -> (Elo, standard error) of the last fit."""
+        rows = self._connection.execute("SELECT name, elo, stderr FROM ratings")
+        return {name: (elo, stderr) for name, elo, stderr in rows.fetchall()}
+
+    def update_ratings(self, prior_sd: float = PRIOR_SD) -> dict:
+        """Refits all ratings from every stored game (warm-started from the last fit) and stores them."""
+        initial = {name: elo for name, (elo, _) in self.stored_ratings().items()}
+        fitted = fit_ratings(self.pair_scores(), self.anchors(), initial, prior_sd)
+        counts = self.game_counts()
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO ratings (name, elo, stderr, num_games, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(name, elo, stderr, counts.get(name, 0), now) for name, (elo, stderr) in fitted.items()],
+            )
+        return fitted
+
+    def ladder(self) -> list:
+        """(name, Elo, standard error, games, is anchor) rows of the last fit, strongest first."""
+        return self._connection.execute(
+            "SELECT r.name, r.elo, r.stderr, r.num_games, p.anchor_elo IS NOT NULL"
+            " FROM ratings r JOIN players p ON p.name = r.name ORDER BY r.elo DESC"
+        ).fetchall()
+
+    def suggest_opponents(self, player: str, k: int = 3) -> list:
+        """
+        The k rated opponents whose games would shrink the player's rating error the most, i.e.
+        those with the largest p * (1 - p) (expected score closest to 1/2).
+        """
+        ratings = self.stored_ratings()
+        elo = ratings.get(player, (float(np.mean(list(self.anchors().values()) or [1500.0])), None))[0]
+        candidates = [(name, other) for name, (other, _) in ratings.items() if name != player]
+        candidates.sort(key=lambda item: -expected_score(elo, item[1]) * (1 - expected_score(elo, item[1])))
+        return [name for name, _ in candidates[:k]]
+
+
+def print_ladder(db: GameDatabase):
+    print(f"{'player':<30} {'Elo':>7} {'95% CI':>17} {'games':>6}")
+    for name, elo, stderr, num_games, is_anchor in db.ladder():
+        interval = "anchor" if is_anchor else f"[{elo - Z_95 * stderr:.0f}, {elo + Z_95 * stderr:.0f}]"
+        print(f"{name:<30} {elo:>7.0f} {interval:>17} {num_games:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Game database and Bradley-Terry rating ladder.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ladder = subparsers.add_parser("ladder", help="Refit the ratings and print them.")
+    anchor = subparsers.add_parser("anchor", help="Fix a player's Elo.")
+    anchor.add_argument("--player", required=True)
+    anchor.add_argument("--elo", type=float, required=True)
+    opponents = subparsers.add_parser("opponents", help="Most informative opponents for a player.")
+    opponents.add_argument("--player", required=True)
+    opponents.add_argument("-k", type=int, default=3)
+    for sub in (ladder, anchor, opponents):
+        sub.add_argument("--db", default="games.sqlite")
+    args = parser.parse_args(argv)
+
+    with GameDatabase(args.db) as db:
+        if args.command == "anchor":
+            db.add_player(args.player, args.elo)
+        elif args.command == "opponents":
+            print(" ".join(db.suggest_opponents(args.player, args.k)))
+        else:
+            db.update_ratings()
+            print_ladder(db)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 import copy
+import time
 import queue
+import argparse
 import chess
 import multiprocessing
 
 from elo_eval import estimate_elo
 from utils import create_engine, get_size
-from game import _EVAL_STOCKFISH_ENGINE, _play_game
-import torch
+from game import close_eval_engine, _play_game
+from ratings import GameDatabase, print_ladder
+from openings import load_openings, pairing_report, print_pairing_report
 import os
 
 # Constants
@@ -23,24 +26,156 @@ KNOWN_ENGINES_CONFIGS = {
     "Stockfish_2800": 2800,
 }
 
-# Opening positions
+# Opening positions (replaced by a suite with --openings, see openings.py)
 opening_fens = [
     chess.STARTING_FEN,  # Standard start
 ]
 opening_boards = [chess.Board(fen) for fen in opening_fens]
 
-def worker(game_queue, log_lock, log_file, results, results_lock, core_id):
+def schedule_pairs(num_games: int = NUM_GAMES, openings: list | None = None) -> list:
+    """
+    Returns the (known engine name, opening board) of every colour-reversed pair: num_games // 2
+    pairs per known engine. Openings (FENs, default opening_fens) are dealt round-robin, so no
+    opening is repeated before the whole suite was used.
+    """
+    if num_games % 2:
+        raise ValueError(f"Games are played in colour-reversed pairs, num_games must be even (got {num_games})")
+    boards = opening_boards if openings is None else [chess.Board(fen) for fen in openings]
+    pairs = []
+    for i in range(num_games // 2):
+        for j, stockfish_name in enumerate(KNOWN_ENGINES_CONFIGS):
+            pairs.append((stockfish_name, boards[(i * len(KNOWN_ENGINES_CONFIGS) + j) % len(boards)]))
+    return pairs
+
+
+def play_scheduled_game(unknown_engine, unknown_engine_name, known_engine_name, board, is_llm_white, known_engine=None, eval_engine=None,
+                        adjudication_cache=None):
+    """
+    Plays one scheduled game and returns its result ("1-0", "0-1", "1/2-1/2"), winner (an
+    engine name or "draw") and PGN game. The known engine is created (and closed) unless given.
+    """
+    close_known_engine = known_engine is None
+    if known_engine is None:
+        known_engine = create_engine(known_engine_name, time=TIME_LIMIT)
+
+    game = _play_game(
+        (known_engine, unknown_engine),
+        (known_engine_name, unknown_engine_name),
+        white_name=unknown_engine_name if is_llm_white else known_engine_name,
+        initial_board=copy.deepcopy(board),
+        eval_engine=eval_engine,
+        adjudication_cache=adjudication_cache,
+    )
+
+    if close_known_engine:
+        known_engine.close()
+
+    # Store result
+    result = game.headers.get("Result", "*")
+    if result == "1-0":  # White wins
+        winner = game.headers["White"]
+    elif result == "0-1":  # Black wins
+        winner = game.headers["Black"]
+    else:
+        winner = "draw"
+    return result, winner, game
+
+
+def play_pair(unknown_engine, unknown_engine_name, known_engine_name, board, known_engine=None, eval_engine=None) -> list:
+    """
+    Plays both colours of an opening against a known engine, the LLM as white first. The two
+    games share the known engine (created once unless given, so its hash is kept) and the
+    adjudication cache.
+
+    Returns:
+        list: (result, winner, game, duration in seconds) of both games, see play_scheduled_game.
+    """
+    close_known_engine = known_engine is None
+    if known_engine is None:
+        known_engine = create_engine(known_engine_name, time=TIME_LIMIT)
+    adjudication_cache = {}
+    games = []
+    try:
+        for is_llm_white in (True, False):
+            start = time.perf_counter()
+            result, winner, game = play_scheduled_game(unknown_engine, unknown_engine_name, known_engine_name, board, is_llm_white,
+                                                       known_engine, eval_engine, adjudication_cache)
+            games.append((result, winner, game, time.perf_counter() - start))
+    finally:
+        if close_known_engine:
+            known_engine.close()
+    return games
+
+
+def game_score(winner, unknown_engine_name="unknown") -> float:
+    """The unknown engine's score of a game (1 win, 0.5 draw, 0 loss)."""
+    if winner == unknown_engine_name:
+        return 1.0
+    return 0.5 if winner == "draw" else 0.0
+
+
+def record_result(results, known_engine_name, winner, unknown_engine_name="unknown"):
+    """Counts a game in the results dict ({known engine}_wins / _draws / _losses)."""
+    result_keys = {
+        "wins": f"{known_engine_name}_wins",
+        "draws": f"{known_engine_name}_draws",
+        "losses": f"{known_engine_name}_losses",
+    }
+    for result_key in result_keys.values():
+        if result_key not in results:
+            results[result_key] = 0
+
+    if winner == unknown_engine_name:
+        results[result_keys["wins"]] += 1
+    elif winner == "draw":
+        results[result_keys["draws"]] += 1
+    else:
+        results[result_keys["losses"]] += 1
+
+
+def summarize_results(results) -> dict:
+    """Turns the results dict into win rates and Elo estimates against every known engine."""
+    winrates = {}
+
+    for engine in set(k.split("_")[0] + "_" + k.split("_")[1] for k in results.keys()):
+        wins = results.get(f"{engine}_wins", 0)
+        draws = results.get(f"{engine}_draws", 0)
+        losses = results.get(f"{engine}_losses", 0)
+
+        total_games = wins + draws + losses
+        if total_games == 0:
+            winrates[engine] = 0
+        else:
+            winrates[engine] = (wins + 0.5 * draws) / total_games
+
+    # Compute estimated Elo for each opponent
+    elo_estimates = {
+        opponent: estimate_elo(winrates[opponent], opp_elo)
+        for opponent, opp_elo in KNOWN_ENGINES_CONFIGS.items()
+    }
+
+    # Compute the average estimated Elo
+    average_elo = sum(elo_estimates.values()) / len(elo_estimates)
+
+    # Print results
+    print("Winrates:", dict(winrates))
+    print("Elo Estimates:", elo_estimates)  # Dictionary format
+    print("Average Estimated Elo:", round(average_elo, 2))
+    return {"winrates": winrates, "elo_estimates": elo_estimates, "average_elo": average_elo}
+
+
+def worker(game_queue, log_lock, log_file, results, results_lock, core_id, unknown_engine_name="unknown", db_path=None, pair_scores=None):
     os.environ["CUDA_VISIBLE_DEVICES"] = str(core_id)
     print(f"Worker using GPU {core_id}")
     unknown_engine = create_engine("Stockfish_1950", time=TIME_LIMIT) # replace with LLM
     # unknown_engine = load model and model.to_cuda() # replace with LLM
-    unknown_engine_name = "unknown"
+    db = GameDatabase(db_path) if db_path is not None else None
     while True:
         try:
-            known_engine_name, board, is_llm_white = game_queue.get(timeout=1)  # Timeout to prevent deadlocks
-            
-            game_log_entry = f"Playing game with {known_engine_name}, LLM as White: {is_llm_white}\n"
-            queue_size_log_entry = f"Games in Queue: {get_size(game_queue)}\n"
+            known_engine_name, board = game_queue.get(timeout=1)  # Timeout to prevent deadlocks
+
+            game_log_entry = f"Playing pair with {known_engine_name} from {board.fen()}\n"
+            queue_size_log_entry = f"Pairs in Queue: {get_size(game_queue)}\n"
             print(game_log_entry)
             print(queue_size_log_entry)
             with log_lock:
@@ -48,92 +183,71 @@ def worker(game_queue, log_lock, log_file, results, results_lock, core_id):
                     f.write(game_log_entry)
                     f.write(queue_size_log_entry)
 
-            known_engine = create_engine(known_engine_name, time=TIME_LIMIT)
-            
-            game = _play_game(
-                (known_engine, unknown_engine),
-                (known_engine_name, unknown_engine_name),
-                white_name=unknown_engine_name if is_llm_white else known_engine_name,
-                initial_board=copy.deepcopy(board),
-            )
+            # Both colours on this worker, sharing the known engine and adjudication cache
+            games = play_pair(unknown_engine, unknown_engine_name, known_engine_name, board)
+            scores = []
+            for (result, winner, game, duration), is_llm_white in zip(games, (True, False)):
+                if db is not None:
+                    db.add_pgn_game(game, opening_fen=board.fen(), duration_seconds=duration)
 
-            known_engine.close()
+                game_result_log = f"Result: {result} | Winner: {winner} | With: {known_engine_name} | LLM as White: {is_llm_white}\n"
+                print(game_result_log)
+                with log_lock:
+                    with open(log_file, "a") as f:
+                        f.write(game_result_log)
+
+                # Update results dictionary
+                with results_lock:  # Ensure atomic update
+                    record_result(results, known_engine_name, winner, unknown_engine_name)
+                scores.append(game_score(winner, unknown_engine_name))
+            if pair_scores is not None:
+                pair_scores.append((known_engine_name, *scores))
 
-            # Store result
-            result = game.headers.get("Result", "*")
-            if result == "1-0":  # White wins
-                winner = game.headers["White"]
-            elif result == "0-1":  # Black wins
-                winner = game.headers["Black"]
-            else:
-                winner = "draw"
-
-            game_result_log = f"Result: {result} | Winner: {winner} | With: {known_engine_name} | LLM as White: {is_llm_white}\n"
-            print(game_result_log)
-            with log_lock:
-                with open(log_file, "a") as f:
-                    f.write(game_result_log)
-
-            # Update results dictionary
-            with results_lock:  # Ensure atomic update
-                result_keys = {
-                    "wins": f"{known_engine_name}_wins",
-                    "draws": f"{known_engine_name}_draws",
-                    "losses": f"{known_engine_name}_losses",
-                }
-                for result_key in result_keys.values():
-                    if result_key not in results:
-                        results[result_key] = 0
-                
-                if winner == unknown_engine_name:
-                    results[result_keys["wins"]] += 1
-                elif winner == "draw":
-                    results[result_keys["draws"]] += 1
-                else:
-                    results[result_keys["losses"]] += 1
-
-            
         except queue.Empty:
-            _EVAL_STOCKFISH_ENGINE.close()
+            close_eval_engine()
             unknown_engine.close() # for LLM
+            if db is not None:
+                db.close()
             break
     
 
-if __name__ == "__main__":
-    print("Torch version:", torch.__version__)
-    print("CUDA available:", torch.cuda.is_available())
-
-    # NUM_WORKERS = torch.cuda.device_count()
-    NUM_WORKERS = 8
-    print(f"Number of GPUs available: {NUM_WORKERS}")
+def run_tournament(num_games: int = NUM_GAMES, num_workers: int = 8, log_file: str = "game_log.txt", db_path: str | None = None, player_name: str = "unknown",
+                   openings: list | None = None) -> dict:
+    """
+    Plays the unknown engine against every known engine and estimates its Elo. Games are played
+    in colour-reversed pairs on the openings (FENs, default opening_fens) and the variance
+    reduction of pairing is reported. With `db_path`, the games are also stored in the game
+    database (known engines anchored at their Elo) and the rating ladder over all stored games
+    is refitted.
+    """
+    # num_workers = torch.cuda.device_count()
+    print(f"Number of workers: {num_workers}")
 
-    results = multiprocessing.Manager().dict()
+    manager = multiprocessing.Manager()
+    results = manager.dict()
+    pair_scores = manager.list()
     # Create game queue
     game_queue = multiprocessing.Queue()
     results_lock = multiprocessing.Lock()
     log_lock = multiprocessing.Lock()
-    log_file = "game_log.txt"
-    with open("game_log.txt", "w") as file:
+    with open(log_file, "w") as file:
         pass  # File is now empty
+    if db_path is not None:
+        with GameDatabase(db_path) as db:
+            db.add_player(player_name)
+            for stockfish_name, stockfish_elo in KNOWN_ENGINES_CONFIGS.items():
+                db.add_player(stockfish_name, stockfish_elo)
 
-    # Distribute games evenly among openings
-    games_per_opening = NUM_GAMES // len(opening_boards)
-    remaining_games = NUM_GAMES % len(opening_boards)
-
-    for i, board in enumerate(opening_boards):
-        games_to_play = games_per_opening + (1 if i < remaining_games else 0)
-        for stockfish_name, stockfish_engine in KNOWN_ENGINES_CONFIGS.items():
-            for _ in range(games_to_play // 2):
-                game_queue.put((stockfish_name, board, True))  # LLM as white
-                game_queue.put((stockfish_name, board, False))  # LLM as black)
+    for pair in schedule_pairs(num_games, openings):
+        game_queue.put(pair)
 
     print("All games added to Queue")
 
     # Create workers
     processes = []
-    for i in range(NUM_WORKERS):  # parallel workers
+    for i in range(num_workers):  # parallel workers
         core_id = i # TO CHANGE?
-        p = multiprocessing.Process(target=worker, args=(game_queue, log_lock, log_file, results, results_lock, core_id))
+        p = multiprocessing.Process(target=worker, args=(game_queue, log_lock, log_file, results, results_lock, core_id, player_name, db_path, pair_scores))
         p.start()
         processes.append(p)
 
@@ -147,33 +261,54 @@ if __name__ == "__main__":
     for p in processes:
         p.join()
     
-    _EVAL_STOCKFISH_ENGINE.close()
+    close_eval_engine()
 
     print('All games have been played!')
     print(results)
-    winrates = {}
+    summary = summarize_results(results)
+    summary["pairing"] = pairing_report(list(pair_scores))
+    print_pairing_report(summary["pairing"])
+    if db_path is not None:
+        with GameDatabase(db_path) as db:
+            summary["ratings"] = db.update_ratings()
+            print_ladder(db)
+    return summary
 
-    for engine in set(k.split("_")[0] + "_" + k.split("_")[1] for k in results.keys()):
-        wins = results.get(f"{engine}_wins", 0)
-        draws = results.get(f"{engine}_draws", 0)
-        losses = results.get(f"{engine}_losses", 0)
 
-        total_games = wins + draws + losses
-        if total_games == 0:
-            winrates[engine] = 0
-        else:
-            winrates[engine] = (wins + 0.5 * draws) / total_games
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the Elo of an engine against Stockfish levels.")
+    parser.add_argument("--num-games", type=even_num_games, default=NUM_GAMES, help="Games per Elo level (played in colour-reversed pairs, even).")
+    parser.add_argument("--num-workers", type=int, default=8)
+    parser.add_argument("--log-file", default="game_log.txt")
+    parser.add_argument("--db", default=None, help="Game database to store the games in and rate from (see ratings.py).")
+    parser.add_argument("--player-name", default="unknown", help="Name of the evaluated engine in the database.")
+    add_opening_arguments(parser)
+    args = parser.parse_args(argv)
+    return run_tournament(args.num_games, args.num_workers, args.log_file, args.db, args.player_name, openings_from_args(args))
 
-    # Compute estimated Elo for each opponent
-    elo_estimates = {
-        opponent: estimate_elo(winrates[opponent], opp_elo)
-        for opponent, opp_elo in KNOWN_ENGINES_CONFIGS.items()
-    }
 
-    # Compute the average estimated Elo
-    average_elo = sum(elo_estimates.values()) / len(elo_estimates)
+def even_num_games(text: str) -> int:
+    """argparse type of --num-games: every game has a colour-reversed twin, so the count must be even."""
+    num_games = int(text)
+    if num_games < 0 or num_games % 2:
+        raise argparse.ArgumentTypeError(f"must be a non-negative even number (games are played in colour-reversed pairs), got {text}")
+    return num_games
 
-    # Print results
-    print("Winrates:", dict(winrates))
-    print("Elo Estimates:", elo_estimates)  # Dictionary format
-    print("Average Estimated Elo:", round(average_elo, 2))
+
+def add_opening_arguments(parser):
+    parser.add_argument("--openings", default=None, help="EPD / FEN / PGN opening suite (default: the standard start).")
+    parser.add_argument("--max-openings", type=int, default=None, help="Openings drawn from the suite.")
+    parser.add_argument("--opening-plies", type=int, default=None, help="Truncate PGN openings to this many half-moves.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the opening draw.")
+
+
+def openings_from_args(args) -> list | None:
+    if args.openings is None:
+        return None
+    openings = load_openings(args.openings, args.max_openings, args.seed, args.opening_plies)
+    print(f"Loaded {len(openings)} openings from {args.openings}")
+    return openings
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Position-suite Elo proxy: plays an Engine on the positions of a challenge CSV (per-move win
+probabilities, e.g. data/chess_challenges_test_2k.csv) instead of full games.
+
+For every position the engine's move is looked up in the position's move list, giving
+
+- the win-probability loss (best move's win probability - chosen move's); an illegal move or
+  an engine error counts as the worst legal move,
+- top-1 / top-k hit rates and the distribution of the chosen move's rank.
+
+The Elo proxy interpolates the average win-probability loss between Stockfish levels measured
+on the same suite (`calibrate`, stored as JSON so checkpoints are only compared against it).
+Positions are played in worker processes, each creating its own engine, so a checkpoint is
+ranked in minutes rather than tournaments.
+
+Usage (from elo_evaluator/):
+    python suite.py calibrate --levels 1400 1800 2200 2600 --num-workers 8   # once per suite / machine
+    python suite.py run --engine Stockfish_1950 --num-workers 8
+    python suite.py run --engine mock
+"""
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+import multiprocessing.util
+from collections import Counter
+
+import chess
+import numpy as np
+
+from utils import create_engine
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_SUITE = os.path.join(REPO_ROOT, "data", "chess_challenges_test_2k.csv")
+DEFAULT_CALIBRATION = "suite_calibration.json"
+TIME_LIMIT = 0.01
+TOP_K = 3
+# Ranks above this are grouped together in the rank distribution
+MAX_REPORTED_RANK = 10
+
+
+# ====================================================
+# Suite
+# ====================================================
+def load_suite(csv_path: str = DEFAULT_SUITE, max_positions: int | None = None) -> list:
+    """
+    Loads the positions of a challenge CSV.
+
+    Returns:
+        list: (FEN, moves, win probabilities) tuples, moves sorted by decreasing win probability.
+    """
+    sys.path.insert(0, REPO_ROOT)
+    from data.loader import load_challenge_moves_csv
+
+    df = load_challenge_moves_csv(csv_path, shuffle=False)
+    if max_positions is not None:
+        df = df.head(max_positions)
+    positions = []
+    for fen, moves, win_probs in zip(df["FEN"], df["Move"], df["Win Probability"]):
+        if not moves:
+            continue
+        ranked = sorted(zip(moves, win_probs), key=lambda x: x[1], reverse=True)
+        positions.append((fen, [move for move, _ in ranked], [win_prob for _, win_prob in ranked]))
+    return positions
+
+
+def make_engine(spec: str, time_limit: float = TIME_LIMIT, seed: int = 0):
+    """
+    Creates an engine from its name: "Stockfish_<elo>", "mock" or "reasoner".
+    """
+    if spec == "mock":
+        from engine.mock import MockEngine
+        return MockEngine("mock", seed=seed)
+    if spec == "reasoner":
+        from engine.reasoner import ReasonerEngine
+        return ReasonerEngine("reasoner")
+    return create_engine(spec, time=time_limit)
+
+
+# ====================================================
+# Playing
+# ====================================================
+def play_suite(engine, positions, seed: int = 0) -> list:
+    """
+    Plays one engine on every position; returns UCI moves (None where the engine failed).
+    Randomized engines (mock) are reseeded with `seed` + the position's index before each move.
+    """
+    return [_play(engine, fen, seed + index) for index, (fen, _, _) in enumerate(positions)]
+
+
+def _play(engine, fen: str, seed: int) -> str | None:
+    engine.reseed(seed)
+    try:
+        return engine.play(chess.Board(fen)).uci()
+    except Exception:
+        return None
+
+
+_WORKER_ENGINE = None
+
+
+def _init_worker(spec: str, time_limit: float):
+    global _WORKER_ENGINE
+    _WORKER_ENGINE = make_engine(spec, time_limit)
+    # Pool workers leave through os._exit, which skips atexit hooks but runs multiprocessing
+    # finalizers, so this quits the engine process when the worker exits
+    multiprocessing.util.Finalize(None, _WORKER_ENGINE.close, exitpriority=10)
+
+
+def _play_in_worker(task) -> str | None:
+    fen, seed = task
+    return _play(_WORKER_ENGINE, fen, seed)
+
+
+def run_suite(spec: str, positions, num_workers: int = 1, time_limit: float = TIME_LIMIT, seed: int = 0) -> list:
+    """
+    Plays the engine named `spec` on every position with `num_workers` processes (one engine
+    each; 0 plays in this process). Randomized engines (mock) are seeded from `seed` and the
+    position's index, so the moves do not depend on which worker plays a position.
+    """
+    if num_workers <= 0:
+        engine = make_engine(spec, time_limit)
+        try:
+            return play_suite(engine, positions, seed)
+        finally:
+            engine.close()
+    tasks = [(fen, seed + index) for index, (fen, _, _) in enumerate(positions)]
+    with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(spec, time_limit)) as pool:
+        moves = pool.map(_play_in_worker, tasks, chunksize=max(1, len(tasks) // (num_workers * 8)))
+        # Let the workers exit (and close their engines) instead of being terminated
+        pool.close()
+        pool.join()
+    return moves
+
+
+# ====================================================
+# Scoring
+# ====================================================
+def score_moves(positions, moves, k: int = TOP_K) -> dict:
+    """
+    Scores the chosen moves against the suite.
+
+    Args:
+        positions: The suite, see load_suite.
+        moves: The chosen UCI move (or None) of every position.
+        k (int): The k of the top-k hit rate.
+
+    Returns:
+        dict: num_positions, num_illegal, avg_win_prob_loss, top1, top{k}, mean_rank_fraction
+        and rank_distribution (rank -> fraction of positions, ranks above MAX_REPORTED_RANK as
+        f">{MAX_REPORTED_RANK}", illegal moves as "illegal").
+    """
+    losses = np.empty(len(positions))
+    ranks = np.empty(len(positions), dtype=np.int64)
+    rank_fractions = np.empty(len(positions))
+    distribution = Counter()
+    for i, ((_, legal_moves, win_probs), move) in enumerate(zip(positions, moves)):
+        if move in legal_moves:
+            rank = legal_moves.index(move)
+            distribution[rank + 1 if rank < MAX_REPORTED_RANK else f">{MAX_REPORTED_RANK}"] += 1
+        else:
+            rank = len(legal_moves) - 1
+            distribution["illegal"] += 1
+        losses[i] = win_probs[0] - win_probs[rank]
+        ranks[i] = rank + 1
+        rank_fractions[i] = (rank + 1) / len(legal_moves)
+
+    n = max(len(positions), 1)
+    order = [*range(1, MAX_REPORTED_RANK + 1), f">{MAX_REPORTED_RANK}", "illegal"]
+    return {
+        "num_positions": len(positions),
+        "num_illegal": distribution["illegal"],
+        "avg_win_prob_loss": float(losses.mean()) if len(positions) else 0.0,
+        "top1": float(np.mean(ranks == 1)) if len(positions) else 0.0,
+        f"top{k}": float(np.mean(ranks <= k)) if len(positions) else 0.0,
+        "mean_rank_fraction": float(rank_fractions.mean()) if len(positions) else 0.0,
+        "rank_distribution": {str(rank): distribution[rank] / n for rank in order if distribution[rank]},
+    }
+
+
+# ====================================================
+# Elo calibration
+# ====================================================
+def calibrate(levels, positions, num_workers: int = 1, time_limit: float = TIME_LIMIT, suite: str = DEFAULT_SUITE) -> dict:
+    """Scores Stockfish at every Elo level on the suite (the reference points of the Elo proxy)."""
+    calibration = {"suite": os.path.abspath(suite), "num_positions": len(positions), "time_limit": time_limit, "levels": {}}
+    for elo in levels:
+        moves = run_suite(f"Stockfish_{elo}", positions, num_workers, time_limit)
+        calibration["levels"][str(elo)] = score_moves(positions, moves)
+        print(f"Stockfish_{elo}: avg win prob loss {calibration['levels'][str(elo)]['avg_win_prob_loss']:.4f}")
+    return calibration
+
+
+def estimate_suite_elo(avg_win_prob_loss: float, calibration: dict) -> tuple:
+    """
+    Interpolates an Elo from the average win-probability loss between the calibrated levels
+    (linear in the loss, extrapolated with the slope of the outermost levels).
+
+    Returns:
+        tuple: (Elo, whether it was extrapolated outside the calibrated range)
+    """
+    points = sorted((float(elo), metrics["avg_win_prob_loss"]) for elo, metrics in calibration["levels"].items())
+    if len(points) < 2:
+        raise ValueError("The calibration needs at least two Stockfish levels.")
+    elos = np.array([elo for elo, _ in points])
+    # Stronger levels should lose less; enforce it so the curve can be inverted
+    losses = np.minimum.accumulate(np.array([loss for _, loss in points]))
+    order = np.argsort(losses, kind="stable")
+    losses, elos = losses[order], elos[order]
+
+    if losses[0] <= avg_win_prob_loss <= losses[-1]:
+        return float(np.interp(avg_win_prob_loss, losses, elos)), False
+    # Extrapolate with the end segment
+    i, j = (0, 1) if avg_win_prob_loss < losses[0] else (-2, -1)
+    if losses[j] == losses[i]:
+        return float(elos[i] if avg_win_prob_loss < losses[0] else elos[j]), True
+    slope = (elos[j] - elos[i]) / (losses[j] - losses[i])
+    return float(elos[i] + slope * (avg_win_prob_loss - losses[i])), True
+
+
+def print_report(name: str, metrics: dict, elo: tuple | None = None):
+    print(f"\n{'='*60}\n{name} on {metrics['num_positions']} positions")
+    print(f"Average win probability loss: {metrics['avg_win_prob_loss']:.4f}")
+    for key, value in metrics.items():
+        if key.startswith("top"):
+            print(f"{key}: {value:.3f}")
+    print(f"Mean rank / legal moves: {metrics['mean_rank_fraction']:.3f} | Illegal or failed: {metrics['num_illegal']}")
+    print("Rank distribution: " + ", ".join(f"{rank}: {fraction:.3f}" for rank, fraction in metrics["rank_distribution"].items()))
+    if elo is not None:
+        print(f"Suite Elo estimate: {elo[0]:.0f}{' (extrapolated)' if elo[1] else ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Position-suite Elo proxy for engines.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="Score an engine on the suite.")
+    run.add_argument("--engine", required=True, help='"Stockfish_<elo>", "mock" or "reasoner".')
+    run.add_argument("--output", default=None, help="JSON file for the metrics.")
+    calibration = subparsers.add_parser("calibrate", help="Score Stockfish levels on the suite.")
+    calibration.add_argument("--levels", type=int, nargs="+", default=[1400, 1800, 2200, 2600])
+    for sub in (run, calibration):
+        sub.add_argument("--suite", default=DEFAULT_SUITE)
+        sub.add_argument("--max-positions", type=int, default=None)
+        sub.add_argument("--num-workers", type=int, default=os.cpu_count())
+        sub.add_argument("--time", type=float, default=TIME_LIMIT, help="Stockfish seconds per move.")
+        sub.add_argument("--calibration", default=DEFAULT_CALIBRATION)
+    args = parser.parse_args(argv)
+
+    positions = load_suite(args.suite, args.max_positions)
+    if args.command == "calibrate":
+        result = calibrate(args.levels, positions, args.num_workers, args.time, args.suite)
+        with open(args.calibration, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Calibration written to {args.calibration}")
+        return result
+
+    metrics = score_moves(positions, run_suite(args.engine, positions, args.num_workers, args.time))
+    elo = None
+    if os.path.exists(args.calibration):
+        with open(args.calibration, "r") as f:
+            reference = json.load(f)
+        if reference["num_positions"] != len(positions) or reference["suite"] != os.path.abspath(args.suite):
+            print(f"Warning: {args.calibration} was measured on a different suite, skipping the Elo estimate.")
+        else:
+            elo = estimate_suite_elo(metrics["avg_win_prob_loss"], reference)
+            metrics["elo"], metrics["elo_extrapolated"] = elo
+    print_report(args.engine, metrics, elo)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(metrics, f, indent=2)
+    return metrics
+
+
+if __name__ == "__main__":
+    main()
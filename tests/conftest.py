@@ -0,0 +1,8 @@
+import os
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# The repo root (chat, data packages) and the script directories imported by their own modules
+for path in (REPO_ROOT, os.path.join(REPO_ROOT, "elo_evaluator"), os.path.join(REPO_ROOT, "data", "data_preparation")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
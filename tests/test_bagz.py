@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from data.data_preparation.utils import bagz
+
+RECORDS = [bytes([i % 251]) * (i % 40) for i in range(3000)]
+
+
+@pytest.mark.parametrize("name", ["records.bag", "records.bagz"])
+@pytest.mark.parametrize("separate_limits", [False, True])
+def test_threaded_writer_round_trip(tmp_path, name, separate_limits):
+    path = str(tmp_path / name)
+    with bagz.BagWriter(path, separate_limits=separate_limits, num_threads=2, buffer_size=64) as writer:
+        for record in RECORDS:
+            writer.write(record)
+    reader = bagz.BagFileReader(path, separate_limits=separate_limits)
+    assert [reader[i] for i in range(len(reader))] == RECORDS
+    # The limits were streamed to the side file, which only stays when asked to
+    assert os.path.exists(tmp_path / f"limits.{name}") == separate_limits
@@ -0,0 +1,61 @@
+import os
+
+import chess
+import pandas as pd
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+from chat.decoding import _reference_greedy, sample_moves
+from chat.render import render_description
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "chess_challenges_test_2k.csv")
+NUM_POSITIONS = 8
+
+
+@pytest.fixture(scope="module")
+def positions():
+    fens = pd.read_csv(CSV_PATH)["FEN"][:NUM_POSITIONS]
+    return [(f"{render_description(fen)}\nThe best move is: \n<answer>", [move.uci() for move in chess.Board(fen).legal_moves])
+            for fen in fens]
+
+
+@pytest.fixture(scope="module")
+def tokenizer(positions):
+    # A small byte-level BPE trained on the prompts and moves, so moves span several tokens
+    # and the space before them is merged into the first one, as with GPT-style tokenizers
+    bpe = tokenizers.Tokenizer(tokenizers.models.BPE())
+    bpe.pre_tokenizer = tokenizers.pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = tokenizers.decoders.ByteLevel()
+    trainer = tokenizers.trainers.BpeTrainer(vocab_size=400, initial_alphabet=tokenizers.pre_tokenizers.ByteLevel.alphabet())
+    bpe.train_from_iterator([prompt + " " + " ".join(moves) for prompt, moves in positions], trainer=trainer)
+    return transformers.PreTrainedTokenizerFast(tokenizer_object=bpe)
+
+
+@pytest.fixture(scope="module")
+def model(tokenizer):
+    torch.manual_seed(0)
+    config = transformers.GPT2Config(vocab_size=len(tokenizer), n_positions=2048, n_embd=32, n_layer=2, n_head=2)
+    return transformers.GPT2LMHeadModel(config).eval()
+
+
+def test_samples_are_legal(model, tokenizer, positions):
+    generator = torch.Generator().manual_seed(0)
+    for prompt, legal_moves in positions:
+        samples = sample_moves(model, tokenizer, prompt, legal_moves, k=16, generator=generator)
+        assert len(samples) == 16
+        assert all(move in legal_moves for move in samples), samples
+
+
+def test_cached_greedy_matches_uncached(model, tokenizer, positions):
+    for prompt, legal_moves in positions:
+        greedy = sample_moves(model, tokenizer, prompt, legal_moves, k=3, temperature=0)
+        assert greedy == [_reference_greedy(model, tokenizer, prompt, legal_moves)] * 3
+
+
+def test_moves_span_several_tokens(tokenizer, positions):
+    # Otherwise the cached steps above would never run
+    _, legal_moves = positions[0]
+    assert max(len(tokenizer.encode(" " + move, add_special_tokens=False)) for move in legal_moves) > 1
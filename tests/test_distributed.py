@@ -0,0 +1,43 @@
+import chess
+
+from distributed import Coordinator, _Connection, start_coordinator
+
+
+def test_reconnected_worker_keeps_its_lease():
+    coordinator = Coordinator([("mock", chess.Board())] * 2)
+    server = start_coordinator(coordinator, "127.0.0.1", 0)
+    try:
+        connection = _Connection(server.server_address, "host:1")
+        lease = connection.request(op="lease")
+        pair_id, lease_id = lease["spec"]["pair_id"], lease["lease_id"]
+        # A transient disconnect: the worker reconnects under the same id and finishes the pair
+        connection.close()
+        connection = _Connection(server.server_address, "host:1")
+        assert connection.request(op="heartbeat", pair_id=pair_id, lease_id=lease_id)["ok"]
+        games = [{"result": "1-0", "winner": "unknown"}, {"result": "0-1", "winner": "unknown"}]
+        assert connection.request(op="complete", pair_id=pair_id, lease_id=lease_id, games=games)["ok"]
+        # The other pair is next; the finished one was neither re-queued nor counted as a retry
+        assert connection.request(op="lease")["spec"]["pair_id"] != pair_id
+        assert coordinator._attempts[pair_id] == 1
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_expired_lease_is_requeued():
+    coordinator = Coordinator([("mock", chess.Board())], lease_seconds=0.0)
+    first = coordinator.lease("host:1")
+    second = coordinator.lease("host:2")
+    assert second["spec"]["pair_id"] == first["spec"]["pair_id"]
+    assert coordinator._attempts[first["spec"]["pair_id"]] == 2
+
+
+def test_mock_runs_do_not_depend_on_the_workers(tmp_path):
+    from distributed import run_coordinator
+
+    def run(num_workers):
+        summary = run_coordinator(2, "127.0.0.1", 0, num_local_workers=num_workers, engine="mock", log_file=str(tmp_path / "log.txt"))
+        return summary["pairing"]
+
+    assert run(1) == run(3)
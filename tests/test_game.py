@@ -0,0 +1,22 @@
+import time
+
+import chess
+
+from engine.mock import MockEngine
+from game import _play_game
+
+THINK_TIME = 1.0
+# White is up a queen and a rook, so the first adjudication ends the game
+DECIDED_FEN = "rnb1kbn1/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQq - 0 1"
+
+
+def test_adjudication_stops_a_search_that_has_not_started():
+    white, black = MockEngine("white", seed=1), MockEngine("black", seed=2, think_time=THINK_TIME)
+    start = time.perf_counter()
+    game = _play_game((white, black), ("white", "black"), "white", chess.Board(DECIDED_FEN), MockEngine("eval"))
+    assert time.perf_counter() - start < THINK_TIME / 2
+    assert game.headers["Result"] == "1-0"
+    # The stop does not carry over to the next search
+    start = time.perf_counter()
+    black.play(chess.Board())
+    assert time.perf_counter() - start >= THINK_TIME
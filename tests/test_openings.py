@@ -0,0 +1,16 @@
+from openings import pairing_report, print_pairing_report
+
+
+def test_report_without_pair_variance(capsys):
+    # Every pair scores its opponent's mean, while the single games vary
+    report = pairing_report([("A", 1, 0), ("A", 1, 0), ("B", 0, 0), ("B", 0, 0)])
+    assert report["all"]["variance_ratio"] == 0
+    print_pairing_report(report)
+    assert "No variance between pairs in 8 games." in capsys.readouterr().out
+
+
+def test_report_variance_ratio(capsys):
+    report = pairing_report([("A", 1, 0), ("A", 1, 1), ("A", 0, 0), ("B", 1, 0.5), ("B", 0.5, 0)])
+    assert 0 < report["all"]["variance_ratio"]
+    print_pairing_report(report)
+    assert "independent games with 10 games." in capsys.readouterr().out
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from data.pgn_harvest import harvest
+
+PGN = """[Event "Good 1"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Event "Malformed"]
+[Result "0-1"]
+
+1. e4 e5 2. Ke3 Nc6 0-1
+
+[Event "Good 2"]
+[Result "1/2-1/2"]
+
+1. d4 d5 2. c4 e6 1/2-1/2
+"""
+
+
+def test_malformed_game_is_dropped(tmp_path):
+    path = tmp_path / "games.pgn"
+    path.write_text(PGN)
+    output = tmp_path / "positions.parquet"
+    totals = harvest([str(path)], str(output), num_workers=1)
+    assert totals["games"] == 3
+    assert totals["bad_games"] == 1
+    df = pd.read_parquet(output)
+    # Every ply of the two good games, none of the malformed one (their start position once)
+    assert totals["positions"] == 8
+    assert totals["written"] == len(df) == 7
+    assert set(df["Result"]) == {0.0, 0.5, 1.0}
+    assert set(df["Move"]) == {"e2e4", "e7e5", "g1f3", "b8c6", "d7d5", "c2c4", "e7e6"}
+
+
+def test_positions_are_deduplicated_across_inputs(tmp_path):
+    first, second = tmp_path / "a.pgn", tmp_path / "b.pgn"
+    first.write_text(PGN)
+    second.write_text(PGN)
+    output = tmp_path / "positions.parquet"
+    totals = harvest([str(first), str(second)], str(output), num_workers=1, dedup_capacity=100)
+    assert totals["positions"] == 16
+    assert totals["duplicates"] == 9
+    assert len(pd.read_parquet(output)) == 7
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data import position_index
+from data.position_index import PositionIndex, hash_fens, position_hash
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "chess_challenges_test_2k.csv")
+
+
+@pytest.fixture(scope="module")
+def fens():
+    return pd.read_csv(CSV_PATH)["FEN"][:300]
+
+
+@pytest.mark.parametrize("key", ["fen", "zobrist"])
+def test_hash_fens_matches_position_hash(fens, key):
+    expected = np.array([position_hash(fen, key) for fen in fens], dtype=np.uint64)
+    for values in (fens, fens.tolist(), iter(fens.tolist())):
+        assert np.array_equal(hash_fens(values, key), expected)
+    # Move clocks and repeated rows
+    moved = [fen.rsplit(" ", 2)[0] + " 3 40" for fen in fens]
+    assert np.array_equal(hash_fens(moved + moved, key), np.concatenate([expected, expected]))
+    assert len(hash_fens([], key)) == 0
+
+
+def test_hash_fens_in_a_pool(fens, monkeypatch):
+    monkeypatch.setattr(position_index, "HASH_CHUNK_SIZE", 64)
+    assert np.array_equal(hash_fens(fens, num_workers=2), hash_fens(fens))
+
+
+def test_main_takes_argv(tmp_path, fens, capsys):
+    output = tmp_path / "index" / "test"
+    position_index.main(["build", "--output", str(output), "--csv", CSV_PATH, "--num-workers", "1"])
+    index = PositionIndex.load(str(output) + ".npy")
+    assert index.contains(hash_fens(fens)).all()
+    position_index.main(["check", "--index", str(output) + ".npy", "--csv", CSV_PATH])
+    assert "2000/2000 rows in the index" in capsys.readouterr().out
@@ -0,0 +1,47 @@
+import warnings
+
+import pytest
+
+from ratings import fit_ratings
+
+ANCHORS = {f"Stockfish_{elo}": elo for elo in range(1400, 2801, 200)}
+
+
+def _fit(pairs, anchors=ANCHORS, **kwargs):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        return {name: elo for name, (elo, _) in fit_ratings(pairs, anchors, **kwargs).items()}
+
+
+def test_lopsided_score_against_the_strongest_anchor():
+    elo = _fit([("x", "Stockfish_2800", 30, 40)])["x"]
+    # 75% is +191 Elo
+    assert elo == pytest.approx(2991, abs=10)
+
+
+@pytest.mark.parametrize("opponent, score, below", [("Stockfish_1400", 0, True), ("Stockfish_2800", 4, False)])
+def test_perfect_scores_stay_finite_and_ordered(opponent, score, below):
+    elo = _fit([("x", opponent, score, 4)])["x"]
+    assert 0 < elo < 5000
+    assert (elo < ANCHORS[opponent]) if below else (elo > ANCHORS[opponent])
+
+
+def test_perfect_scores_against_two_anchors_converge():
+    ratings = _fit([("x", "A", 100, 100), ("x", "B", 100, 100)], {"A": 1400, "B": 2800})
+    assert 2800 < ratings["x"] < 5000
+
+
+def test_unrated_players_are_ordered():
+    ratings = _fit([
+        ("weak", "Stockfish_1400", 0, 4),
+        ("middle", "Stockfish_1400", 1, 4),
+        ("middle", "weak", 3, 4),
+        ("strong", "Stockfish_2800", 4, 4),
+        ("strong", "middle", 4, 4),
+    ])
+    assert ratings["weak"] < ratings["middle"] < 1400 < 2800 < ratings["strong"]
+
+
+def test_warns_when_not_converged():
+    with pytest.warns(RuntimeWarning, match="did not converge"):
+        fit_ratings([("x", "Stockfish_2800", 30, 40)], ANCHORS, max_iters=1)
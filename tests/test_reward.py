@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pytest
+
+from chat import reward
+from data.loader import load_challenge_moves_csv
+from data.rewards import REWARD_MODES, segment_normalize
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "chess_challenges_test_2k.csv")
+
+
+@pytest.fixture(scope="module")
+def positions():
+    df = load_challenge_moves_csv(CSV_PATH, shuffle=False).head(300)
+    return list(zip(df["Move"], df["Win Probability"]))
+
+
+def _normalized(positions, mode):
+    offsets = np.cumsum([0] + [len(moves) for moves, _ in positions])
+    values = segment_normalize(np.concatenate([probs for _, probs in positions]), offsets, mode)
+    return [
+        {"moves": list(moves), "rewards": values[offsets[i]:offsets[i + 1]]}
+        for i, (moves, _) in enumerate(positions)
+    ]
+
+
+@pytest.mark.parametrize("mode", REWARD_MODES)
+def test_legal_moves_outscore_penalties(positions, mode):
+    for ground_truth in _normalized(positions, mode):
+        rewards = reward.parse_ground_truth(ground_truth)
+        illegal = reward.score_response("<answer>a1a1</answer>", rewards)
+        malformed = reward.score_response("no answer", rewards)
+        assert malformed < illegal
+        for move in ground_truth["moves"]:
+            score = reward.score_response(f"<answer>{move}</answer>", rewards)
+            assert score > illegal and score > malformed
+
+
+def test_penalties_unchanged_for_nonnegative_rewards():
+    rewards = reward.parse_ground_truth({"moves": ["e2e4", "d2d4"], "rewards": [0.0, 1.0]})
+    assert reward.score_response("<answer>a1a1</answer>", rewards) == reward.ILLEGAL_MOVE_REWARD
+    assert reward.score_response("<answer></answer>", rewards) == reward.FORMAT_ERROR_REWARD
+    assert reward.score_response("<answer>a1a1</answer>", {"e2e4": 0.3}) == reward.ILLEGAL_MOVE_REWARD
+
+
+@pytest.fixture(scope="module")
+def struct_rows(tmp_path_factory):
+    from data.verl_builder import build_datasets, output_filename
+    import pandas as pd
+
+    output_dir = tmp_path_factory.mktemp("verl")
+    variant = "DESC_board_normal_reward_PGN_moves"
+    build_datasets(CSV_PATH, str(output_dir), [variant], train_samples=10, test_samples=60, num_workers=1)
+    df = pd.read_parquet(output_dir / output_filename(variant, "test", 60))
+    return [row["ground_truth"] for row in df["reward_model"]]
+
+
+def test_pooled_scoring_of_parquet_structs(struct_rows):
+    assert isinstance(struct_rows[0]["moves"], np.ndarray)
+    responses, ground_truths, expected = [], [], []
+    for ground_truth in struct_rows:
+        rewards = dict(zip(ground_truth["moves"], ground_truth["rewards"]))
+        for move in list(ground_truth["moves"])[:2]:
+            responses.append(f"<answer>{move}</answer>")
+            ground_truths.append(ground_truth)
+            expected.append(rewards[move])
+        # An equal ground truth that is not the same object
+        responses.append("<answer>a1a1</answer>")
+        ground_truths.append({key: value.copy() for key, value in ground_truth.items()})
+        expected.append(reward.ILLEGAL_MOVE_REWARD)
+    with reward.RewardScorer(num_workers=2, chunk_size=50) as scorer:
+        pooled = scorer.score(responses, ground_truths)
+    np.testing.assert_allclose(pooled, reward.score_batch(responses, ground_truths))
+    np.testing.assert_allclose(pooled, expected)
+
+
+@pytest.mark.parametrize("move", ["O-O", "O-O-O+", "e8=Q", "exd8=N#", "Nf3"])
+def test_pgn_notation_answers(move):
+    rewards = reward.parse_ground_truth({"moves": ["O-O", "O-O-O+", "e8=Q", "exd8=N#", "Nf3"], "rewards": [0.1, 0.59, 0.7, 1.0, 0.0]})
+    assert reward.score_response(f"<answer>{move}</answer>", rewards) == rewards[move]
+    assert reward.score_response(f"<answer>{move}!?</answer>", rewards) == reward.FORMAT_ERROR_REWARD
@@ -0,0 +1,11 @@
+import pytest
+
+from run_games import main, schedule_pairs
+
+
+def test_odd_num_games_is_rejected():
+    assert len(schedule_pairs(4)) == 2 * len(schedule_pairs(2))
+    with pytest.raises(ValueError):
+        schedule_pairs(3)
+    with pytest.raises(SystemExit):
+        main(["--num-games", "3"])
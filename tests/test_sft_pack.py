@@ -0,0 +1,154 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.sft_pack import IGNORE_INDEX, PackedSFTDataset, block_diagonal_mask
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "chess_challenges_test_2k.csv")
+# Token counts and prompt lengths of the examples of the test cache; they pack into one row
+LENGTHS = [7, 5, 4]
+PROMPT_LENGTHS = [4, 3, 2]
+MAX_LENGTH = 20
+VOCAB_SIZE = 64
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    rng = np.random.default_rng(0)
+    tokens = rng.integers(1, VOCAB_SIZE, sum(LENGTHS)).astype(np.uint32)
+    tokens.tofile(tmp_path / "tokens.bin")
+    np.save(tmp_path / "offsets.npy", np.concatenate([[0], np.cumsum(LENGTHS)]).astype(np.int64))
+    np.save(tmp_path / "prompt_lengths.npy", np.asarray(PROMPT_LENGTHS, dtype=np.int32))
+    with open(tmp_path / "meta.json", "w") as f:
+        json.dump({"num_examples": len(LENGTHS), "num_tokens": int(sum(LENGTHS))}, f)
+    return str(tmp_path)
+
+
+def _spans(dataset):
+    """(example, start, end) of every example in the packed row, in packing order."""
+    spans, cursor = [], 0
+    for example in dataset.packs[0]:
+        spans.append((example, cursor, cursor + LENGTHS[example]))
+        cursor += LENGTHS[example]
+    return spans
+
+
+def test_items_have_no_padding_mask(cache_dir):
+    dataset = PackedSFTDataset(cache_dir, MAX_LENGTH, seed=None)
+    assert len(dataset) == 1
+    item = dataset[0]
+    assert set(item) == {"input_ids", "labels", "position_ids"}
+    for example, start, end in _spans(dataset):
+        np.testing.assert_array_equal(item["position_ids"][start:end], np.arange(end - start))
+        assert (item["labels"][start:start + PROMPT_LENGTHS[example]] == IGNORE_INDEX).all()
+        np.testing.assert_array_equal(item["labels"][start + PROMPT_LENGTHS[example]:end],
+                                      item["input_ids"][start + PROMPT_LENGTHS[example]:end])
+
+
+def test_block_mask_separates_examples(cache_dir):
+    dataset = PackedSFTDataset(cache_dir, MAX_LENGTH, seed=None, block_mask=True)
+    item = dataset[0]
+    allowed = item["attention_mask"][0] == 0
+    np.testing.assert_array_equal(item["attention_mask"], block_diagonal_mask(item["position_ids"]))
+    for _, start, end in _spans(dataset):
+        np.testing.assert_array_equal(allowed[start:end, start:end], np.tri(end - start, dtype=bool))
+        assert not allowed[start:end, :start].any()
+        assert not allowed[start:end, end:].any()
+
+
+def test_packed_logits_match_unpacked(cache_dir):
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=VOCAB_SIZE, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=4, max_position_embeddings=MAX_LENGTH,
+    )
+    dataset = PackedSFTDataset(cache_dir, MAX_LENGTH, seed=None, block_mask=True)
+    item = dataset[0]
+    for attn_implementation in ("eager", "sdpa"):
+        config._attn_implementation = attn_implementation
+        model = transformers.LlamaForCausalLM(config).eval()
+        with torch.no_grad():
+            packed = model(
+                input_ids=torch.as_tensor(item["input_ids"])[None],
+                position_ids=torch.as_tensor(item["position_ids"])[None],
+                attention_mask=torch.as_tensor(item["attention_mask"])[None],
+            ).logits[0]
+            for _, start, end in _spans(dataset):
+                alone = model(input_ids=torch.as_tensor(item["input_ids"][start:end])[None]).logits[0]
+                torch.testing.assert_close(packed[start:end], alone, rtol=1e-4, atol=1e-5)
+
+
+@pytest.fixture(scope="module")
+def tokenized(tmp_path_factory):
+    transformers = pytest.importorskip("transformers")
+    tokenizers = pytest.importorskip("tokenizers")
+    from data.sft_pack import build_examples, tokenize_to_cache
+
+    tmp_path = tmp_path_factory.mktemp("sft")
+    source = tmp_path / "challenges.csv"
+    pd.read_csv(CSV_PATH).head(40).to_csv(source, index=False)
+    prompts, completions = build_examples(pd.read_csv(source))
+
+    # A small byte-level BPE trained on the examples themselves
+    bpe = tokenizers.Tokenizer(tokenizers.models.BPE())
+    bpe.pre_tokenizer = tokenizers.pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = tokenizers.decoders.ByteLevel()
+    trainer = tokenizers.trainers.BpeTrainer(
+        vocab_size=400, special_tokens=["<eos>"], initial_alphabet=tokenizers.pre_tokenizers.ByteLevel.alphabet()
+    )
+    bpe.train_from_iterator([p + c for p, c in zip(prompts, completions)], trainer=trainer)
+    tokenizer = transformers.PreTrainedTokenizerFast(tokenizer_object=bpe, eos_token="<eos>")
+
+    cache_dir = str(tmp_path / "cache")
+    meta = tokenize_to_cache(str(source), tokenizer, cache_dir, chunk_size=16)
+    return tokenizer, str(source), cache_dir, meta, prompts, completions
+
+
+def test_tokenized_labels_are_the_answers(tokenized):
+    tokenizer, _, cache_dir, meta, prompts, completions = tokenized
+    assert meta["num_examples"] == len(prompts) == 40
+    longest = int(np.diff(np.load(os.path.join(cache_dir, "offsets.npy"))).max())
+    dataset = PackedSFTDataset(cache_dir, 3 * longest, seed=None)
+    assert len(dataset) < len(prompts)  # examples were packed together
+
+    found = 0
+    for index, pack in enumerate(dataset.packs):
+        item = dataset[index]
+        starts = np.flatnonzero(item["position_ids"] == 0)
+        for example, start in zip(pack, starts):
+            prompt_ids = tokenizer(prompts[example], add_special_tokens=False)["input_ids"]
+            completion_ids = tokenizer(completions[example], add_special_tokens=False)["input_ids"] + [tokenizer.eos_token_id]
+            end = start + len(prompt_ids) + len(completion_ids)
+            assert item["input_ids"][start:end].tolist() == prompt_ids + completion_ids
+            assert (item["labels"][start:start + len(prompt_ids)] == IGNORE_INDEX).all()
+            answer = item["labels"][start + len(prompt_ids):end]
+            assert answer.tolist() == completion_ids
+            assert tokenizer.decode(answer[:-1]) == completions[example]
+            found += 1
+        # Everything after the last example is padding
+        assert (item["labels"][end:] == IGNORE_INDEX).all()
+    assert found == len(prompts)
+
+
+def test_cache_round_trip(tokenized):
+    from data.sft_pack import load_cache, tokenize_to_cache
+
+    tokenizer, source, cache_dir, meta, _, _ = tokenized
+    tokens, offsets, prompt_lengths = load_cache(cache_dir)
+    tokens, offsets, prompt_lengths = np.array(tokens), offsets.copy(), prompt_lengths.copy()
+    mtime = os.path.getmtime(os.path.join(cache_dir, "tokens.bin"))
+    # A matching cache is reused, a forced rebuild (other batch size) gives the same tokens
+    assert tokenize_to_cache(source, tokenizer, cache_dir) == meta
+    assert os.path.getmtime(os.path.join(cache_dir, "tokens.bin")) == mtime
+    assert tokenize_to_cache(source, tokenizer, cache_dir, chunk_size=7, force=True) == meta
+    rebuilt = load_cache(cache_dir)
+    assert np.array_equal(rebuilt[0], tokens)
+    assert np.array_equal(rebuilt[1], offsets)
+    assert np.array_equal(rebuilt[2], prompt_lengths)
+    assert len(tokens) == meta["num_tokens"] == offsets[-1]
@@ -0,0 +1,37 @@
+import multiprocessing
+import os
+
+import pytest
+
+from suite import load_suite, run_suite
+
+NUM_POSITIONS = 40
+
+
+@pytest.fixture(scope="module")
+def positions():
+    return load_suite(max_positions=NUM_POSITIONS)
+
+
+def test_mock_runs_are_reproducible(positions):
+    moves = run_suite("mock", positions, num_workers=2, seed=3)
+    assert moves == run_suite("mock", positions, num_workers=2, seed=3)
+    # Whichever process plays a position
+    assert moves == run_suite("mock", positions, num_workers=0, seed=3) == run_suite("mock", positions, num_workers=3, seed=3)
+    assert moves != run_suite("mock", positions, num_workers=2, seed=4)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="workers must inherit the patched factory")
+def test_worker_engines_are_closed(monkeypatch, tmp_path, positions):
+    import suite
+
+    make_engine = suite.make_engine
+
+    def make_logged_engine(spec, time_limit):
+        engine = make_engine(spec, time_limit)
+        engine.close = lambda: (tmp_path / f"closed_{os.getpid()}").touch()
+        return engine
+
+    monkeypatch.setattr(suite, "make_engine", make_logged_engine)
+    run_suite("mock", positions, num_workers=2)
+    assert len(list(tmp_path.iterdir())) == 2
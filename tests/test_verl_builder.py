@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+import pytest
+
+from data.position_index import hash_fens
+from data.verl_builder import build_datasets, output_filename
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "chess_challenges_test_2k.csv")
+VARIANT = "FEN_board_normal_reward"
+
+
+def _build(source, output_dir, train_samples, test_samples=50, seed=42):
+    build_datasets(source, str(output_dir), [VARIANT], train_samples=train_samples, test_samples=test_samples,
+                   seed=seed, num_workers=1, chunk_size=128)
+    splits = {}
+    for split, num_rows in (("test", test_samples), ("train", train_samples)):
+        df = pd.read_parquet(output_dir / output_filename(VARIANT, split, num_rows))
+        fens = [prompt[0]["content"].split("<FEN> ")[-1].split(" </FEN>")[0] for prompt in df["prompt"]]
+        splits[split] = set(hash_fens(fens).tolist())
+        assert list(df["extra_info"].map(lambda info: info["index"])) == list(range(len(df)))
+    return splits
+
+
+@pytest.fixture(scope="module")
+def sorted_source(tmp_path_factory):
+    # The full challenge CSV is written sorted by FEN
+    path = tmp_path_factory.mktemp("source") / "sorted.csv"
+    pd.read_csv(CSV_PATH).sort_values("FEN").to_csv(path, index=False)
+    return str(path)
+
+
+def test_splits_do_not_depend_on_source_order(tmp_path, sorted_source):
+    shuffled = _build(CSV_PATH, tmp_path / "shuffled", train_samples=200)
+    ordered = _build(sorted_source, tmp_path / "sorted", train_samples=200)
+    assert shuffled == ordered
+    assert len(ordered["test"]) == 50 and len(ordered["train"]) == 200
+    assert not ordered["test"] & ordered["train"]
+    # Not the first rows of the sorted source
+    first_rows = set(hash_fens(pd.read_csv(sorted_source)["FEN"][:250]).tolist())
+    assert len(first_rows & (ordered["test"] | ordered["train"])) < 100
+
+
+def test_seed_changes_the_draw(tmp_path, sorted_source):
+    assert _build(sorted_source, tmp_path / "a", 200, seed=1)["test"] != _build(sorted_source, tmp_path / "b", 200, seed=2)["test"]
+
+
+def test_all_remaining_rows_as_train(tmp_path, sorted_source):
+    splits = _build(sorted_source, tmp_path / "all", train_samples=None)
+    num_positions = len(set(hash_fens(pd.read_csv(sorted_source)["FEN"]).tolist()))
+    assert not splits["test"] & splits["train"]
+    # Up to Bloom filter false positives
+    assert num_positions - 5 <= len(splits["test"]) + len(splits["train"]) <= num_positions